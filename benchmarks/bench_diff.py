@@ -0,0 +1,103 @@
+"""
+Myers linear-space diff (diff_engine) vs. the full-table LCS diff that
+cache_handler.cpp used, on documents of growing size with a few edits.
+
+The LCS table is only run while it fits in memory; for larger inputs the
+table size it would need is printed instead.
+Usage: python benchmarks/bench_diff.py [--max-kb 200] [--lcs-max-chars 4000]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from diff_engine import changed_ranges
+
+
+def lcs_diff(a, b):
+    """Straight port of cache_handler.cpp's computeDiff."""
+    n, m = len(a), len(b)
+    dp = [[0] * (m + 1) for _ in range(n + 1)]
+    for i in range(1, n + 1):
+        row, prev = dp[i], dp[i - 1]
+        for j in range(1, m + 1):
+            if a[i - 1] == b[j - 1]:
+                row[j] = prev[j - 1] + 1
+            else:
+                row[j] = max(prev[j], row[j - 1])
+    edits = []
+    i, j = n, m
+    while i > 0 or j > 0:
+        if i > 0 and j > 0 and a[i - 1] == b[j - 1]:
+            edits.append(("KEEP", a[i - 1], i - 1))
+            i -= 1
+            j -= 1
+        elif j > 0 and (i == 0 or dp[i][j - 1] >= dp[i - 1][j]):
+            edits.append(("INSERT", b[j - 1], i))
+            j -= 1
+        else:
+            edits.append(("DELETE", a[i - 1], i - 1))
+            i -= 1
+    edits.reverse()
+    return edits
+
+
+def make_document(size, rng):
+    lines = []
+    total = 0
+    while total < size:
+        kind = rng.random()
+        if kind < 0.1:
+            line = f"# Section {len(lines)}\n"
+        elif kind < 0.3:
+            line = f"* item {rng.randint(0, 10 ** 6)}\n"
+        elif kind < 0.4:
+            line = f"! x^{rng.randint(0, 99)} + y_{rng.randint(0, 99)} !\n"
+        else:
+            line = " ".join(f"word{rng.randint(0, 5000)}" for _ in range(rng.randint(4, 14))) + "\n"
+        lines.append(line)
+        total += len(line)
+    return "".join(lines)
+
+
+def edit_document(text, edits, rng):
+    for _ in range(edits):
+        pos = rng.randrange(len(text))
+        text = text[:pos] + "edited " + text[pos + rng.randint(0, 20):]
+    return text
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return time.perf_counter() - start, result
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument("--max-kb", type=int, default=200)
+    arg_parser.add_argument("--lcs-max-chars", type=int, default=4000)
+    args = arg_parser.parse_args()
+
+    rng = random.Random(0)
+    sizes = [1000, 3000, 10_000, 50_000]
+    sizes += [kb * 1000 for kb in (100, args.max_kb) if kb * 1000 > sizes[-1]]
+    print(f"{'chars':>10}{'myers (s)':>12}{'changes':>9}{'lcs (s)':>12}{'lcs table':>14}")
+    for size in sizes:
+        old = make_document(size, rng)
+        new = edit_document(old, 5, rng)
+        myers_time, changes = timed(changed_ranges, old, new)
+        table_bytes = (len(old) + 1) * (len(new) + 1) * 4
+        if len(old) <= args.lcs_max_chars:
+            lcs_time, _ = timed(lcs_diff, old, new)
+            lcs_col = f"{lcs_time:>12.4f}"
+        else:
+            lcs_col = f"{'skipped':>12}"
+        print(f"{len(old):>10}{myers_time:>12.4f}{len(changes):>9}{lcs_col}{table_bytes / 1e9:>12.2f}GB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Compile time of every installed engine on examples/ and generated documents.
+
+Runs each engine RUNS times per document in a fresh directory and prints
+the median. Successful runs also feed the timings that
+engines.choose_engine uses for "auto", so running this on your own
+documents tunes the automatic choice. Usage:
+
+    python benchmarks/bench_engines.py [-n RUNS] [--sizes 50,500] [FILES...]
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, ROOT_DIR)
+
+from compiler import Parser, Compiler
+from engines import ENGINES
+from generate import generate
+
+
+def documents(paths, sizes):
+    if not paths:
+        examples_dir = os.path.join(ROOT_DIR, "examples")
+        paths = [os.path.join(examples_dir, name) for name in sorted(os.listdir(examples_dir))]
+    for path in paths:
+        with open(path, "r", encoding="utf-8") as f:
+            yield os.path.basename(path), f.read()
+    for size in sizes:
+        yield f"mixed-{size}", generate("mixed", size)
+
+
+def time_engine(engine, latex, runs):
+    times = []
+    for _ in range(runs):
+        with tempfile.TemporaryDirectory(prefix="bench-engine-") as workdir:
+            with open(os.path.join(workdir, "main.tex"), "w", encoding="utf-8") as f:
+                f.write(latex)
+            result = engine.run(workdir, "main.tex", Compiler.PREAMBLE)
+            if not result.ok:
+                return None
+            times.append(result.elapsed)
+    return statistics.median(times)
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("files", nargs="*")
+    arg_parser.add_argument("-n", "--runs", type=int, default=3)
+    arg_parser.add_argument("--sizes", default="50,500")
+    args = arg_parser.parse_args()
+
+    engines = [engine for engine in ENGINES.values() if engine.available()]
+    if not engines:
+        print("no TeX engine found", file=sys.stderr)
+        return 1
+    parser = Parser()
+    sizes = [int(size) for size in args.sizes.split(",") if size]
+
+    print(f"{'document':<20}" + "".join(f"{engine.name + ' (s)':>16}" for engine in engines))
+    for name, text in documents(args.files, sizes):
+        latex = Compiler().compile(parser.parse(text))
+        cells = []
+        for engine in engines:
+            elapsed = time_engine(engine, latex, args.runs)
+            cells.append(f"{'failed':>16}" if elapsed is None else f"{elapsed:>16.3f}")
+        print(f"{name:<20}" + "".join(cells))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,73 @@
+"""
+GUI startup time.
+
+Launches gui.py RUNS times with LATEX_APP_STARTUP_PROBE set, so each run
+prints its startup profile once the web view and the Lark parser are
+ready, and exits. Prints the first (coldest) run and the median of all runs
+per stage, plus the wall time from spawning the process. Usage:
+
+    python benchmarks/bench_startup.py [-n RUNS] [--json PATH]
+
+Without a display, Qt's offscreen platform is used.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+
+PROBE_ENV = "LATEX_APP_STARTUP_PROBE"   # gui.STARTUP_PROBE_ENV; gui is not imported here
+STAGES = ("imports", "window", "first_paint", "preview", "sweep", "parser")
+
+
+def launch():
+    env = dict(os.environ)
+    env[PROBE_ENV] = "1"
+    if not env.get("DISPLAY") and not env.get("WAYLAND_DISPLAY"):
+        env.setdefault("QT_QPA_PLATFORM", "offscreen")
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, "gui.py"], cwd=ROOT_DIR, env=env, capture_output=True, text=True,
+                            timeout=120)
+    wall = time.perf_counter() - start
+    for line in reversed(result.stdout.splitlines()):
+        if line.startswith("{"):
+            report = json.loads(line)
+            break
+    else:
+        raise RuntimeError(f"gui.py printed no startup report (exit {result.returncode})\n{result.stderr}")
+    row = {"process": wall, "ready": report["ready"]}
+    for stage in report["profile"]["stages"]:
+        row[stage["name"]] = stage["elapsed"]
+    return row
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("-n", "--runs", type=int, default=5)
+    arg_parser.add_argument("--json", help="also write every run's timings to this file")
+    args = arg_parser.parse_args()
+
+    try:
+        rows = [launch() for _ in range(args.runs)]
+    except (RuntimeError, subprocess.TimeoutExpired) as e:
+        print(e, file=sys.stderr)
+        return 1
+
+    print(f"{'stage':<14}{'first (ms)':>12}{'median (ms)':>13}")
+    for name in STAGES + ("ready", "process"):
+        values = [row[name] for row in rows if name in row]
+        if values:
+            print(f"{name:<14}{values[0] * 1000:>12.1f}{statistics.median(values) * 1000:>13.1f}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(rows, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,58 @@
+"""
+Cold vs. warm pdflatex compile time on examples/.
+
+Cold runs load the full preamble every time; warm runs use the precompiled
+preamble format from tex_worker. Usage: python benchmarks/bench_warm_compile.py [-n RUNS]
+"""
+import argparse
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from compiler import Parser, Compiler, APP_DIR
+from tex_worker import PDFLATEX, compile_tex, ensure_format
+
+
+def time_compiles(latex, preamble, runs):
+    times = []
+    for _ in range(runs):
+        with tempfile.TemporaryDirectory() as workdir:
+            with open(os.path.join(workdir, "main.tex"), "w", encoding="utf-8") as f:
+                f.write(latex)
+            result = compile_tex(workdir, "main.tex", preamble)
+            if not result.ok:
+                raise RuntimeError(result.output)
+            times.append(result.elapsed)
+    return statistics.median(times)
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument("-n", "--runs", type=int, default=5)
+    args = arg_parser.parse_args()
+
+    if shutil.which(PDFLATEX) is None:
+        print(f"{PDFLATEX} not found, skipping")
+        return 0
+    if ensure_format(Compiler.PREAMBLE) is None:
+        print("could not build the preamble format (is mylatexformat installed?)")
+        return 1
+
+    parser = Parser()
+    examples_dir = os.path.join(APP_DIR, "examples")
+    print(f"{'example':<20}{'cold (s)':>10}{'warm (s)':>10}{'speedup':>10}")
+    for name in sorted(os.listdir(examples_dir)):
+        with open(os.path.join(examples_dir, name), "r", encoding="utf-8") as f:
+            latex = Compiler().compile(parser.parse(f.read()))
+        cold = time_compiles(latex, None, args.runs)
+        warm = time_compiles(latex, Compiler.PREAMBLE, args.runs)
+        print(f"{name:<20}{cold:>10.3f}{warm:>10.3f}{cold / warm:>9.1f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,150 @@
+"""
+Conformance check for fastpath against the Lark parser + Compiler.
+
+    python benchmarks/check_fastpath.py [-n DOCS] [--seed N]
+
+Compiles examples/, the synthetic documents from generate.py and DOCS
+random documents (markers mid-line, stray characters, blank runs, ...)
+both ways. Whenever the fast path accepts a document its LaTeX must equal
+Compiler's byte for byte, its line map must match Compiler's, and Lark must
+accept it too. The incremental and streaming compilers, which fall back per
+block, must match as well.
+Also prints how often the fast path is taken and the speedup.
+"""
+import argparse
+import io
+import os
+import random
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, ROOT_DIR)
+
+from compiler import Parser, Compiler
+from fastpath import parse_blocks, compile_to
+from generate import SHAPES, generate
+from incremental import IncrementalCompiler
+from streaming import compile_stream
+
+# pieces random documents are built from; some of them are invalid on purpose
+PIECES = (
+    "# ", "## ", "### ", "#### ", "#", "* ", "*", "! ", " !", "!", "\n", "\n\n", "\n\n\n",
+    "alpha", "beta ", "x^2 + y_1", "a.b.", "(1, 2)", "\\frac{a}{b}", "[k]", " ", ".", "?",
+    "tab\there", "café", ":", "'",
+)
+LINE_HEADS = ("", "", "", "# ", "## ", "### ", "* ", "* ", "#", "*")
+WORDS = ("alpha", "beta", "x^2", "a.b.", "(1, 2)", "\\frac{a}{b}", "k_1", "?")
+
+
+def random_document(rng):
+    if rng.random() < 0.5:
+        return "".join(rng.choice(PIECES) for _ in range(rng.randint(0, 40)))
+    # mostly well-formed lines, as people write them
+    lines = []
+    for _ in range(rng.randint(1, 15)):
+        body = " ".join(rng.choice(WORDS) for _ in range(rng.randint(1, 4)))
+        if rng.random() < 0.15:
+            lines.append(f"! {body}\n{body} !" if rng.random() < 0.5 else f"!{body}!")
+        else:
+            lines.append(rng.choice(LINE_HEADS) + body)
+    return "".join(line + rng.choice(("\n", "\n", "\n\n", "")) for line in lines)
+
+
+def lark_latex(parser, text, compiler=None):
+    try:
+        return (compiler or Compiler()).compile(parser.parse(text))
+    except Exception:
+        return None
+
+
+def fast_latex(text, compiler=None):
+    if parse_blocks(text) is None:
+        return None
+    out = io.StringIO()
+    compile_to(text, out, compiler=compiler)
+    return out.getvalue()
+
+
+def map_entries(line_map):
+    # the last source offset is the document end, which Compiler does not know
+    return list(line_map.source_offsets[:-1]), list(line_map.tex_lines)
+
+
+def check(parser, name, text, failures):
+    """Returns True if the fast path took the whole document."""
+    lark_compiler, fast_compiler = Compiler(), Compiler()
+    expected = lark_latex(parser, text, lark_compiler)
+    got = fast_latex(text, fast_compiler)
+    if got is not None and got != expected:
+        failures.append(f"{name}: fast path differs from Compiler\n  source {text!r}")
+    elif got is not None and map_entries(fast_compiler.line_map) != map_entries(lark_compiler.line_map):
+        failures.append(f"{name}: fast path line map differs from Compiler's\n  source {text!r}")
+    if expected is not None:
+        incremental = IncrementalCompiler().compile(text)
+        out = io.StringIO()
+        compile_stream(text.encode("utf-8"), out, parser)
+        if incremental != expected:
+            failures.append(f"{name}: incremental compile differs\n  source {text!r}")
+        if out.getvalue() != expected:
+            failures.append(f"{name}: streaming compile differs\n  source {text!r}")
+    return got is not None
+
+
+def time_both(parser, text, repeat=3):
+    def lark():
+        Compiler().compile_to(parser.parse(text), io.StringIO())
+
+    def fast():
+        compile_to(text, io.StringIO())
+
+    timings = []
+    for fn in (lark, fast):
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            fn()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        timings.append(best)
+    return timings
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("-n", "--docs", type=int, default=3000)
+    arg_parser.add_argument("--seed", type=int, default=0)
+    args = arg_parser.parse_args()
+
+    parser = Parser()
+    failures = []
+    examples_dir = os.path.join(ROOT_DIR, "examples")
+    for name in sorted(os.listdir(examples_dir)):
+        with open(os.path.join(examples_dir, name), "r", encoding="utf-8") as f:
+            check(parser, name, f.read(), failures)
+
+    print(f"{'case':<18}{'lark (s)':>10}{'fast (s)':>10}{'speedup':>9}")
+    for shape in SHAPES:
+        text = generate(shape, 2000)
+        if not check(parser, shape, text, failures):
+            failures.append(f"{shape}: fast path did not take a generated document")
+            continue
+        lark, fast = time_both(parser, text)
+        print(f"{shape + '-2000':<18}{lark:>10.4f}{fast:>10.4f}{lark / fast:>8.1f}x")
+
+    rng = random.Random(args.seed)
+    taken = valid = 0
+    for i in range(args.docs):
+        text = random_document(rng)
+        valid += lark_latex(parser, text) is not None
+        taken += check(parser, f"random #{i}", text, failures)
+    print(f"random: {valid}/{args.docs} valid for Lark, fast path took {taken}")
+
+    for failure in failures:
+        print(f"FAIL {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,104 @@
+"""
+Synthetic source documents built from the constructs in grammar.ebnf.
+
+    python benchmarks/generate.py SHAPE SIZE [-o FILE]
+
+SHAPE is one of headers, lists, commands, paragraphs, mixed; SIZE is the
+number of top-level elements.
+"""
+import argparse
+import random
+import sys
+
+WORDS = (
+    "integral", "vector", "field", "energy", "matrix", "basis", "limit", "series",
+    "proof", "lemma", "graph", "node", "orbit", "phase", "wave", "tensor",
+)
+COMMANDS = (
+    "\\int_0^1 x^{n} dx", "\\frac{a}{b} + \\sqrt{c}", "\\sum_{k=1}^{n} k^2",
+    "E = mc^2", "\\nabla \\cdot F = 0", "\\oint_C f(z) dz", "a_{n+1} = a_n + d",
+)
+
+
+def sentence(rng, words=12):
+    return " ".join(rng.choice(WORDS) for _ in range(words))
+
+
+def headers(rng, size):
+    """Deep header trees: every section has subsections and subsubsections."""
+    lines = []
+    for i in range(size):
+        depth = (i % 3) + 1
+        lines.append("#" * depth + f" {rng.choice(WORDS)} {i}\n")
+    return "".join(lines)
+
+
+def lists(rng, size):
+    """One huge list."""
+    return "".join(f"* {sentence(rng, 6)} {i}\n" for i in range(size))
+
+
+def commands(rng, size):
+    """Thousands of command blocks, some spanning lines."""
+    parts = []
+    for i in range(size):
+        body = rng.choice(COMMANDS)
+        if i % 5 == 0:
+            body = body + "\n" + rng.choice(COMMANDS)
+        parts.append(f"! {body} !\n")
+    return "".join(parts)
+
+
+def paragraphs(rng, size):
+    """Long paragraphs of many lines separated by blank lines."""
+    return "\n".join(
+        "".join(f"{sentence(rng, 16)}\n" for _ in range(8)) for _ in range(size)
+    )
+
+
+def mixed(rng, size):
+    parts = []
+    for i in range(size):
+        kind = i % 4
+        if kind == 0:
+            parts.append("#" * rng.randint(1, 3) + f" {sentence(rng, 3)}\n")
+        elif kind == 1:
+            parts.append(f"{sentence(rng)}\n{sentence(rng)}\n\n")
+        elif kind == 2:
+            parts.append("".join(f"* {sentence(rng, 5)}\n" for _ in range(rng.randint(2, 6))))
+        else:
+            parts.append(f"! {rng.choice(COMMANDS)} !\n")
+    return "".join(parts)
+
+
+SHAPES = {
+    "headers": headers,
+    "lists": lists,
+    "commands": commands,
+    "paragraphs": paragraphs,
+    "mixed": mixed,
+}
+
+
+def generate(shape: str, size: int, seed: int = 0) -> str:
+    return SHAPES[shape](random.Random(seed), size)
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument("shape", choices=sorted(SHAPES))
+    arg_parser.add_argument("size", type=int)
+    arg_parser.add_argument("-o", "--output")
+    arg_parser.add_argument("--seed", type=int, default=0)
+    args = arg_parser.parse_args()
+
+    text = generate(args.shape, args.size, args.seed)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        sys.stdout.write(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+"""
+Parser, compiler and end-to-end benchmarks on synthetic documents.
+
+    python benchmarks/run.py [--sizes 100,1000] [--shapes mixed,lists] [--pdf]
+                             [--save-baseline] [--tolerance 0.25]
+
+For every shape and size this measures parse time and compile time (median
+of --repeat runs with the garbage collector off), peak memory of parse +
+compile (tracemalloc), and with --pdf the end-to-end time to a PDF. Results
+are compared with benchmarks/baseline.json when it exists; a metric worse
+than baseline * (1 + tolerance + spread) is reported and the run exits
+non-zero, where spread is the larger interquartile range / median of the
+timing's samples in this run or the baseline. Timings less than
+MIN_TIME_DELTA slower never count. --save-baseline records the current
+results instead.
+"""
+import argparse
+import gc
+import io
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from compiler import Parser, Compiler
+from generate import SHAPES, generate
+from tex_worker import PDFLATEX, compile_tex
+
+BASELINE_PATH = os.path.join(BENCH_DIR, "baseline.json")
+
+
+def median_of(repeat, fn, *args):
+    """
+    Times repeat calls after one warm-up call, with the garbage collector
+    off so a collection does not land in one sample. Returns the median,
+    the spread (interquartile range / median) and the last result.
+    """
+    result = fn(*args)
+    times = []
+    gc.collect()
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            result = fn(*args)
+            times.append(time.perf_counter() - start)
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+    median = statistics.median(times)
+    if len(times) < 2:
+        return median, 0.0, result
+    q1, _, q3 = statistics.quantiles(times, n=4)
+    return median, (q3 - q1) / median, result
+
+
+def peak_memory(parser, text):
+    tracemalloc.start()
+    try:
+        tree = parser.parse(text)
+        Compiler().compile_to(tree, io.StringIO())
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def pdf_time(parser, text):
+    with tempfile.TemporaryDirectory(prefix="bench-") as workdir:
+        start = time.perf_counter()
+        tree = parser.parse(text)
+        with open(os.path.join(workdir, "main.tex"), "w", encoding="utf-8") as f:
+            Compiler().compile_to(tree, f)
+        result = compile_tex(workdir, "main.tex", Compiler.PREAMBLE, timeout=600)
+        if not result.ok:
+            raise RuntimeError(result.output)
+        return time.perf_counter() - start
+
+
+def run_case(parser, shape, size, repeat, with_pdf):
+    text = generate(shape, size)
+    parse_time, parse_spread, tree = median_of(repeat, parser.parse, text)
+    compile_time, compile_spread, _ = median_of(repeat, lambda t: Compiler().compile_to(t, io.StringIO()), tree)
+    metrics = {
+        "source_bytes": len(text),
+        "parse_s": parse_time,
+        "parse_spread": parse_spread,
+        "compile_s": compile_time,
+        "compile_spread": compile_spread,
+        "peak_bytes": peak_memory(parser, text),
+    }
+    if with_pdf:
+        metrics["pdf_s"] = pdf_time(parser, text)
+    return metrics
+
+
+# metrics compared against the baseline; source_bytes only identifies the input,
+# and <name>_spread widens the tolerance of timing <name>_s
+COMPARED = ("parse_s", "compile_s", "peak_bytes", "pdf_s")
+# timings this close to the baseline are noise, whatever the ratio
+MIN_TIME_DELTA = 0.010
+
+
+def compare(results, baseline, tolerance):
+    regressions = []
+    for case, metrics in results.items():
+        reference = baseline.get(case)
+        if reference is None or reference.get("source_bytes") != metrics["source_bytes"]:
+            continue
+        for name in COMPARED:
+            if name not in metrics or name not in reference:
+                continue
+            # a timing also gets the larger spread of its samples here or in the baseline
+            spread_name = name[:-2] + "_spread"
+            noise = max(metrics.get(spread_name, 0.0), reference.get(spread_name, 0.0))
+            value, limit = metrics[name], reference[name] * (1 + tolerance + noise)
+            if name.endswith("_s") and value - reference[name] < MIN_TIME_DELTA:
+                continue
+            if value > limit:
+                regressions.append(f"{case} {name}: {metrics[name]:.4g} vs baseline {reference[name]:.4g}")
+    return regressions
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--shapes", default=",".join(SHAPES))
+    arg_parser.add_argument("--sizes", default="100,1000,5000")
+    arg_parser.add_argument("--repeat", type=int, default=9, help="timed runs per case; the median is kept")
+    arg_parser.add_argument("--pdf", action="store_true", help="also time parse + compile + pdflatex")
+    arg_parser.add_argument("--baseline", default=BASELINE_PATH)
+    arg_parser.add_argument("--save-baseline", action="store_true")
+    arg_parser.add_argument("--tolerance", type=float, default=0.25)
+    args = arg_parser.parse_args()
+
+    if args.pdf and shutil.which(PDFLATEX) is None:
+        print(f"{PDFLATEX} not found, skipping end-to-end timings", file=sys.stderr)
+        args.pdf = False
+
+    parser = Parser()
+    results = {}
+    print(f"{'case':<18}{'bytes':>10}{'parse (s)':>11}{'compile (s)':>13}{'peak (MB)':>11}{'pdf (s)':>9}")
+    for shape in args.shapes.split(","):
+        for size in map(int, args.sizes.split(",")):
+            case = f"{shape}-{size}"
+            metrics = run_case(parser, shape, size, args.repeat, args.pdf)
+            results[case] = metrics
+            pdf_col = f"{metrics['pdf_s']:>9.2f}" if "pdf_s" in metrics else f"{'-':>9}"
+            print(f"{case:<18}{metrics['source_bytes']:>10}{metrics['parse_s']:>11.4f}"
+                  f"{metrics['compile_s']:>13.4f}{metrics['peak_bytes'] / 1e6:>11.2f}{pdf_col}")
+
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"baseline written to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print("no baseline; run with --save-baseline to record one")
+        return 0
+    with open(args.baseline, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    regressions = compare(results, baseline, args.tolerance)
+    for line in regressions:
+        print(f"REGRESSION {line}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
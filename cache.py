@@ -0,0 +1,447 @@
+import fcntl
+import json
+import os
+import uuid
+import hashlib
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+from synctex import synctex_path
+
+
+@contextmanager
+def file_lock(path):
+    """Holds an exclusive flock on path (created if missing), serializing processes that share a file."""
+    with open(path, "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        yield
+
+
+def _tmp_name(path: Path) -> Path:
+    # unique per process and thread, so concurrent writers never share a temp file
+    return path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+
+
+# =======================
+# Cache
+# =======================
+
+class Cache:
+    ROOT = Path(__file__).resolve().parent / "latex_files"
+    _temp_dirs = set()
+    _registered = set()     # ids this process has entered in the janitor's manifest
+
+    def __init__(self, source_path: str | None = None):
+        Cache.ROOT.mkdir(parents=True, exist_ok=True)
+        self.temp = source_path is None
+
+        if self.temp:
+            self.id = str(uuid.uuid4())
+            Cache._temp_dirs.add(self.id)
+        else:
+            self.id = Cache.id_for(source_path)
+
+        self.base_dir = Cache.ROOT / self.id
+        # registered with the janitor on the first touch(), so opening a window
+        # or a file does not write the manifest; until then a sweep leaves an
+        # unsaved document's dir alone for ORPHAN_GRACE_SECONDS
+        self.base_dir.mkdir(exist_ok=True)
+
+    @staticmethod
+    def id_for(source_path: str) -> str:
+        abs_path = str(Path(source_path).resolve())
+        return hashlib.sha256(abs_path.encode()).hexdigest()[:16]
+
+    @property
+    def tex_path(self) -> Path:
+        return self.base_dir / "main.tex"
+
+    @property
+    def pdf_path(self) -> Path:
+        return self.base_dir / "main.pdf"
+
+    def promote(self, source_path: str):
+        if not self.temp:
+            return
+        permanent_id = Cache.id_for(source_path)
+        permanent_dir = Cache.ROOT / permanent_id
+        # both dirs live under ROOT, so these are renames rather than copies
+        try:
+            self.base_dir.rename(permanent_dir)
+        except OSError:
+            # the permanent dir already exists: move the files into it
+            # (or a sweep removed the temp dir before anything was compiled in it)
+            permanent_dir.mkdir(exist_ok=True)
+            for item in (self.base_dir.iterdir() if self.base_dir.exists() else ()):
+                os.replace(item, permanent_dir / item.name)
+            shutil.rmtree(self.base_dir, ignore_errors=True)
+        Cache._temp_dirs.discard(self.id)
+        Cache._registered.discard(self.id)
+        get_janitor().rename(self.id, permanent_id)
+        Cache._registered.add(permanent_id)
+        self.id = permanent_id
+        self.base_dir = permanent_dir
+        self.temp = False
+
+    @staticmethod
+    def cleanup_temp_dirs():
+        for temp_id in list(Cache._temp_dirs):
+            Cache._remove_temp(temp_id)
+
+    @staticmethod
+    def _remove_temp(temp_id: str):
+        shutil.rmtree(Cache.ROOT / temp_id, ignore_errors=True)
+        Cache._temp_dirs.discard(temp_id)
+        if temp_id in Cache._registered:
+            Cache._registered.discard(temp_id)
+            get_janitor().forget(temp_id)
+
+    def remove(self):
+        """Deletes the dir of an unsaved document; saved documents' dirs stay."""
+        if self.temp:
+            Cache._remove_temp(self.id)
+
+    def touch(self):
+        """
+        Marks the dir used, registering it with the janitor the first time.
+        Call before writing into the dir: it also recreates a dir that
+        another process's sweep removed.
+        """
+        if self.id in Cache._registered:
+            get_janitor().touch(self.id)
+        else:
+            get_janitor().register(self.id, temp=self.temp)
+            Cache._registered.add(self.id)
+        self.base_dir.mkdir(exist_ok=True)
+
+
+
+# =======================
+# Janitor
+# =======================
+
+# TeX leftovers that are useless once the PDF (or SVG pages) exist; .aux,
+# .toc and .out stay so the next compile starts from settled references
+INTERMEDIATE_SUFFIXES = (".log", ".dvi")
+
+
+def remove_intermediates(base_dir):
+    for suffix in INTERMEDIATE_SUFFIXES:
+        for path in Path(base_dir).glob(f"*{suffix}"):
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    except OSError:
+        return False
+    return True
+
+
+class CacheJanitor:
+    """
+    Keeps the per-document dirs under Cache.ROOT in check.
+    manifest.json records every dir with its last use and, for unsaved
+    documents, the pid that owns it, so temp dirs left behind by a crash are
+    found at the next startup. Saved documents' dirs are evicted least
+    recently used first once they outgrow max_bytes. The shared stores
+    (pdf/, formats/, fragments/, pages/, logs/) manage themselves and are left alone.
+    Processes share the manifest, so every update holds an flock on it.
+    """
+    DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+    # unsaved-document dirs missing from the manifest are only removed once this old
+    ORPHAN_GRACE_SECONDS = 60 * 60
+    MANIFEST = "manifest.json"
+    SHARED_DIRS = frozenset({"pdf", "formats", "fragments", "pages", "logs"})
+
+    def __init__(self, root: Path | None = None, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.root = root or Cache.ROOT
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.manifest_path = self.root / self.MANIFEST
+        self.lock_path = self.root / "manifest.lock"
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+    # ---------- Manifest ----------
+    def _load(self):
+        try:
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save(self, manifest):
+        tmp_path = _tmp_name(self.manifest_path)
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, self.manifest_path)
+
+    def _update(self, change):
+        # other processes (the CLI, a second window, the daemon) share the manifest,
+        # so it is re-read and written back under a file lock each time
+        with self._lock, file_lock(self.lock_path):
+            manifest = self._load()
+            change(manifest)
+            self._save(manifest)
+
+    def register(self, cache_id: str, temp: bool = False):
+        entry = {"used": time.time()}
+        if temp:
+            entry["pid"] = os.getpid()
+        def change(manifest):
+            manifest[cache_id] = entry
+        self._update(change)
+
+    def touch(self, cache_id: str):
+        def change(manifest):
+            manifest.setdefault(cache_id, {})["used"] = time.time()
+        self._update(change)
+
+    def rename(self, old_id: str, new_id: str):
+        def change(manifest):
+            manifest.pop(old_id, None)
+            manifest[new_id] = {"used": time.time()}
+        self._update(change)
+
+    def forget(self, cache_id: str):
+        self._update(lambda manifest: manifest.pop(cache_id, None))
+
+    # ---------- Sweeping ----------
+    @staticmethod
+    def dir_size(path: Path) -> int:
+        total = 0
+        for item in path.iterdir():
+            try:
+                total += item.stat().st_size
+            except FileNotFoundError:
+                pass
+        return total
+
+    def sweep(self, keep=()) -> list[str]:
+        """
+        Removes orphaned temp dirs, then evicts the least recently used
+        document dirs until the total fits max_bytes. Dirs in keep are never
+        removed. Returns the ids of the removed dirs.
+        """
+        removed = []
+        keep = set(keep)
+
+        def change(manifest):
+            dirs = {p.name: p for p in self.root.iterdir() if p.is_dir() and p.name not in self.SHARED_DIRS}
+            for cache_id, entry in list(manifest.items()):
+                # a live owner may have registered a dir it has not created yet
+                pid = entry.get("pid")
+                if cache_id not in dirs and not (pid is not None and _pid_alive(pid)):
+                    del manifest[cache_id]
+            for cache_id, path in dirs.items():
+                if cache_id in manifest:
+                    continue
+                try:
+                    mtime = path.stat().st_mtime
+                except FileNotFoundError:
+                    continue
+                # dirs from before the manifest: uuid names were unsaved documents,
+                # removed only when stale, in case their owner is still running
+                if len(cache_id) == 36:
+                    if cache_id not in keep and time.time() - mtime > self.ORPHAN_GRACE_SECONDS:
+                        shutil.rmtree(path, ignore_errors=True)
+                        removed.append(cache_id)
+                else:
+                    manifest[cache_id] = {"used": mtime}
+
+            sizes = {}
+            for cache_id, entry in list(manifest.items()):
+                pid = entry.get("pid")
+                if cache_id not in dirs:
+                    continue
+                if pid is not None and cache_id not in keep and not _pid_alive(pid):
+                    shutil.rmtree(dirs[cache_id], ignore_errors=True)
+                    removed.append(cache_id)
+                    del manifest[cache_id]
+                else:
+                    sizes[cache_id] = self.dir_size(dirs[cache_id])
+
+            total = sum(sizes.values())
+            for cache_id, entry in sorted(manifest.items(), key=lambda item: item[1]["used"]):
+                if total <= self.max_bytes:
+                    break
+                if cache_id in keep or "pid" in entry:
+                    continue
+                shutil.rmtree(dirs[cache_id], ignore_errors=True)
+                removed.append(cache_id)
+                total -= sizes[cache_id]
+                del manifest[cache_id]
+
+        self._update(change)
+        return removed
+
+
+_janitor = None
+_janitor_lock = threading.Lock()
+
+
+def get_janitor() -> CacheJanitor:
+    global _janitor
+    with _janitor_lock:
+        if _janitor is None or _janitor.root != Cache.ROOT:
+            _janitor = CacheJanitor(Cache.ROOT)
+        return _janitor
+
+
+class HashingWriter:
+    """Wraps a text file and hashes everything written through it."""
+
+    def __init__(self, fp):
+        self.fp = fp
+        self.sha = hashlib.sha256()
+        self.bytes_written = 0
+
+    def write(self, text: str):
+        data = text.encode("utf-8")
+        self.sha.update(data)
+        self.bytes_written += len(data)
+        return self.fp.write(text)
+
+    def hexdigest(self) -> str:
+        return self.sha.hexdigest()
+
+
+# =======================
+# PDF Cache
+# =======================
+
+class PdfCache:
+    """
+    Content-addressed store of compiled PDFs under Cache.ROOT/pdf.
+    Entries are keyed by the hash of the generated LaTeX (the preamble, and
+    so the package set, is part of it) and the engine that produced them.
+    The PDF's .synctex.gz, when there is one, is stored beside it.
+    index.json records size and last use of every entry so lookups and
+    LRU eviction never scan the directory tree. Several processes share the
+    store, so every change re-reads index.json under a file lock and writes
+    the merged result back. Lookups only re-read the index when its file
+    changed, and a hit only rewrites it when the entry's last use is older
+    than TOUCH_INTERVAL; misses never write.
+    """
+    DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+    TOUCH_INTERVAL = 60         # seconds of LRU precision traded for fewer index writes
+
+    def __init__(self, root: Path | None = None, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.root = root or Cache.ROOT / "pdf"
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.index_path = self.root / "index.json"
+        self.lock_path = self.root / "index.lock"
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._index_version = None
+        self.index = self._load_index()
+
+    @staticmethod
+    def key(latex_hash: str, engine: str = "pdflatex") -> str:
+        return hashlib.sha256(f"{engine}\0{latex_hash}".encode()).hexdigest()
+
+    def entry_path(self, key: str) -> Path:
+        return self.root / key[:2] / f"{key}.pdf"
+
+    # ---------- Index ----------
+    def _index_stat(self):
+        try:
+            stat = self.index_path.stat()
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def _load_index(self):
+        # index.json is only ever replaced whole, so it can be read without the file lock
+        self._index_version = self._index_stat()
+        if self._index_version is not None:
+            try:
+                with open(self.index_path, "r", encoding="utf-8") as f:
+                    return json.load(f)
+            except (OSError, ValueError):
+                pass
+        return {}
+
+    def _save_index(self):
+        tmp_path = _tmp_name(self.index_path)
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.index, f)
+        os.replace(tmp_path, self.index_path)
+        self._index_version = self._index_stat()
+
+    @contextmanager
+    def _locked_index(self):
+        """Yields the index as on disk now; it is saved on exit if it was changed."""
+        with self._lock, file_lock(self.lock_path):
+            self.index = self._load_index()
+            before = json.dumps(self.index, sort_keys=True)
+            yield self.index
+            if json.dumps(self.index, sort_keys=True) != before:
+                self._save_index()
+
+    # ---------- Lookup / Store ----------
+    def lookup(self, key: str) -> Path | None:
+        with self._lock:
+            if self._index_stat() != self._index_version:
+                self.index = self._load_index()
+            entry = self.index.get(key)
+        if entry is None:
+            return None
+        path = self.entry_path(key)
+        if path.exists() and time.time() - entry["used"] < self.TOUCH_INTERVAL:
+            return path
+        with self._locked_index() as index:
+            entry = index.get(key)
+            if entry is None:
+                return None
+            if not path.exists():
+                del index[key]
+                return None
+            entry["used"] = time.time()
+            return path
+
+    def store(self, key: str, pdf_path) -> Path:
+        path = self.entry_path(key)
+        path.parent.mkdir(exist_ok=True)
+        tmp_path = _tmp_name(path)
+        shutil.copyfile(pdf_path, tmp_path)
+        os.replace(tmp_path, path)
+        size = path.stat().st_size
+        if os.path.exists(synctex_path(pdf_path)):
+            sync_path = synctex_path(path)
+            shutil.copyfile(synctex_path(pdf_path), tmp_path)
+            os.replace(tmp_path, sync_path)
+            size += os.path.getsize(sync_path)
+        with self._locked_index() as index:
+            index[key] = {"size": size, "used": time.time()}
+            self._evict()
+        return path
+
+    def total_bytes(self) -> int:
+        return sum(entry["size"] for entry in self.index.values())
+
+    def _evict(self):
+        total = self.total_bytes()
+        if total <= self.max_bytes:
+            return
+        for key, entry in sorted(self.index.items(), key=lambda item: item[1]["used"]):
+            if total <= self.max_bytes:
+                break
+            for path in (self.entry_path(key), Path(synctex_path(self.entry_path(key)))):
+                try:
+                    path.unlink()
+                except FileNotFoundError:
+                    pass
+            total -= entry["size"]
+            del self.index[key]
@@ -1,9 +1,18 @@
-from lark import Lark, Transformer, v_args, Token, Tree
+import io
 import os
+import sys
 import json
+import hashlib
+import threading
+from array import array
+from bisect import bisect_right
 
 filepath = "/home/tash/pythonProds/latex_app/src/latex_template.txt"
 
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+GRAMMAR_PATH = os.path.join(APP_DIR, "grammar.ebnf")
+GRAMMAR_CACHE_DIR = os.path.join(APP_DIR, "src", "grammar_cache")
+
 #latex_template = "\documentclass{standalone}
  #                   \begin{document}
 
@@ -13,125 +22,317 @@ filepath = "/home/tash/pythonProds/latex_app/src/latex_template.txt"
 #TODO: Add tikz support to the latex source code 
 
 
+MARKUP_TOKENS = frozenset({"HASH", "STAR", "BANG", "NEWLINE"})
+
+
+# =======================
+# AST
+# =======================
+
+class Node:
+    """A grammar rule match. data is the interned rule name, pos its start offset in the source."""
+    __slots__ = ("data", "children", "pos")
+
+    def __init__(self, data, children, pos=None):
+        self.data = data
+        self.children = children
+        self.pos = pos
+
+    def __repr__(self):
+        return f"Node({self.data!r}, {self.children!r})"
+
+
+class Leaf:
+    """A terminal. type is the interned terminal name."""
+    __slots__ = ("type", "value")
+
+    def __init__(self, type, value):
+        self.type = type
+        self.value = value
+
+    def __repr__(self):
+        return f"Leaf({self.type!r}, {self.value!r})"
+
+
+_TOKEN_TYPES = {}
+
+
+def _leaf(token):
+    token_type = _TOKEN_TYPES.get(token.type)
+    if token_type is None:
+        token_type = _TOKEN_TYPES.setdefault(token.type, sys.intern(token.type))
+    return Leaf(token_type, token.value)
+
+
+class AstBuilder:
+    """
+    Builds Node/Leaf instead of Tree/Token. Passed to Lark as its
+    transformer, it runs inside the LALR parser, so no Lark tree is built;
+    transform() converts an existing Tree. Lark only looks up one callback
+    per rule on it, so it needs no lark import of its own; children that
+    are str are Lark Tokens.
+    """
+
+    def __init__(self):
+        self._builders = {}
+
+    def __getattr__(self, name):
+        # one callback per grammar rule; Lark's internal rules and dunders are left alone
+        if name.startswith("_") or not name.islower() or "_builders" not in self.__dict__:
+            raise AttributeError(name)
+        return self._builder(name)
+
+    def _builder(self, name):
+        builder = self._builders.get(name)
+        if builder is None:
+            kind = sys.intern(str(name))
+
+            def builder(children):
+                pos = None
+                if children:
+                    first = children[0]
+                    pos = first.start_pos if isinstance(first, str) else getattr(first, "pos", None)
+                return Node(kind, [_leaf(c) if isinstance(c, str) else c for c in children], pos)
+            self._builders[name] = builder
+        return builder
+
+    def transform(self, tree):
+        if isinstance(tree, str):
+            return _leaf(tree)
+        children = [c if isinstance(c, str) else self.transform(c) for c in tree.children]
+        return self._builder(tree.data)(children)
+
+
+class LineMap:
+    """
+    Source offset -> .tex line map of a compiled document, one entry per
+    top-level block in writing order, kept as two arrays: block i covers
+    source[source_offsets[i]:source_offsets[i + 1]] and .tex lines
+    tex_lines[i] up to tex_lines[i + 1] - 1. close() adds the end of the
+    last block. Both arrays are sorted, so lookups either way are a bisect.
+    """
+    __slots__ = ("source_offsets", "tex_lines")
+
+    def __init__(self):
+        self.source_offsets = array("q")
+        self.tex_lines = array("q")
+
+    def add(self, source_offset, tex_line):
+        self.source_offsets.append(source_offset)
+        self.tex_lines.append(tex_line)
+
+    def close(self, tex_line, source_offset=None):
+        self.add(sys.maxsize if source_offset is None else source_offset, tex_line)
+
+    def __len__(self):
+        return max(len(self.source_offsets) - 1, 0)
+
+    def block_at_offset(self, source_offset):
+        if not len(self):
+            return None
+        return min(max(bisect_right(self.source_offsets, source_offset) - 1, 0), len(self) - 1)
+
+    def block_at_tex_line(self, tex_line):
+        """The block whose LaTeX holds tex_line, or None for the preamble and the document end."""
+        i = bisect_right(self.tex_lines, tex_line) - 1
+        return i if 0 <= i < len(self) else None
+
+    def source_range(self, block):
+        return self.source_offsets[block], self.source_offsets[block + 1]
+
+    def tex_range(self, block):
+        """First and last .tex line of block."""
+        return self.tex_lines[block], self.tex_lines[block + 1] - 1
+
+    def source_offset(self, tex_line):
+        """Start offset of the source block tex_line came from, or None."""
+        block = self.block_at_tex_line(tex_line)
+        return None if block is None else self.source_offsets[block]
+
+    def tex_line(self, source_offset):
+        """First .tex line of the block holding source_offset, or None for an empty map."""
+        block = self.block_at_offset(source_offset)
+        return None if block is None else self.tex_lines[block]
+
+
 class Compiler:
     """
     Converts the parse tree into LaTeX code.
     Only command blocks produce special LaTeX environments.
+
+    It walks the Node/Leaf AST the parser builds (Lark trees are converted
+    first), iteratively, writing fragments straight into a file-like sink,
+    so long documents are neither copied per level nor limited by the
+    recursion depth. Compiling a whole document also records line_map.
     """
-    
+
+    # rule -> (prefix, suffix, drop markup tokens among direct children)
+    RULES = {
+        # ---------- headers ----------
+        "h1": ("\\section{", "}\n", True),
+        "h2": ("\\subsection{", "}\n", True),
+        "h3": ("\\subsubsection{", "}\n", True),
+        # ---------- paragraphs ----------
+        "paragraph": ("", "\n\n", False),
+        # ---------- lists ----------
+        "list": ("\\begin{itemize}\n", "\\end{itemize}\n", False),
+        "item": ("  \\item ", "\n", True),
+        # ---------- command blocks ----------
+        "command_block": ("\\begin{equation}\n", "\n\\end{equation}\n", True),
+    }
+    PASS_THROUGH = ("", "", False)
+
+    # ---------- document ----------
+    PREAMBLE = (
+        "\\documentclass{article}\n"
+        "\\usepackage[utf8]{inputenc}\n"
+        "\\usepackage{amsmath}\n"
+        "\\usepackage{amssymb}\n"
+        "\\usepackage{tikz}\n"
+        "\\usepackage{pgfplots}\n"
+        "\\usepackage{chemfig}"
+        "\\usepackage{geometry}\n"
+    )
+    BEGIN_DOCUMENT = "\\begin{document}\n"
+    END_DOCUMENT = "\n\\end{document}"
+
+    def __init__(self):
+        self.line_map = LineMap()
+
+    @classmethod
+    def body_line(cls):
+        """The .tex line the first block's LaTeX starts on."""
+        return 1 + (cls.PREAMBLE + cls.BEGIN_DOCUMENT).count("\n")
+
     def compile(self, node):
-        # initialize flag on first ever call
-        if not hasattr(self, "_is_root"):
-            self._is_root = True
-        is_root_call = self._is_root
-        self._is_root = False
+        out = io.StringIO()
+        self.compile_to(node, out)
+        return out.getvalue()
 
-        if isinstance(node, Tree):
-            result = self.compile_tree(node)
+    def compile_fragment(self, node):
+        """Compiles a node without the document preamble."""
+        out = io.StringIO()
+        self.compile_to(node, out, document=False)
+        return out.getvalue()
 
-            # ✅ wrap only ONCE, only at root, only if not already document
-            if is_root_call and node.data != "document":
-                return self.compile_document([node])
+    def compile_to(self, node, fp, document=True):
+        """Writes the LaTeX for node into fp, wrapped in the preamble if document is set."""
+        if not isinstance(node, (Node, Leaf)):
+            node = to_ast(node)
+        elements = node.children if isinstance(node, Node) and node.data == "document" else [node]
+        if not document:
+            self.emit(elements, fp.write)
+            return
+        fp.write(self.PREAMBLE + self.BEGIN_DOCUMENT)
+        self.line_map = line_map = LineMap()
+        tex_line = self.body_line()
+        for element in elements:
+            # one element at a time, so its lines are counted once
+            parts = []
+            self.emit([element], parts.append)
+            text = "".join(parts)
+            if type(element) is Node and element.pos is not None:
+                line_map.add(element.pos, tex_line)
+            fp.write(text)
+            tex_line += text.count("\n")
+        line_map.close(tex_line)
+        fp.write(self.END_DOCUMENT)
 
-            return result
+    def wrap_document(self, body):
+        return self.PREAMBLE + self.BEGIN_DOCUMENT + body + self.END_DOCUMENT
 
-        elif isinstance(node, Token):
-            return node.value
+    def emit(self, nodes, write):
+        rules = self.RULES
+        pass_through = self.PASS_THROUGH
+        # each frame: (children iterator, drop markup tokens, suffix)
+        stack = [(iter(nodes), False, "")]
+        while stack:
+            children, drop_markup, suffix = stack[-1]
+            node = next(children, None)
+            if node is None:
+                stack.pop()
+                if suffix:
+                    write(suffix)
+            elif isinstance(node, Leaf):
+                if not (drop_markup and node.type in MARKUP_TOKENS):
+                    write(node.value)
+            else:
+                prefix, node_suffix, node_drop = rules.get(node.data, pass_through)
+                if prefix:
+                    write(prefix)
+                stack.append((iter(node.children), node_drop, node_suffix))
 
-        return ""
 
+def to_ast(tree):
+    """Converts a Lark Tree (or Token) into Node/Leaf."""
+    return AstBuilder().transform(tree)
 
-    def compile_tree(self, tree):
-        method = getattr(self, f"compile_{tree.data}", None)
-        if method:
-            return method(tree.children)
-        else:
-            return "".join(self.compile(c) for c in tree.children)
 
-    # ---------- document ----------
-    def compile_document(self, children):
-        body = "".join(self.compile(c) for c in children)
-        return (
-            "\\documentclass{article}\n"
-            "\\usepackage[utf8]{inputenc}\n"
-            "\\usepackage{amsmath}\n"
-            "\\usepackage{amssymb}\n"
-            "\\usepackage{tikz}\n"
-            "\\usepackage{pgfplots}\n"
-            "\\usepackage{chemfig}"
-            "\\usepackage{geometry}\n"
-            "\\begin{document}\n"
-            f"{body}\n"
-            "\\end{document}"
-        )
-
-    # ---------- headers ----------
-    def compile_h1(self, children):
-        return f"\\section{{{self.extract_text(children)}}}\n"
-    def compile_h2(self, children):
-        return f"\\subsection{{{self.extract_text(children)}}}\n"
-    def compile_h3(self, children):
-        return f"\\subsubsection{{{self.extract_text(children)}}}\n"
-
-    # ---------- paragraphs ----------
-    def compile_paragraph(self, children):
-        return "".join(self.compile(c) for c in children) + "\n\n"
-    def compile_sentence(self, children):
-        return "".join(self.compile(c) for c in children)
-
-    # ---------- lists ----------
-    def compile_list(self, children):
-        return "\\begin{itemize}\n" + "".join(self.compile(c) for c in children) + "\\end{itemize}\n"
-    def compile_item(self, children):
-        return "  \\item " + self.extract_text(children) + "\n"
-
-    # ---------- command blocks ----------
-    def compile_command_block(self, children):
-        body = self.extract_text(children)
-        return f"\\begin{{equation}}\n{body}\n\\end{{equation}}\n"
-
-    # ---------- helpers ----------
-    def extract_text(self, nodes):
-        return "".join(
-            self.compile(n)
-            for n in nodes
-            if not (isinstance(n, Token) and n.type in {"HASH", "STAR", "BANG", "NEWLINE"})
-        )
-  
+_parser = None
+_parser_lock = threading.Lock()
+
+
+def get_parser():
+    """
+    Returns the process-wide Lark parser, building it on first use.
+    The LALR tables are serialized to GRAMMAR_CACHE_DIR, keyed on the grammar
+    hash, so later processes load them instead of rebuilding. lark itself
+    is imported here too, so importing this module stays cheap.
+    """
+    global _parser
+    if _parser is None:
+        with _parser_lock:
+            if _parser is None:
+                from lark import Lark
+                with open(GRAMMAR_PATH, "r", encoding="utf-8") as f:
+                    grammar = f.read()
+                grammar_hash = hashlib.sha256(grammar.encode()).hexdigest()[:16]
+                os.makedirs(GRAMMAR_CACHE_DIR, exist_ok=True)
+                cache_file = os.path.join(GRAMMAR_CACHE_DIR, f"grammar-{grammar_hash}.lark")
+                _parser = Lark(grammar, parser='lalr', start='document', cache=cache_file,
+                               transformer=AstBuilder())
+    return _parser
+
 
 class Parser:
-    def __init__(self,text):
+    """Parses with the shared Lark parser, which is loaded on first use."""
+
+    def __init__(self, text=None):
         self.text = text
-        self.operator = Lark(open('grammar.ebnf').read(), parser='lalr', start='document')
-    
-    def parse(self):
-        tree = self.operator.parse(self.text)
+
+    @property
+    def operator(self):
+        return get_parser()
+
+    def parse(self, text=None):
+        tree = self.operator.parse(self.text if text is None else text)
         return tree
-    
-    def lex_text(self):
-        lexed_text = self.operator.lex(self.text)
+
+    def lex_text(self, text=None):
+        lexed_text = self.operator.lex(self.text if text is None else text)
         return lexed_text
 
 def travel(tree):
     tree_nodes = []
     token_nodes = []
     for child in tree.children:
-        if isinstance(child, Tree):
+        if isinstance(child, Node):
             tree_nodes.append(child)
             
-        if isinstance(child, Token):
+        if isinstance(child, Leaf):
             token_nodes.append(child)
     print("Trees:\n", tree_nodes)
     print("Tokens:\n", token_nodes)
             
 
 if __name__ == "__main__":
+    parser = Parser()
     for example in os.listdir('examples/'):
         print(f'Starting parser on {example}\n')
 
         with open(f'examples/{example}', 'r') as file:
             text = file.read()
-        tree = Parser(text).parse()
+        tree = parser.parse(text)
         print(f'Tree for {example}:\n{tree}')
         latex = Compiler().compile(tree)
         print(latex)
@@ -0,0 +1,465 @@
+"""
+Shared compile service.
+
+Without it every GUI window and every latexapp run loads its own parser,
+keeps its own block and PDF cache state and spawns its own pdflatex. The
+daemon owns one of each for Cache.ROOT: the warm Lark parser, an
+IncrementalCompiler whose block cache all documents share, PdfCache,
+LogCache and the CompileScheduler. Clients send source text over a Unix
+socket and get output paths back, so several editors and scripts running
+at once share warm state, and identical compiles run once.
+
+The protocol is one JSON object per line in each direction:
+
+    {"op": "compile", "source": "...", "path": null, "document": "...",
+     "engine": "auto", "purpose": "preview", "priority": "interactive",
+     "retry_failed": false}
+        -> {"ok": true, "outputs": [...], "cached": false, "engine": ...,
+            "line_map": [[source offsets], [tex lines]], "profile": {...}}
+        -> {"ok": false, "errors": [texlog.LogEntry dicts], ...}
+        -> {"ok": false, "cancelled": true}
+        -> {"ok": false, "error": "..."}
+    {"op": "close", "document": "..."}
+    {"op": "ping"}, {"op": "stats"}, {"op": "shutdown"}
+
+A saved document is named by its path and compiles in the same Cache(path)
+dir the GUI uses; unsaved text is named by an id its client picks. Without
+source the daemon reads path itself. A new compile of a document cancels
+the one still running for it.
+
+    python daemon.py serve | status | stop [--socket PATH]
+
+Clients start the daemon on first use (connect()); it exits after
+IDLE_TIMEOUT seconds without requests.
+"""
+import argparse
+import fcntl
+import hashlib
+import json
+import os
+import signal
+import socket
+import socketserver
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import CancelledError
+from contextlib import contextmanager
+from pathlib import Path
+
+from cache import Cache, PdfCache, HashingWriter, remove_intermediates
+from compiler import Compiler, LineMap, get_parser
+from incremental import IncrementalCompiler
+from streaming import STREAM_THRESHOLD, compile_file
+from tex_worker import submit_compile, warm_up
+from scheduler import Priority, get_scheduler
+from engines import choose_engine
+from texlog import LogCache, read_log
+from profiler import Profile
+
+SOCKET_ENV = "LATEX_APP_DAEMON_SOCKET"
+SOCKET_PATH = Path(os.environ.get(SOCKET_ENV) or Cache.ROOT / "daemon.sock")
+DAEMON_SCRIPT = Path(__file__).resolve()
+IDLE_TIMEOUT = 30 * 60      # seconds without requests before the daemon exits
+START_TIMEOUT = 10          # seconds a client waits for a daemon it started
+# compiler output returned when the TeX log has nothing to report
+ERROR_TAIL_LINES = 40
+
+
+class DaemonError(RuntimeError):
+    pass
+
+
+def encode_line_map(line_map: LineMap):
+    return [list(line_map.source_offsets), list(line_map.tex_lines)]
+
+
+def decode_line_map(data) -> LineMap:
+    line_map = LineMap()
+    line_map.source_offsets.extend(data[0])
+    line_map.tex_lines.extend(data[1])
+    return line_map
+
+
+def _file_hash(path) -> str:
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+# =======================
+# Service
+# =======================
+
+class Document:
+    """
+    The workdir of one document and the compile last started in it. lock
+    orders the cancel / write main.tex / submit steps of its compiles.
+    """
+    __slots__ = ("cache", "job", "lock")
+
+    def __init__(self, cache):
+        self.cache = cache
+        self.job = None
+        self.lock = threading.Lock()
+
+
+class CompileService:
+    def __init__(self):
+        self.incremental = IncrementalCompiler()
+        self.pdf_cache = PdfCache()
+        self.log_cache = LogCache()
+        self.documents = {}
+        self._lock = threading.Lock()
+        # the incremental compiler is not thread safe; held only while it
+        # generates one document, so streaming compiles run beside it
+        self._incremental_lock = threading.Lock()
+        self.active = 0
+        self.last_request = time.monotonic()
+
+    @contextmanager
+    def busy(self):
+        with self._lock:
+            self.active += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.active -= 1
+                self.last_request = time.monotonic()
+
+    def idle_seconds(self) -> float:
+        with self._lock:
+            return 0.0 if self.active else time.monotonic() - self.last_request
+
+    def handle(self, request: dict) -> dict:
+        op = request.get("op")
+        if op == "compile":
+            return self.compile(request)
+        if op == "close":
+            self.close_document(request.get("document"))
+            return {"ok": True}
+        if op in ("ping", "shutdown"):
+            return {"ok": True, "pid": os.getpid(), "root": str(Cache.ROOT)}
+        if op == "stats":
+            with self._lock:
+                documents = len(self.documents)
+            return {"ok": True, "pid": os.getpid(), "documents": documents,
+                    "scheduler": get_scheduler().snapshot()}
+        raise ValueError(f"unknown op {op!r}")
+
+    # ---------- Documents ----------
+    @staticmethod
+    def document_id(request) -> str:
+        if request.get("path"):
+            return Cache.id_for(request["path"])
+        if request.get("document"):
+            return f"unsaved:{request['document']}"
+        raise ValueError("compile needs a path or a document id")
+
+    def document(self, request) -> Document:
+        document_id = self.document_id(request)
+        with self._lock:
+            document = self.documents.get(document_id)
+            if document is None:
+                document = self.documents[document_id] = Document(Cache(request.get("path") or None))
+            elif not document.cache.base_dir.exists():
+                # another process's sweep evicted the dir; the document keeps its lock and job
+                document.cache = Cache(request.get("path") or None)
+            return document
+
+    def close_document(self, document_id):
+        with self._lock:
+            document = self.documents.pop(f"unsaved:{document_id}", None)
+        if document is None:
+            return
+        with document.lock:
+            if document.job is not None:
+                get_scheduler().cancel(document.job)
+                document.job = None
+        document.cache.remove()
+
+    # ---------- Compile ----------
+    def write_tex(self, request, tex_path, profile):
+        """Writes main.tex for the request; returns its hash and line map."""
+        source, path = request.get("source"), request.get("path")
+        if source is None:
+            if not path:
+                raise ValueError("compile needs source or a path")
+            if os.path.getsize(path) >= STREAM_THRESHOLD:
+                compiler = Compiler()
+                stats = compile_file(path, tex_path, self.incremental.parser, compiler)
+                profile.record("parse", stats.parse_seconds, bytes_in=stats.bytes_in, blocks=stats.blocks)
+                profile.record("compile", stats.compile_seconds, bytes_out=stats.bytes_out)
+                return _file_hash(tex_path), compiler.line_map
+            with profile.stage("read") as stage:
+                with open(path, "r", encoding="utf-8") as f:
+                    source = f.read()
+                stage.bytes_out = len(source)
+        with self._incremental_lock:
+            start = time.perf_counter()
+            with open(tex_path, "w", encoding="utf-8") as f:
+                writer = HashingWriter(f)
+                self.incremental.compile_to(source, writer)
+            elapsed = time.perf_counter() - start
+            self.incremental.record_stats(profile, len(source))
+            profile.record("write_tex", elapsed - self.incremental.parse_seconds - self.incremental.compile_seconds,
+                           bytes_out=writer.bytes_written)
+            return writer.hexdigest(), self.incremental.line_map
+
+    def compile(self, request) -> dict:
+        purpose = request.get("purpose", "preview")
+        engine_name = request.get("engine", "auto")
+        choose_engine(purpose, engine_name)     # rejects a bad request before any work
+        priority = Priority[request.get("priority", "interactive").upper()]
+        document = self.document(request)
+        cache = document.cache
+        profile = Profile(request.get("path") or "unsaved")
+        reply = {"cached": False}
+
+        with document.lock:
+            if document.job is not None:
+                # a newer revision makes the running compile stale
+                get_scheduler().cancel(document.job)
+                document.job = None
+            cache.touch()
+            latex_hash, line_map = self.write_tex(request, cache.tex_path, profile)
+            engine = choose_engine(purpose, engine_name, cache.tex_path.stat().st_size)
+            reply["engine"] = engine.name
+            key = PdfCache.key(latex_hash, engine.name)
+            reply["line_map"] = encode_line_map(line_map)
+            if "pdf" in engine.capabilities:
+                with profile.stage("pdf_cache") as stage:
+                    cached_pdf = self.pdf_cache.lookup(key)
+                    stage.cache = "miss" if cached_pdf is None else "hit"
+                if cached_pdf is not None:
+                    return dict(reply, ok=True, cached=True, outputs=[str(cached_pdf)], profile=profile.to_dict())
+            if not request.get("retry_failed"):
+                with profile.stage("log_cache") as stage:
+                    entries = self.log_cache.lookup(key)
+                    stage.cache = "miss" if entries is None else "hit"
+                if entries is not None:
+                    return dict(reply, ok=False, cached=True, errors=[entry.to_dict() for entry in entries],
+                                profile=profile.to_dict())
+            job = document.job = submit_compile(cache.base_dir, cache.tex_path.name, Compiler.PREAMBLE,
+                                                priority, key=key, engine=engine)
+
+        try:
+            result = job.future.result()
+        except CancelledError:
+            result = None
+        finally:
+            with document.lock:
+                superseded = document.job is not job
+                if not superseded:
+                    document.job = None
+        if superseded or result is None:
+            return {"ok": False, "cancelled": True}
+
+        profile.record("queue", job.wait_seconds, depth=get_scheduler().queue_depth())
+        for program, seconds in result.steps.items():
+            profile.record(program, seconds, engine=result.engine, warm_format=result.warm, passes=result.passes)
+        reply.update(profile=profile.to_dict(), passes=result.passes)
+        if result.returncode != 0:
+            entries = read_log(result.log_path) if result.log_path else []
+            if not any(entry.kind == "error" for entry in entries):
+                return dict(reply, ok=False, error="\n".join(result.output.splitlines()[-ERROR_TAIL_LINES:]))
+            self.log_cache.store(key, entries)
+            return dict(reply, ok=False, errors=[entry.to_dict() for entry in entries])
+        if not result.ok:
+            return dict(reply, ok=False, error="Output not created")
+        outputs = [str(p) for p in result.outputs]
+        if result.pdf_path is not None:
+            # the cached copy stays put while the next compile rewrites the workdir
+            try:
+                outputs = [str(self.pdf_cache.store(key, result.pdf_path))]
+            except OSError as e:
+                print(f"warning: PDF not cached: {e}", file=sys.stderr)
+        remove_intermediates(cache.base_dir)
+        return dict(reply, ok=True, outputs=outputs)
+
+
+# =======================
+# Server
+# =======================
+
+class RequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        service = self.server.service
+        for line in self.rfile:
+            request = {}
+            with service.busy():
+                try:
+                    request = json.loads(line)
+                    response = service.handle(request)
+                except Exception as e:
+                    response = {"ok": False, "error": f"{type(e).__name__}: {e}"}
+            try:
+                self.wfile.write(json.dumps(response).encode("utf-8") + b"\n")
+            except OSError:
+                return      # the client went away
+            if request.get("op") == "shutdown":
+                threading.Thread(target=self.server.shutdown, daemon=True).start()
+                return
+
+
+class DaemonServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def serve(socket_path=SOCKET_PATH, idle_timeout: float = IDLE_TIMEOUT) -> int:
+    socket_path = Path(socket_path)
+    socket_path.parent.mkdir(parents=True, exist_ok=True)
+    # held for the daemon's lifetime, so two clients starting one at once get one daemon
+    lock_file = open(f"{socket_path}.lock", "w")
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        print(f"a daemon already serves {socket_path}", file=sys.stderr)
+        return 1
+    # with the lock held, a socket file left here belongs to a daemon that died
+    try:
+        socket_path.unlink()
+    except FileNotFoundError:
+        pass
+
+    service = CompileService()
+    old_umask = os.umask(0o177)     # the socket is for this user only
+    try:
+        server = DaemonServer(str(socket_path), RequestHandler)
+    finally:
+        os.umask(old_umask)
+    server.service = service
+    signal.signal(signal.SIGTERM, lambda signum, frame: threading.Thread(target=server.shutdown).start())
+
+    stopped = threading.Event()
+
+    def watch_idle():
+        while not stopped.wait(min(60.0, idle_timeout)):
+            if service.idle_seconds() >= idle_timeout:
+                server.shutdown()
+                return
+    if idle_timeout > 0:
+        threading.Thread(target=watch_idle, name="idle-watch", daemon=True).start()
+    threading.Thread(target=get_parser, name="warm-parser", daemon=True).start()
+    warm_up(Compiler.PREAMBLE)
+
+    print(f"serving {socket_path} (pid {os.getpid()})", file=sys.stderr, flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stopped.set()
+        server.server_close()
+        try:
+            socket_path.unlink()
+        except FileNotFoundError:
+            pass
+        get_scheduler().shutdown()
+        Cache.cleanup_temp_dirs()
+        lock_file.close()
+    return 0
+
+
+# =======================
+# Client
+# =======================
+
+class DaemonClient:
+    """One connection to the daemon; requests on it are answered in order."""
+
+    def __init__(self, socket_path=SOCKET_PATH, timeout: float | None = None):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(timeout)
+        try:
+            self.sock.connect(str(socket_path))
+        except OSError:
+            self.sock.close()
+            raise
+        self.file = self.sock.makefile("rwb")
+        self._lock = threading.Lock()
+
+    def request(self, op: str, **fields) -> dict:
+        line = json.dumps(dict(fields, op=op)).encode("utf-8") + b"\n"
+        with self._lock:
+            self.file.write(line)
+            self.file.flush()
+            reply = self.file.readline()
+        if not reply:
+            raise DaemonError("the compile daemon closed the connection")
+        return json.loads(reply)
+
+    def compile(self, source: str | None = None, path: str | None = None, document: str | None = None,
+                engine: str = "auto", purpose: str = "preview", priority: str = "interactive",
+                retry_failed: bool = False) -> dict:
+        return self.request("compile", source=source, path=path, document=document, engine=engine,
+                            purpose=purpose, priority=priority, retry_failed=retry_failed)
+
+    def close(self):
+        self.file.close()
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def spawn(socket_path=SOCKET_PATH):
+    """Starts a daemon in its own session; its output goes to <socket>.log."""
+    with open(f"{socket_path}.log", "ab") as log:
+        subprocess.Popen([sys.executable, str(DAEMON_SCRIPT), "serve", "--socket", str(socket_path)],
+                         stdin=subprocess.DEVNULL, stdout=log, stderr=log, cwd=DAEMON_SCRIPT.parent,
+                         start_new_session=True)
+
+
+def connect(socket_path=SOCKET_PATH, start: bool = True) -> DaemonClient:
+    """Connects to the daemon, starting one first if none answers and start is set."""
+    try:
+        return DaemonClient(socket_path)
+    except (FileNotFoundError, ConnectionRefusedError):
+        if not start:
+            raise DaemonError(f"no compile daemon at {socket_path}") from None
+    spawn(socket_path)
+    deadline = time.monotonic() + START_TIMEOUT
+    while True:
+        try:
+            return DaemonClient(socket_path)
+        except (FileNotFoundError, ConnectionRefusedError):
+            if time.monotonic() > deadline:
+                raise DaemonError(f"the compile daemon did not start; see {socket_path}.log") from None
+            time.sleep(0.05)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="daemon", description="shared compile service")
+    parser.add_argument("command", choices=["serve", "status", "stop"])
+    parser.add_argument("--socket", default=str(SOCKET_PATH), help="Unix socket (default: latex_files/daemon.sock)")
+    parser.add_argument("--idle-timeout", type=float, default=IDLE_TIMEOUT,
+                        help="seconds without requests before exiting; 0 serves until stopped")
+    args = parser.parse_args(argv)
+
+    if args.command == "serve":
+        return serve(args.socket, args.idle_timeout)
+    try:
+        client = connect(args.socket, start=False)
+    except DaemonError as e:
+        print(e, file=sys.stderr)
+        return 1
+    with client:
+        if args.command == "status":
+            print(json.dumps(client.request("stats"), indent=2))
+        else:
+            reply = client.request("shutdown")
+            print(f"stopped daemon {reply['pid']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
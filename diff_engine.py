@@ -0,0 +1,220 @@
+from bisect import bisect_right
+
+
+# =======================
+# Myers O(ND) diff
+# =======================
+#
+# Linear-space variant: each step finds the middle of an optimal edit path
+# with a forward and a backward search that meet halfway, then solves the
+# two halves. Memory is O(N + M) instead of the (N+1) x (M+1) LCS table.
+
+def _common_prefix(a, alo, ahi, b, blo, bhi):
+    i = 0
+    while alo + i < ahi and blo + i < bhi and a[alo + i] == b[blo + i]:
+        i += 1
+    return i
+
+
+def _common_suffix(a, alo, ahi, b, blo, bhi):
+    i = 0
+    while ahi - i > alo and bhi - i > blo and a[ahi - i - 1] == b[bhi - i - 1]:
+        i += 1
+    return i
+
+
+def _bisect(a, alo, ahi, b, blo, bhi):
+    """Returns a point (x, y) on an optimal edit path, or None if a and b share nothing."""
+    n = ahi - alo
+    m = bhi - blo
+    max_d = (n + m + 1) // 2
+    v_offset = max_d
+    v_length = 2 * max_d + 2
+    v1 = [-1] * v_length
+    v2 = [-1] * v_length
+    v1[v_offset + 1] = 0
+    v2[v_offset + 1] = 0
+    delta = n - m
+    # with an odd delta the forward path is the one that can reach the overlap
+    front = delta % 2 != 0
+    k1start = k1end = k2start = k2end = 0
+    for d in range(max_d):
+        for k1 in range(-d + k1start, d + 1 - k1end, 2):
+            k1_offset = v_offset + k1
+            if k1 == -d or (k1 != d and v1[k1_offset - 1] < v1[k1_offset + 1]):
+                x1 = v1[k1_offset + 1]
+            else:
+                x1 = v1[k1_offset - 1] + 1
+            y1 = x1 - k1
+            while x1 < n and y1 < m and a[alo + x1] == b[blo + y1]:
+                x1 += 1
+                y1 += 1
+            v1[k1_offset] = x1
+            if x1 > n:
+                k1end += 2
+            elif y1 > m:
+                k1start += 2
+            elif front:
+                k2_offset = v_offset + delta - k1
+                if 0 <= k2_offset < v_length and v2[k2_offset] != -1:
+                    if x1 >= n - v2[k2_offset]:
+                        return x1, y1
+
+        for k2 in range(-d + k2start, d + 1 - k2end, 2):
+            k2_offset = v_offset + k2
+            if k2 == -d or (k2 != d and v2[k2_offset - 1] < v2[k2_offset + 1]):
+                x2 = v2[k2_offset + 1]
+            else:
+                x2 = v2[k2_offset - 1] + 1
+            y2 = x2 - k2
+            while x2 < n and y2 < m and a[ahi - x2 - 1] == b[bhi - y2 - 1]:
+                x2 += 1
+                y2 += 1
+            v2[k2_offset] = x2
+            if x2 > n:
+                k2end += 2
+            elif y2 > m:
+                k2start += 2
+            elif not front:
+                k1_offset = v_offset + delta - k2
+                if 0 <= k1_offset < v_length and v1[k1_offset] != -1:
+                    x1 = v1[k1_offset]
+                    y1 = v_offset + x1 - k1_offset
+                    if x1 >= n - x2:
+                        return x1, y1
+    return None
+
+
+def matching_blocks(a, b):
+    """
+    Returns (i, j, size) runs with a[i:i+size] == b[j:j+size], in order,
+    along a shortest edit script. a and b are sequences of hashable items.
+    """
+    blocks = []
+    stack = [(0, len(a), 0, len(b))]
+    while stack:
+        alo, ahi, blo, bhi = stack.pop()
+        prefix = _common_prefix(a, alo, ahi, b, blo, bhi)
+        if prefix:
+            blocks.append((alo, blo, prefix))
+            alo += prefix
+            blo += prefix
+        suffix = _common_suffix(a, alo, ahi, b, blo, bhi)
+        if suffix:
+            blocks.append((ahi - suffix, bhi - suffix, suffix))
+            ahi -= suffix
+            bhi -= suffix
+        if alo == ahi or blo == bhi:
+            continue
+        split = _bisect(a, alo, ahi, b, blo, bhi)
+        if split is None:
+            continue
+        x, y = split
+        stack.append((alo, alo + x, blo, blo + y))
+        stack.append((alo + x, ahi, blo + y, bhi))
+    blocks.sort()
+    # merge runs that touch
+    merged = []
+    for i, j, size in blocks:
+        if merged and merged[-1][0] + merged[-1][2] == i and merged[-1][1] + merged[-1][2] == j:
+            pi, pj, psize = merged[-1]
+            merged[-1] = (pi, pj, psize + size)
+        else:
+            merged.append((i, j, size))
+    return merged
+
+
+def edit_ranges(a, b):
+    """Returns (i1, i2, j1, j2) ranges where a[i1:i2] was replaced by b[j1:j2]."""
+    ranges = []
+    i = j = 0
+    for bi, bj, size in matching_blocks(a, b) + [(len(a), len(b), 0)]:
+        if i < bi or j < bj:
+            ranges.append((i, bi, j, bj))
+        i = bi + size
+        j = bj + size
+    return ranges
+
+
+# =======================
+# Change detection
+# =======================
+
+class Change:
+    """old[old_start:old_end] became new[new_start:new_end] (character offsets)."""
+    __slots__ = ("old_start", "old_end", "new_start", "new_end")
+
+    def __init__(self, old_start, old_end, new_start, new_end):
+        self.old_start = old_start
+        self.old_end = old_end
+        self.new_start = new_start
+        self.new_end = new_end
+
+    def __eq__(self, other):
+        return isinstance(other, Change) and self.as_tuple() == other.as_tuple()
+
+    def as_tuple(self):
+        return self.old_start, self.old_end, self.new_start, self.new_end
+
+    def __repr__(self):
+        return f"Change(old={self.old_start}:{self.old_end}, new={self.new_start}:{self.new_end})"
+
+
+# character-level refinement only runs on hunks up to this size
+REFINE_LIMIT = 4096
+
+
+def _line_offsets(lines):
+    offsets = [0]
+    for line in lines:
+        offsets.append(offsets[-1] + len(line))
+    return offsets
+
+
+def changed_ranges(old: str, new: str, refine: bool = True):
+    """
+    Returns the Changes that turn old into new. The diff runs on lines first;
+    each changed hunk is then narrowed down with a character-level diff.
+    """
+    old_lines = old.splitlines(keepends=True)
+    new_lines = new.splitlines(keepends=True)
+    # compare lines as small ints
+    ids = {}
+    a = [ids.setdefault(line, len(ids)) for line in old_lines]
+    b = [ids.setdefault(line, len(ids)) for line in new_lines]
+    old_offsets = _line_offsets(old_lines)
+    new_offsets = _line_offsets(new_lines)
+
+    changes = []
+    for i1, i2, j1, j2 in edit_ranges(a, b):
+        os_, oe = old_offsets[i1], old_offsets[i2]
+        ns, ne = new_offsets[j1], new_offsets[j2]
+        if refine and oe - os_ <= REFINE_LIMIT and ne - ns <= REFINE_LIMIT:
+            old_hunk = old[os_:oe]
+            new_hunk = new[ns:ne]
+            for c1, c2, d1, d2 in edit_ranges(old_hunk, new_hunk):
+                changes.append(Change(os_ + c1, os_ + c2, ns + d1, ns + d2))
+        else:
+            prefix = _common_prefix(old, os_, oe, new, ns, ne)
+            suffix = _common_suffix(old, os_ + prefix, oe, new, ns + prefix, ne)
+            changes.append(Change(os_ + prefix, oe - suffix, ns + prefix, ne - suffix))
+    return changes
+
+
+def dirty_spans(spans, changes):
+    """
+    Returns the indices of the (start, end) spans of the new text that
+    overlap a change, found by binary search over the span starts.
+    """
+    starts = [start for start, _ in spans]
+    dirty = set()
+    for change in changes:
+        if change.new_start == change.new_end:
+            # a pure deletion touches the spans on both sides of the cut
+            lo, hi = max(change.new_start - 1, 0), change.new_start
+        else:
+            lo, hi = change.new_start, change.new_end - 1
+        first = max(bisect_right(starts, lo) - 1, 0)
+        last = max(bisect_right(starts, hi) - 1, 0)
+        dirty.update(range(first, last + 1))
+    return sorted(dirty)
@@ -0,0 +1,222 @@
+"""
+TeX engine backends.
+
+    pdflatex   pdflatex with the precompiled preamble format, rerun only while
+               the .aux changes -> PDF
+    dvisvgm    latex -> DVI -> dvisvgm, one SVG per page (the route in
+               compilation_process.json) -> quick previews
+    latexmk    latexmk -pdf, which reruns pdflatex until references settle
+
+Each engine declares its capabilities and default timeout, and records how
+long its successful runs take per size class of the .tex file. choose_engine
+picks one per job: a named engine, or with "auto" the engine that was
+fastest on documents of that size and can serve the job ("preview" takes
+PDF or SVG, "export" needs PDF). Exports now and then try an installed
+engine that has not been measured at that size yet; previews never do, so
+live preview output does not switch format at random.
+"""
+import abc
+import json
+import math
+import os
+import random
+import shutil
+import threading
+from pathlib import Path
+
+from cache import Cache
+from tex_worker import PDFLATEX, CompileResult, compile_tex, run_command, run_passes
+
+LATEX = "latex"
+DVISVGM = "dvisvgm"
+LATEXMK = "latexmk"
+
+TIMINGS_PATH = Cache.ROOT / "engine_timings.json"
+
+# capabilities a job needs, by purpose
+PURPOSES = {
+    "preview": frozenset({"pdf", "svg"}),
+    "export": frozenset({"pdf"}),
+}
+
+
+# =======================
+# Timings
+# =======================
+
+def size_class(tex_bytes: int) -> str:
+    """Groups .tex sizes by powers of 4 KB: "0" up to 1 KB, "1" up to 4 KB, ..."""
+    return str(max(0, math.ceil(math.log(max(tex_bytes, 1) / 1024, 4))))
+
+
+class EngineTimings:
+    """
+    Moving average of successful run times per engine and size class, kept
+    on disk, so engines are only compared on documents of similar size.
+    """
+    SMOOTHING = 0.3
+
+    def __init__(self, path: Path | None = None):
+        self.path = path or TIMINGS_PATH
+        self._lock = threading.Lock()
+        self.timings = self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                timings = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        # drops the old per-engine means, which mixed every document size
+        return {engine: classes for engine, classes in timings.items() if "mean" not in classes}
+
+    def record(self, engine: str, elapsed: float, tex_bytes: int):
+        with self._lock:
+            classes = self.timings.setdefault(engine, {})
+            entry = classes.get(size_class(tex_bytes))
+            if entry is None:
+                entry = classes[size_class(tex_bytes)] = {"mean": elapsed, "runs": 0}
+            entry["mean"] += self.SMOOTHING * (elapsed - entry["mean"])
+            entry["runs"] += 1
+            try:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                tmp_path = self.path.with_suffix(f".{os.getpid()}.tmp")
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump(self.timings, f)
+                os.replace(tmp_path, self.path)
+            except OSError:
+                pass
+
+    def mean(self, engine: str, tex_bytes: int) -> float | None:
+        entry = self.timings.get(engine, {}).get(size_class(tex_bytes))
+        return entry["mean"] if entry else None
+
+
+TIMINGS = EngineTimings()
+
+
+# =======================
+# Engines
+# =======================
+
+class Engine(abc.ABC):
+    name = ""
+    label = ""
+    programs = ()
+    capabilities = frozenset()
+    timeout = 30
+
+    def available(self) -> bool:
+        return all(shutil.which(program) for program in self.programs)
+
+    def run(self, workdir, tex_filename: str, preamble: str | None = None, timeout: int | None = None,
+            on_process=None) -> CompileResult:
+        tex_bytes = os.path.getsize(Path(workdir) / tex_filename)
+        result = self._run(Path(workdir), tex_filename, preamble, timeout or self.timeout, on_process)
+        if result.ok:
+            TIMINGS.record(self.name, result.elapsed, tex_bytes)
+        return result
+
+    @abc.abstractmethod
+    def _run(self, workdir, tex_filename, preamble, timeout, on_process) -> CompileResult:
+        """Runs the engine on workdir/tex_filename."""
+
+
+class PdfLatexEngine(Engine):
+    name = "pdflatex"
+    label = "pdflatex (PDF)"
+    programs = (PDFLATEX,)
+    capabilities = frozenset({"pdf", "format"})
+
+    def _run(self, workdir, tex_filename, preamble, timeout, on_process):
+        return compile_tex(workdir, tex_filename, preamble, timeout, on_process)
+
+
+class DviSvgEngine(Engine):
+    name = "dvisvgm"
+    label = "latex + dvisvgm (SVG)"
+    programs = (LATEX, DVISVGM)
+    capabilities = frozenset({"svg"})
+
+    def _run(self, workdir, tex_filename, preamble, timeout, on_process):
+        stem = os.path.splitext(tex_filename)[0]
+        for old in workdir.glob(f"{stem}-*.svg"):
+            old.unlink()
+        steps = {}
+        command = [LATEX, "-interaction=nonstopmode", "-halt-on-error", tex_filename]
+        returncode, output, steps[LATEX], passes = run_passes(
+            lambda: run_command(command, workdir, timeout, on_process=on_process), workdir, stem
+        )
+        if returncode == 0:
+            svg_code, svg_output, steps[DVISVGM] = run_command(
+                [DVISVGM, "--no-fonts", "--page=1-", f"{stem}.dvi", "-o", f"{stem}-%p.svg"], workdir, timeout,
+                on_process=on_process
+            )
+            returncode, output = svg_code, output + svg_output
+        outputs = sorted((str(p) for p in workdir.glob(f"{stem}-*.svg")), key=_page_number)
+        return CompileResult(returncode, output, None, sum(steps.values()), False, self.name, outputs, steps,
+                             passes, str(workdir / f"{stem}.log"))
+
+
+class LatexmkEngine(Engine):
+    name = "latexmk"
+    label = "latexmk (PDF, reruns)"
+    programs = (LATEXMK, PDFLATEX)
+    capabilities = frozenset({"pdf", "reruns"})
+    timeout = 120
+
+    def _run(self, workdir, tex_filename, preamble, timeout, on_process):
+        stem = os.path.splitext(tex_filename)[0]
+        pdf_path = str(workdir / f"{stem}.pdf")
+        returncode, output, elapsed = run_command(
+            [LATEXMK, "-pdf", "-interaction=nonstopmode", "-halt-on-error", "-synctex=1", tex_filename], workdir,
+            timeout,
+            on_process=on_process
+        )
+        return CompileResult(returncode, output, pdf_path, elapsed, False, self.name,
+                             log_path=str(workdir / f"{stem}.log"))
+
+
+def _page_number(path: str) -> int:
+    page = path.rsplit("-", 1)[-1].split(".", 1)[0]
+    return int(page) if page.isdigit() else 0
+
+
+ENGINES = {engine.name: engine for engine in (PdfLatexEngine(), DviSvgEngine(), LatexmkEngine())}
+DEFAULT_ENGINE = "pdflatex"
+# share of "auto" choices that try an engine not yet measured at that size,
+# for these purposes only
+EXPLORE_RATE = 0.1
+EXPLORE_PURPOSES = frozenset({"export"})
+
+
+def choose_engine(purpose: str = "preview", name: str = "auto", tex_bytes: int = 0) -> Engine:
+    """
+    Returns the engine named, or for "auto" the installed engine with a
+    capability the purpose needs that was fastest on .tex files in the size
+    class of tex_bytes (pdflatex until one has been measured there). For
+    purposes in EXPLORE_PURPOSES it returns, with probability EXPLORE_RATE,
+    an installed engine that has no timing in that class yet instead, so
+    new engines get measured.
+    """
+    if name != "auto":
+        engine = ENGINES.get(name)
+        if engine is None:
+            raise ValueError(f"unknown engine {name!r}; choose from {', '.join(ENGINES)}")
+        if not engine.capabilities & PURPOSES[purpose]:
+            raise ValueError(f"engine {name!r} cannot produce output for {purpose}")
+        return engine
+    measured = {}
+    unmeasured = []
+    for engine in ENGINES.values():
+        if engine.capabilities & PURPOSES[purpose] and engine.available():
+            mean = TIMINGS.mean(engine.name, tex_bytes)
+            if mean is None:
+                unmeasured.append(engine)
+            else:
+                measured[engine] = mean
+    if not measured:
+        return ENGINES[DEFAULT_ENGINE]
+    if unmeasured and purpose in EXPLORE_PURPOSES and random.random() < EXPLORE_RATE:
+        return random.choice(unmeasured)
+    return min(measured, key=measured.get)
@@ -0,0 +1,146 @@
+"""
+Line-oriented fast path for the source dialect.
+
+Most documents are made of whole-line constructs: headers (`#`, `##`,
+`###` at the start of a line), list items (`*`), command blocks between
+`!`s and plain text lines. parse_blocks reads those straight into a flat
+list of (rule, payload) tuples, without building a Lark tree per word, and
+emit writes the same LaTeX Compiler writes for the equivalent tree.
+
+Anything the line rules cannot decide on their own -- a marker in the
+middle of a line, text after a closing `!`, characters outside TEXT,
+malformed headers -- makes parse_blocks return None, and the caller hands
+the text to Lark, which either parses it or raises the usual error.
+benchmarks/check_fastpath.py checks that both paths agree byte for byte.
+"""
+import re
+
+from compiler import Parser, Compiler, LineMap
+
+# the TEXT terminal of grammar.ebnf; no markers, no newlines
+TEXT = re.compile(r"[a-zA-Z0-9,.?^_=()+\- $\\{}<>[\]-]+")
+COMMAND_BODY = re.compile(r"[a-zA-Z0-9,.?^_=()+\- $\\{}<>[\]\n-]+")
+
+HEADERS = (None, "h1", "h2", "h3")
+
+
+def parse_blocks(text: str, starts=None):
+    """
+    Returns the top-level elements of text as a list of tuples, or None if
+    the text needs the full parser:
+        ("h1" | "h2" | "h3", header text)
+        ("list", [item text, ...])
+        ("command_block", body)
+        ("paragraph", [line with its newlines, ...])
+    Given a list as starts, appends the source offset of each element.
+    """
+    blocks = []
+    n = len(text)
+    pos = 0
+    text_match = TEXT.fullmatch
+    while pos < n:
+        eol = text.find("\n", pos)
+        if eol == -1:
+            eol = n
+        end = eol
+        while end < n and text[end] == "\n":
+            end += 1
+        head = text[pos]
+
+        if head == "#":
+            level = 1
+            while level < 4 and pos + level < eol and text[pos + level] == "#":
+                level += 1
+            if level > 3 or not text_match(text, pos + level, eol):
+                return None
+            blocks.append((HEADERS[level], text[pos + level:eol]))
+
+        elif head == "*":
+            if not text_match(text, pos + 1, eol):
+                return None
+            item = text[pos + 1:eol]
+            if blocks and blocks[-1][0] == "list":
+                blocks[-1][1].append(item)
+            else:
+                blocks.append(("list", [item]))
+
+        elif head == "!":
+            close = text.find("!", pos + 1)
+            if close == -1 or not COMMAND_BODY.fullmatch(text, pos + 1, close):
+                return None
+            eol = text.find("\n", close)
+            if eol == -1:
+                eol = n
+            if eol != close + 1:
+                # something follows the closing `!` on its line
+                return None
+            end = eol
+            while end < n and text[end] == "\n":
+                end += 1
+            blocks.append(("command_block", text[pos + 1:close]))
+
+        elif text_match(text, pos, eol):
+            line = text[pos:end]
+            if blocks and blocks[-1][0] == "paragraph":
+                blocks[-1][1].append(line)
+            else:
+                blocks.append(("paragraph", [line]))
+
+        else:
+            # leading newlines, a marker mid-line, or characters Lark rejects
+            return None
+        if starts is not None and len(starts) < len(blocks):
+            starts.append(pos)
+        pos = end
+    return blocks
+
+
+def emit(blocks, write, rules=Compiler.RULES):
+    """Writes the LaTeX for parse_blocks output, exactly as Compiler.emit would for the tree."""
+    for rule, payload in blocks:
+        prefix, suffix, _ = rules[rule]
+        if rule == "list":
+            item_prefix, item_suffix, _ = rules["item"]
+            write(prefix)
+            for item in payload:
+                write(item_prefix + item + item_suffix)
+            write(suffix)
+        elif rule == "paragraph":
+            write("".join(payload) + suffix)
+        else:
+            write(prefix + payload + suffix)
+
+
+def emit_document(blocks, starts, write, compiler: Compiler, source_length=None):
+    """Writes the whole document for parse_blocks output, recording compiler.line_map."""
+    write(compiler.PREAMBLE + compiler.BEGIN_DOCUMENT)
+    compiler.line_map = line_map = LineMap()
+    tex_line = compiler.body_line()
+    for block, start in zip(blocks, starts):
+        parts = []
+        emit((block,), parts.append, compiler.RULES)
+        text = "".join(parts)
+        line_map.add(start, tex_line)
+        write(text)
+        tex_line += text.count("\n")
+    line_map.close(tex_line, source_length)
+    write(compiler.END_DOCUMENT)
+
+
+def compile_to(text: str, fp, parser: Parser | None = None, compiler: Compiler | None = None, document=True):
+    """
+    Writes the LaTeX for text into fp, through the fast path when it can
+    take the whole text and through Lark otherwise. With document set,
+    compiler.line_map describes the result.
+    """
+    compiler = compiler or Compiler()
+    starts = []
+    blocks = parse_blocks(text, starts)
+    if blocks is None:
+        tree = (parser or Parser()).parse(text)
+        compiler.compile_to(tree, fp, document)
+        return
+    if document:
+        emit_document(blocks, starts, fp.write, compiler, len(text))
+    else:
+        emit(blocks, fp.write, compiler.RULES)
@@ -0,0 +1,152 @@
+import os
+import hashlib
+import shutil
+import tempfile
+import threading
+from pathlib import Path
+
+from cache import Cache
+from compiler import Parser, Compiler, Node
+from engines import LATEX, DVISVGM
+from incremental import split_blocks
+from scheduler import Priority, get_scheduler
+from tex_worker import run_command
+
+FRAGMENT_DIR = Cache.ROOT / "fragments"
+
+STANDALONE_PREAMBLE = Compiler.PREAMBLE.replace(
+    "\\documentclass{article}", "\\documentclass[preview]{standalone}", 1
+)
+
+
+# =======================
+# Extraction
+# =======================
+
+def iter_command_blocks(source: str, parser: Parser | None = None):
+    """Yields the compiled LaTeX of every ! ... ! command block in source, in order."""
+    parser = parser or Parser()
+    compiler = Compiler()
+    for block in split_blocks(source):
+        if "!" not in block.text:
+            continue
+        tree = parser.parse(block.text)
+        elements = tree.children if isinstance(tree, Node) and tree.data == "document" else [tree]
+        for element in elements:
+            if isinstance(element, Node) and element.data == "command_block":
+                yield compiler.compile_fragment(element)
+
+
+def standalone_document(fragment_latex: str) -> str:
+    return STANDALONE_PREAMBLE + Compiler.BEGIN_DOCUMENT + fragment_latex + Compiler.END_DOCUMENT
+
+
+def fragment_key(fragment_latex: str) -> str:
+    return hashlib.sha256(standalone_document(fragment_latex).encode()).hexdigest()
+
+
+# =======================
+# Rendering
+# =======================
+
+class FragmentError(RuntimeError):
+    pass
+
+
+class FragmentRenderer:
+    """
+    Renders command blocks to SVG as standalone documents, in parallel on
+    the shared scheduler. SVGs are cached under Cache.ROOT/fragments by
+    content hash, so only fragments whose LaTeX changed are rendered again;
+    the least recently used ones are deleted beyond max_bytes.
+    """
+    DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+    def __init__(self, root: Path | None = None, timeout: int = 30, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.root = root or FRAGMENT_DIR
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.timeout = timeout
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+    def svg_path(self, key: str) -> Path:
+        return self.root / f"{key}.svg"
+
+    def cached(self, key: str) -> Path | None:
+        path = self.svg_path(key)
+        try:
+            os.utime(path)       # mtime doubles as last use for trim()
+        except FileNotFoundError:
+            return None
+        return path
+
+    def render(self, fragment_latex: str, on_process=None) -> Path:
+        key = fragment_key(fragment_latex)
+        if self.cached(key) is not None:
+            return self.svg_path(key)
+        path = self.svg_path(key)
+        with tempfile.TemporaryDirectory(prefix="fragment-") as workdir:
+            with open(os.path.join(workdir, "fragment.tex"), "w", encoding="utf-8") as f:
+                f.write(standalone_document(fragment_latex))
+            self._run([LATEX, "-interaction=nonstopmode", "-halt-on-error", "fragment.tex"], workdir, on_process)
+            self._run([DVISVGM, "--no-fonts", "fragment.dvi", "-o", "fragment.svg"], workdir, on_process)
+            tmp_path = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+            shutil.move(os.path.join(workdir, "fragment.svg"), tmp_path)
+            os.replace(tmp_path, path)
+        return path
+
+    def _run(self, command, workdir, on_process=None):
+        returncode, output, _ = run_command(command, workdir, self.timeout, on_process=on_process)
+        if returncode != 0:
+            raise FragmentError(output)
+
+    def submit(self, fragment_latex: str):
+        """
+        Schedules a render and returns its scheduler job; concurrent requests
+        for the same fragment share one job, whose TeX process a cancel kills.
+        """
+        return get_scheduler().submit(lambda job: self.render(fragment_latex, job.attach), Priority.FRAGMENT,
+                                      key=("fragment", fragment_key(fragment_latex)))
+
+    def submit_all(self, fragments):
+        return [self.submit(f) for f in fragments]
+
+    @staticmethod
+    def cancel(jobs):
+        for job in jobs:
+            get_scheduler().cancel(job)
+
+    def collect(self, jobs):
+        """Waits for jobs from submit_all; returns a Path or FragmentError per fragment."""
+        results = []
+        for job in jobs:
+            try:
+                results.append(job.future.result())
+            except Exception as e:
+                results.append(e if isinstance(e, FragmentError) else FragmentError(str(e) or type(e).__name__))
+        self.trim()
+        return results
+
+    def render_all(self, fragments):
+        """Renders every fragment in parallel; returns a list of Path or FragmentError per fragment."""
+        return self.collect(self.submit_all(fragments))
+
+    def trim(self):
+        """Deletes the least recently used SVGs beyond max_bytes."""
+        with self._lock:
+            entries = []
+            for path in self.root.glob("*.svg"):
+                try:
+                    stat = path.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    path.unlink()
+                except FileNotFoundError:
+                    pass
+                total -= size
@@ -1,26 +1,102 @@
+import time
+STARTUP_T0 = time.perf_counter()    # startup stages are timed from here
+
 import sys
 import json
+import html
+import threading
+import uuid
 from enum import Enum, auto
 import os
-import uuid
-import hashlib
 from pathlib import Path
-import shutil
-import subprocess
 
 from PyQt5.QtWidgets import (
     QApplication, QMainWindow, QWidget,
     QVBoxLayout, QHBoxLayout,
-    QTextEdit, QPushButton,
-    QSplitter, QFileDialog, QAction, QInputDialog, QMenu, QFontDialog
+    QTextEdit, QPushButton, QScrollBar,
+    QSplitter, QFileDialog, QAction, QActionGroup, QInputDialog, QMenu, QFontDialog, QLabel
 )
-from PyQt5.QtCore import Qt, QUrl, QObject, QThread, pyqtSignal
-from PyQt5.QtWebEngineWidgets import QWebEngineView, QWebEngineSettings
-from PyQt5.QtGui import QFont
-from compiler import Parser, Compiler
+from PyQt5.QtCore import Qt, QUrl, QObject, QThread, QTimer, pyqtSignal
+from PyQt5.QtGui import QFont, QTextCursor
+from compiler import Compiler, get_parser
+from incremental import IncrementalCompiler
+from cache import Cache, CacheJanitor, PdfCache, HashingWriter, get_janitor, remove_intermediates
+from tex_worker import submit_compile, warm_up
+from scheduler import Priority, get_scheduler
+from engines import ENGINES, choose_engine
+from profiler import Profile
+from piece_table import PieceTable
+from streaming import compile_chunks
+from fragments import FragmentRenderer, FragmentError, fragment_key, iter_command_blocks
+from saving import Buffer, SaveQueue
+import page_cache
+from page_cache import PageRasterizer
+from texlog import LogCache, LogEntry, read_log
+import synctex
 
 THEMES_PATH = Path("src/themes.json")
 GUI_STATE_PATH = Path("src/gui_state_cache.json")
+LIVE_PREVIEW_DELAY_MS = 400
+# files this large are opened through a piece table and shown a window of lines at a time
+LARGE_FILE_BYTES = 4 * 1024 * 1024
+WINDOW_LINES = 2000
+AUTOSAVE_INTERVAL_MS = 30_000
+# with this set, the app prints its startup profile as JSON once warm and exits (benchmarks/bench_startup.py)
+STARTUP_PROBE_ENV = "LATEX_APP_STARTUP_PROBE"
+# compiler output shown when the TeX log has nothing to report
+ERROR_TAIL_LINES = 40
+# pages rendered first when the page preview opens, before the view can say which are visible
+INITIAL_PAGES = 3
+
+# PDF preview as page images; pages are swapped in place so the scroll position stays
+PAGE_VIEW_HTML = """
+<html>
+<head>
+<style>
+    body { background:#525659; margin:0; }
+    img { display:block; margin:10px auto; background:white; max-width:100%; }
+</style>
+<script>
+function setPage(i, src) {
+    var img = document.getElementById('page-' + i);
+    if (img === null) {
+        img = document.createElement('img');
+        img.id = 'page-' + i;
+        document.body.appendChild(img);
+    }
+    img.src = src;
+}
+function trimPages(n) {
+    var pages = document.getElementsByTagName('img');
+    for (var i = pages.length - 1; i >= n; i--) pages[i].remove();
+}
+function scrollToPoint(i, y) {
+    var img = document.getElementById('page-' + i);
+    if (img === null || !img.naturalHeight) return;
+    var top = img.offsetTop + y * window.pageDpi / 72 * img.height / img.naturalHeight;
+    window.scrollTo(0, top - window.innerHeight / 3);
+}
+// double click: ask for the source of that point, in PDF points
+document.addEventListener('dblclick', function (event) {
+    var img = event.target;
+    if (img.tagName !== 'IMG' || !img.width) return;
+    var scale = img.naturalWidth / img.width * 72 / window.pageDpi;
+    var page = parseInt(img.id.slice(5), 10) + 1;
+    window.location.href = 'synctex:' + page + ':' + event.offsetX * scale + ':' + event.offsetY * scale;
+});
+function visiblePages() {
+    var pages = document.getElementsByTagName('img'), visible = [];
+    for (var i = 0; i < pages.length; i++) {
+        var rect = pages[i].getBoundingClientRect();
+        if (rect.bottom > 0 && rect.top < window.innerHeight) visible.push(i);
+    }
+    return visible;
+}
+</script>
+</head>
+<body></body>
+</html>
+"""
 
 
 # =======================
@@ -45,17 +121,24 @@ class ThemeManager:
             return json.load(f)
 
     def _load_state(self):
+        self._saved_text = None
         if self.state_path.exists():
             with open(self.state_path, "r", encoding="utf-8") as f:
                 state = json.load(f)
+            self._saved_text = json.dumps(state, indent=2)
             state.setdefault("theme", self.default_theme)
             state.setdefault("font", None)
             return state
         return {"theme": self.default_theme, "font": None}
 
     def _save_state(self):
+        # apply() runs at every start; only write when the state really changed
+        text = json.dumps(self.state, indent=2)
+        if text == self._saved_text:
+            return
         with open(self.state_path, "w", encoding="utf-8") as f:
-            json.dump(self.state, f, indent=2)
+            f.write(text)
+        self._saved_text = text
 
     # ---------- Style ----------
     def build_stylesheet(self, theme_name: str) -> str:
@@ -152,84 +235,217 @@ class MenuOptions(Enum):
 
 
 # =======================
-# Cache
+# Compile Worker
 # =======================
 
-class Cache:
-    ROOT = Path("/home/tash/pythonProds/latex_app/latex_files")
-    _temp_dirs = set()
+class CompileWorker(QObject):
+    """
+    Runs one preview compile as an interactive job on the shared scheduler
+    and reports back through signals, which Qt delivers on the GUI thread.
+    """
+    success = pyqtSignal(list)      # output paths: one PDF, or one SVG per page
+    failed = pyqtSignal(list)       # texlog.LogEntry objects from the TeX log
+    error = pyqtSignal(str)
+    aborted = pyqtSignal()
+    finished = pyqtSignal()
 
-    def __init__(self, source_path: str | None = None):
-        Cache.ROOT.mkdir(parents=True, exist_ok=True)
-        self.temp = source_path is None
+    def __init__(self, workdir, tex_filename, pdf_path, pdf_cache=None, cache_key=None, revision=0,
+                 profile=None, engine=None, log_cache=None):
+        super().__init__()
+        self.log_cache = log_cache
+        self.engine = engine
+        self.profile = profile
+        self.workdir = workdir
+        self.tex_filename = tex_filename
+        self.pdf_path = pdf_path
+        self.pdf_cache = pdf_cache
+        self.cache_key = cache_key
+        self.revision = revision
+        self.job = None
+        self._cancelled = False
+
+    def start(self):
+        # identical LaTeX compiled again in this workdir while a run is pending shares that run
+        self.job = submit_compile(self.workdir, self.tex_filename, Compiler.PREAMBLE,
+                                  Priority.INTERACTIVE, key=self.cache_key, engine=self.engine)
+        self.job.future.add_done_callback(self._done)
+
+    def cancel(self):
+        """
+        Drops the job, killing its pdflatex once no one else waits on it and
+        waiting for it to stop, so main.tex can be rewritten. Safe to call
+        from the GUI thread.
+        """
+        if self._cancelled:
+            return
+        self._cancelled = True
+        if self.job is not None:
+            get_scheduler().cancel(self.job)
 
-        if self.temp:
-            self.id = str(uuid.uuid4())
-            Cache._temp_dirs.add(self.id)
-        else:
-            abs_path = str(Path(source_path).resolve())
-            self.id = hashlib.sha256(abs_path.encode()).hexdigest()[:16]
+    def _done(self, future):
+        try:
+            if self._cancelled or future.cancelled():
+                self.aborted.emit()
+                return
+            result = future.result()
+            if self._cancelled:
+                self.aborted.emit()
+                return
+            if self.profile is not None:
+                self.profile.record("queue", self.job.wait_seconds, depth=get_scheduler().queue_depth())
+                out_size = sum(os.path.getsize(p) for p in result.outputs if os.path.exists(p))
+                for program, seconds in result.steps.items():
+                    self.profile.record(program, seconds, bytes_out=out_size, engine=result.engine,
+                                        warm_format=result.warm, passes=result.passes)
+            if result.returncode != 0:
+                entries = read_log(result.log_path) if result.log_path else []
+                if not any(entry.kind == "error" for entry in entries):
+                    raise RuntimeError("\n".join(result.output.splitlines()[-ERROR_TAIL_LINES:]))
+                if self.log_cache is not None and self.cache_key is not None:
+                    self.log_cache.store(self.cache_key, entries)
+                self.failed.emit(entries)
+                return
+            if not result.ok:
+                raise RuntimeError("Output not created")
+            if self.pdf_cache is not None and self.cache_key is not None and result.pdf_path is not None:
+                try:
+                    self.pdf_cache.store(self.cache_key, result.pdf_path)
+                except OSError as e:
+                    # the compile itself succeeded; only later reuse of its PDF is lost
+                    print(f"warning: PDF not cached: {e}", file=sys.stderr)
+            remove_intermediates(self.workdir)
+            self.success.emit([str(p) for p in result.outputs])
+        except Exception as e:
+            if self._cancelled:
+                self.aborted.emit()
+            else:
+                self.error.emit(str(e))
+        finally:
+            self.finished.emit()
+
+
+class DaemonWorker(QObject):
+    """
+    Runs one preview compile on the shared compile daemon (daemon.py), from
+    a plain thread, with CompileWorker's signals. Cancelling only drops the
+    reply: the daemon cancels the stale job itself once the next revision of
+    the document reaches it.
+    """
+    success = pyqtSignal(list)
+    failed = pyqtSignal(list)
+    error = pyqtSignal(str)
+    aborted = pyqtSignal()
+    finished = pyqtSignal()
+    mapped = pyqtSignal(object)     # compiler.LineMap of the compiled source
+
+    def __init__(self, request, revision=0, profile=None):
+        super().__init__()
+        self.request = request
+        self.revision = revision
+        self.profile = profile
+        self._cancelled = False
 
-        self.base_dir = Cache.ROOT / self.id
-        self.base_dir.mkdir(exist_ok=True)
+    def start(self):
+        threading.Thread(target=self.run, name="daemon-compile", daemon=True).start()
 
-    @property
-    def tex_path(self) -> Path:
-        return self.base_dir / "main.tex"
+    def cancel(self):
+        self._cancelled = True
 
-    @property
-    def pdf_path(self) -> Path:
-        return self.base_dir / "main.pdf"
-
-    def promote(self, source_path: str):
-        if not self.temp:
-            return
-        abs_path = str(Path(source_path).resolve())
-        permanent_id = hashlib.sha256(abs_path.encode()).hexdigest()[:16]
-        permanent_dir = Cache.ROOT / permanent_id
-        permanent_dir.mkdir(exist_ok=True)
-        for item in self.base_dir.iterdir():
-            shutil.copy(item, permanent_dir / item.name)
-        self.id = permanent_id
-        self.base_dir = permanent_dir
-        self.temp = False
-        Cache._temp_dirs.discard(permanent_id)
-
-    @staticmethod
-    def cleanup_temp_dirs():
-        for temp_id in list(Cache._temp_dirs):
-            temp_dir = Cache.ROOT / temp_id
-            shutil.rmtree(temp_dir, ignore_errors=True)
-            Cache._temp_dirs.discard(temp_id)
+    def run(self):
+        try:
+            # imported here, like the web view, so startup does not pay for it
+            from daemon import connect, decode_line_map
+            with connect() as client:
+                reply = client.compile(**self.request)
+            if self._cancelled or reply.get("cancelled"):
+                self.aborted.emit()
+                return
+            if self.profile is not None and reply.get("profile"):
+                for stage in Profile.from_dict(reply["profile"]).stages:
+                    self.profile.record(stage.name, stage.elapsed, stage.bytes_in, stage.bytes_out, stage.cache,
+                                        **stage.args)
+            if reply.get("line_map"):
+                self.mapped.emit(decode_line_map(reply["line_map"]))
+            if reply["ok"]:
+                self.success.emit(reply["outputs"])
+            elif reply.get("errors"):
+                self.failed.emit([LogEntry.from_dict(d) for d in reply["errors"]])
+            else:
+                raise RuntimeError(reply["error"])
+        except Exception as e:
+            if self._cancelled:
+                self.aborted.emit()
+            else:
+                self.error.emit(str(e))
+        finally:
+            self.finished.emit()
 
 
-# =======================
-# Compile Worker
-# =======================
+class SyncNotifier(QObject):
+    """Carries synctex lookups from the scheduler back to the GUI thread."""
+    tex_line_found = pyqtSignal(int, int)           # revision, .tex line (0 if none)
+    pdf_point_found = pyqtSignal(int, int, float)   # revision, page (0 if none), y
 
-class CompileWorker(QObject):
-    success = pyqtSignal(str)
-    error = pyqtSignal(str)
 
-    def __init__(self, workdir, tex_filename, pdf_path):
+class SaveNotifier(QObject):
+    """Carries SaveQueue results from the save thread back to the GUI thread."""
+    saved = pyqtSignal(str, str, str)   # path, content hash, error ("" on success)
+
+    def notify(self, path, saved_hash, error):
+        self.saved.emit(path, saved_hash, error or "")
+
+
+class FragmentWorker(QObject):
+    finished = pyqtSignal(int, list)
+
+    def __init__(self, renderer, fragments, revision=0):
         super().__init__()
-        self.workdir = workdir
-        self.tex_filename = tex_filename
+        self.renderer = renderer
+        self.fragments = fragments
+        self.revision = revision
+        # submitted here, on the GUI thread, so the next revision can cancel them right away
+        self.jobs = renderer.submit_all(fragments)
+
+    def cancel(self):
+        """Drops this revision's renders; fragments the next revision also needs keep running."""
+        self.renderer.cancel(self.jobs)
+
+    def run(self):
+        rendered = []
+        for fragment, result in zip(self.fragments, self.renderer.collect(self.jobs)):
+            if isinstance(result, FragmentError):
+                body = f'<pre style="color:#ff6b6b;">{html.escape(str(result))}</pre>'
+            else:
+                with open(result, "r", encoding="utf-8") as f:
+                    body = f.read()
+            rendered.append((fragment_key(fragment), body))
+        self.finished.emit(self.revision, rendered)
+
+
+class PageWorker(QObject):
+    page_ready = pyqtSignal(int, int, str, str)     # revision, page index, page key, image path
+    finished = pyqtSignal(int, int, str)            # revision, page count, error ("" on success)
+
+    def __init__(self, rasterizer, pdf_path, first, revision, is_current):
+        super().__init__()
+        self.rasterizer = rasterizer
         self.pdf_path = pdf_path
+        self.first = first
+        self.revision = revision
+        self.is_current = is_current
 
     def run(self):
+        count = 0
+        error = ""
         try:
-            result = subprocess.run(
-                ["pdflatex", "-interaction=nonstopmode", "-halt-on-error", self.tex_filename],
-                cwd=self.workdir, capture_output=True, text=True, timeout=30
-            )
-            if result.returncode != 0:
-                raise RuntimeError(result.stdout + "\n" + result.stderr)
-            if not os.path.exists(self.pdf_path):
-                raise RuntimeError("PDF not created")
-            self.success.emit(str(self.pdf_path))
+            for page in self.rasterizer.render(self.pdf_path, self.first):
+                if not self.is_current(self.revision):
+                    break
+                self.page_ready.emit(self.revision, page.index, page.key, str(page.path))
+                count = max(count, page.index + 1)
         except Exception as e:
-            self.error.emit(str(e))
+            error = str(e) or type(e).__name__
+        self.finished.emit(self.revision, count, error)
 
 
 # =======================
@@ -239,15 +455,130 @@ class CompileWorker(QObject):
 class StartWindow(QMainWindow):
     def __init__(self):
         super().__init__()
+        self.startup = Profile("startup")
+        self.startup.record("imports", time.perf_counter() - STARTUP_T0)
+        window_start = time.perf_counter()
+        self.shown_at = None
+        self._pdf_view = None
+        self.parser_thread = None
         self.cache = Cache()
-        self.thread = None
+        self.incremental = IncrementalCompiler()
+        self.pdf_cache = PdfCache()
+        self.log_cache = LogCache()
+        self.line_map = None
         self.worker = None
+        self.threads = set()
+        self.compiles = set()
+        self.revision = 0
+        self.live_preview = False
+        self.preview_engine = "auto"
+        self.fragment_preview = False
+        self.use_daemon = False
+        # names this window's unsaved text to the compile daemon
+        self.daemon_document = f"{os.getpid()}-{uuid.uuid4().hex}"
+        self.fragment_renderer = FragmentRenderer()
+        self.fragment_keys = None
+        self.fragment_worker = None
+        self.page_rasterizer = PageRasterizer() if page_cache.available() else None
+        self.page_keys = None     # keys of the page images shown; None while the view shows anything else
+        self.page_pdf = None
+        self.page_view_loaded = False
+        self.pending_page_js = []
+        self.profile = None
+        self.document = None
+        self.document_saving = False
+        self.window_first = 0
+        self.window_count = 0
+        self.buffer = Buffer()
+        self.pending_promote = None
+        self.save_queue = SaveQueue()
+        self.save_notifier = SaveNotifier()
+        self.save_notifier.saved.connect(self.on_saved)
+        self.sync_notifier = SyncNotifier()
+        self.sync_notifier.tex_line_found.connect(self.on_tex_line_found)
+        self.sync_notifier.pdf_point_found.connect(self.on_pdf_point_found)
+
+        self.autosave_timer = QTimer(self)
+        self.autosave_timer.setInterval(AUTOSAVE_INTERVAL_MS)
+        self.autosave_timer.timeout.connect(self.autosave)
+        self.autosave_timer.start()
+
+        self.live_timer = QTimer(self)
+        self.live_timer.setSingleShot(True)
+        self.live_timer.setInterval(LIVE_PREVIEW_DELAY_MS)
+        self.live_timer.timeout.connect(self.start_compile)
 
         self.theme_manager = ThemeManager(QApplication.instance(), THEMES_PATH, GUI_STATE_PATH)
 
         self.init_ui()
+        self.set_live_preview(self.theme_manager.state.get("live_preview", False))
+        self.fragment_action.setChecked(self.theme_manager.state.get("fragment_preview", False))
+        self.set_preview_engine(self.theme_manager.state.get("preview_engine", "auto"))
+        self.daemon_action.setChecked(self.theme_manager.state.get("use_daemon", False))
+        # styled before the first show, so widgets are polished once
         self.theme_manager.apply_last()
         self.apply_font_from_state()
+        self.startup.record("window", time.perf_counter() - window_start)
+        self.shown_at = time.perf_counter()
+        self.show()
+
+    # ---------- Startup ----------
+    # The editor is shown first; the web view, the cache sweep, the format
+    # build and the Lark parser come after the first paint.
+    def paintEvent(self, event):
+        super().paintEvent(event)
+        if self.shown_at is not None:
+            self.startup.record("first_paint", time.perf_counter() - self.shown_at)
+            self.shown_at = None
+            QTimer.singleShot(0, self.finish_startup)
+
+    def finish_startup(self):
+        with self.startup.stage("preview"):
+            self.create_preview()
+        with self.startup.stage("sweep"):
+            self.sweep_cache()
+        warm_up(Compiler.PREAMBLE)
+        # most documents take the fast path; Lark is loaded off the GUI thread for the rest
+        self.parser_thread = threading.Thread(target=self.warm_parser, name="warm-parser", daemon=True)
+        self.parser_thread.start()
+        if os.environ.get(STARTUP_PROBE_ENV):
+            QTimer.singleShot(0, self.report_startup)
+
+    def warm_parser(self):
+        start = time.perf_counter()
+        get_parser()
+        self.startup.record("parser", time.perf_counter() - start)
+
+    def report_startup(self):
+        self.parser_thread.join()
+        print(json.dumps({"ready": time.perf_counter() - STARTUP_T0, "profile": self.startup.to_dict()}),
+              flush=True)
+        self.close()
+
+    @property
+    def pdf_view(self):
+        if self._pdf_view is None:
+            self.create_preview()
+        return self._pdf_view
+
+    def create_preview(self):
+        if self._pdf_view is not None:
+            return
+        from webview import create_view
+        view = create_view()
+        view.page().source_link.connect(self.jump_to_source)
+        view.page().pdf_point.connect(self.show_in_source)
+        view.loadFinished.connect(self.on_view_loaded)
+        self.splitter.replaceWidget(1, view)
+        self.preview_placeholder.deleteLater()
+        self._pdf_view = view
+
+    # ---------- Cache ----------
+    def sweep_cache(self):
+        """Drops temp dirs of crashed sessions and trims old document dirs to the size cap."""
+        janitor = get_janitor()
+        janitor.max_bytes = self.theme_manager.state.get("cache_max_bytes", CacheJanitor.DEFAULT_MAX_BYTES)
+        janitor.sweep(keep=[self.cache.id])
 
     # ---------- Font ----------
     def apply_font_from_state(self):
@@ -297,12 +628,22 @@ class StartWindow(QMainWindow):
         splitter = QSplitter(Qt.Horizontal)
         self.editor = QTextEdit()
         self.editor.setPlaceholderText("Type your source text here…")
-        splitter.addWidget(self.editor)
-
-        self.pdf_view = QWebEngineView()
-        self.pdf_view.settings().setAttribute(QWebEngineSettings.PluginsEnabled, True)
-        splitter.addWidget(self.pdf_view)
+        # large documents scroll by line window through this bar
+        self.window_scroll = QScrollBar(Qt.Vertical)
+        self.window_scroll.hide()
+        self.window_scroll.valueChanged.connect(self.show_window)
+        editor_pane = QWidget()
+        editor_layout = QHBoxLayout(editor_pane)
+        editor_layout.setContentsMargins(0, 0, 0, 0)
+        editor_layout.addWidget(self.editor)
+        editor_layout.addWidget(self.window_scroll)
+        splitter.addWidget(editor_pane)
+
+        # the web view replaces this once the window is up (create_preview)
+        self.preview_placeholder = QLabel()
+        splitter.addWidget(self.preview_placeholder)
         splitter.setSizes([550, 550])
+        self.splitter = splitter
         layout.addWidget(splitter)
 
         # Right-click menu
@@ -312,17 +653,17 @@ class StartWindow(QMainWindow):
         self.editor.setContextMenuPolicy(Qt.ContextMenuPolicy.CustomContextMenu)
         self.editor.customContextMenuRequested.connect(self.show_right_click_menu)
 
-        self.compile_btn.clicked.connect(self.start_compile)
+        # an explicit compile retries documents whose failure is cached
+        self.compile_btn.clicked.connect(lambda: self.start_compile(retry_failed=True))
         self.save_btn.clicked.connect(self.save_file)
 
-        self.show()
-
     # ---------- Right-click ----------
     def show_right_click_menu(self, pos):
         self.right_click_menu.exec_(self.editor.mapToGlobal(pos))
 
     def create_menu(self):
         file_menu = self.menuBar().addMenu("File")
+        view_menu = self.menuBar().addMenu("View")
         add_menu = self.menuBar().addMenu("Add")
         theme_menu = self.menuBar().addMenu("Themes")
         settings_menu = self.menuBar().addMenu("Settings")
@@ -338,11 +679,44 @@ class StartWindow(QMainWindow):
         file_menu.addAction(save_action)
         file_menu.addAction(export_action)
 
+        # View menu
+        preview_action = QAction("Show in preview", self)
+        preview_action.setShortcut("Ctrl+J")
+        preview_action.triggered.connect(self.show_in_preview)
+        view_menu.addAction(preview_action)
+
         # Settings menu
         font_action = QAction("Font", self)
         font_action.triggered.connect(self.choose_font)
         settings_menu.addAction(font_action)
 
+        self.live_action = QAction("Live preview", self)
+        self.live_action.setCheckable(True)
+        self.live_action.toggled.connect(self.set_live_preview)
+        settings_menu.addAction(self.live_action)
+
+        self.fragment_action = QAction("Equation preview", self)
+        self.fragment_action.setCheckable(True)
+        self.fragment_action.toggled.connect(self.set_fragment_preview)
+        settings_menu.addAction(self.fragment_action)
+
+        self.daemon_action = QAction("Use compile daemon", self)
+        self.daemon_action.setCheckable(True)
+        self.daemon_action.toggled.connect(self.set_use_daemon)
+        settings_menu.addAction(self.daemon_action)
+
+        engine_menu = settings_menu.addMenu("Preview engine")
+        engine_group = QActionGroup(self)
+        self.engine_actions = {}
+        for name, label in [("auto", "Fastest (auto)")] + [(e.name, e.label) for e in ENGINES.values()]:
+            action = QAction(label, self)
+            action.setCheckable(True)
+            action.setEnabled(name == "auto" or ENGINES[name].available())
+            action.triggered.connect(lambda checked, n=name: self.set_preview_engine(n))
+            engine_group.addAction(action)
+            engine_menu.addAction(action)
+            self.engine_actions[name] = action
+
         # Add menu
         tikz_menu = add_menu.addMenu("Tikz")
         equation_menu = add_menu.addMenu("Equation")
@@ -387,74 +761,564 @@ class StartWindow(QMainWindow):
         cursor.insertText(text_to_write)
         self.editor.setTextCursor(cursor)
 
+    # ---------- Live preview ----------
+    def set_live_preview(self, enabled):
+        enabled = bool(enabled)
+        if self.live_action.isChecked() != enabled:
+            # toggled() calls back into this method with the new state
+            self.live_action.setChecked(enabled)
+            return
+        if enabled == self.live_preview:
+            return
+        self.live_preview = enabled
+        if enabled:
+            self.editor.textChanged.connect(self.live_timer.start)
+        else:
+            self.editor.textChanged.disconnect(self.live_timer.start)
+            self.live_timer.stop()
+        if self.theme_manager.state.get("live_preview", False) != enabled:
+            self.theme_manager.state["live_preview"] = enabled
+            self.theme_manager._save_state()
+
+    def set_fragment_preview(self, enabled):
+        self.fragment_preview = bool(enabled)
+        if self.theme_manager.state.get("fragment_preview", False) != self.fragment_preview:
+            self.theme_manager.state["fragment_preview"] = self.fragment_preview
+            self.theme_manager._save_state()
+
+    def set_use_daemon(self, enabled):
+        self.use_daemon = bool(enabled)
+        if self.theme_manager.state.get("use_daemon", False) != self.use_daemon:
+            self.theme_manager.state["use_daemon"] = self.use_daemon
+            self.theme_manager._save_state()
+
+    def set_preview_engine(self, name):
+        if name not in self.engine_actions:
+            name = "auto"
+        self.preview_engine = name
+        self.engine_actions[name].setChecked(True)
+        if self.theme_manager.state.get("preview_engine", "auto") != name:
+            self.theme_manager.state["preview_engine"] = name
+            self.theme_manager._save_state()
+
     # ---------- Compile ----------
-    def start_compile(self):
+    def start_compile(self, retry_failed=False):
+        if self.document_saving:
+            # the document is remapped by the save; on_saved restarts live preview
+            self.statusBar().showMessage("Compile skipped while the document is being saved", 3000)
+            return
+        # a newer revision makes any in-flight compile stale
+        self.revision += 1
+        if self.worker is not None:
+            self.worker.cancel()
+            self.worker = None
+        if self.fragment_preview:
+            self.start_fragment_preview()
+            return
+        self.profile = Profile(f"revision {self.revision}")
         try:
             self.compile_btn.setEnabled(False)
-            latex_code = self.generate_latex()
-            self.write_tex(latex_code)
-            self.run_compile_thread()
+            if self.use_daemon and self.document is None:
+                self.run_daemon_job(retry_failed)
+                return
+            self.cache.touch()
+            latex_hash = self.write_tex(self.profile)
+            engine = choose_engine("preview", self.preview_engine, self.cache.tex_path.stat().st_size)
+            # also the scheduler key, so it is per engine even where nothing is cached
+            cache_key = PdfCache.key(latex_hash, engine.name)
+            if "pdf" in engine.capabilities:
+                with self.profile.stage("pdf_cache") as stage:
+                    cached_pdf = self.pdf_cache.lookup(cache_key)
+                    stage.cache = "miss" if cached_pdf is None else "hit"
+                if cached_pdf is not None:
+                    self.on_compile_success([str(cached_pdf)], self.revision)
+                    return
+            if not retry_failed:
+                with self.profile.stage("log_cache") as stage:
+                    entries = self.log_cache.lookup(cache_key)
+                    stage.cache = "miss" if entries is None else "hit"
+                if entries is not None:
+                    self.on_compile_failed(entries, self.revision)
+                    return
+            self.run_compile_job(cache_key, engine)
         except Exception as e:
             self.display_error(str(e))
             self.compile_btn.setEnabled(True)
 
-    def generate_latex(self):
+    def write_tex(self, profile=None):
+        """Streams the LaTeX into the cache dir and returns its hash."""
+        if self.document is not None:
+            return self.write_tex_from_document(profile)
         source = self.editor.toPlainText()
-        tree = Parser(source).parse()
-        return Compiler().compile(tree)
-
-    def write_tex(self, latex_code):
+        start = time.perf_counter()
+        with open(self.cache.tex_path, "w", encoding="utf-8") as f:
+            writer = HashingWriter(f)
+            self.incremental.compile_to(source, writer)
+        self.line_map = self.incremental.line_map
+        if profile is not None:
+            elapsed = time.perf_counter() - start
+            self.incremental.record_stats(profile, len(source))
+            # parse and compile run interleaved with the writes; the rest is splitting and I/O
+            profile.record("write_tex", elapsed - self.incremental.parse_seconds - self.incremental.compile_seconds,
+                           bytes_out=writer.bytes_written)
+        return writer.hexdigest()
+
+    def write_tex_from_document(self, profile=None):
+        """Compiles a large document piece by piece, without building the full text."""
+        self.commit_window()
+        self.line_map = None
         with open(self.cache.tex_path, "w", encoding="utf-8") as f:
-            f.write(latex_code)
-
-    def run_compile_thread(self):
-        self.thread = QThread()
-        self.worker = CompileWorker(self.cache.base_dir, os.path.basename(self.cache.tex_path), self.cache.pdf_path)
-        self.worker.moveToThread(self.thread)
-        self.thread.started.connect(self.worker.run)
-        self.worker.success.connect(self.on_compile_success)
-        self.worker.error.connect(self.on_compile_error)
-        self.worker.success.connect(self.thread.quit)
-        self.worker.error.connect(self.thread.quit)
-        self.worker.success.connect(self.worker.deleteLater)
-        self.worker.error.connect(self.worker.deleteLater)
-        self.thread.finished.connect(self.thread.deleteLater)
-        self.thread.start()
-
-    def on_compile_success(self, pdf_path):
+            writer = HashingWriter(f)
+            stats = compile_chunks(self.document.iter_chunks(), writer, self.incremental.parser)
+        if profile is not None:
+            profile.record("parse", stats.parse_seconds, bytes_in=stats.bytes_in, blocks=stats.blocks)
+            profile.record("compile", stats.compile_seconds, bytes_out=writer.bytes_written)
+        return writer.hexdigest()
+
+    def run_compile_job(self, cache_key=None, engine=None):
+        worker = CompileWorker(
+            self.cache.base_dir, os.path.basename(self.cache.tex_path), self.cache.pdf_path,
+            self.pdf_cache, cache_key, self.revision, self.profile, engine, self.log_cache
+        )
+        worker.success.connect(lambda paths, rev=worker.revision: self.on_compile_success(paths, rev))
+        worker.failed.connect(lambda entries, rev=worker.revision: self.on_compile_failed(entries, rev))
+        worker.error.connect(lambda message, rev=worker.revision: self.on_compile_error(message, rev))
+        # keep a reference until the job ends; stale jobs finish on their own
+        self.compiles.add(worker)
+        worker.finished.connect(lambda w=worker: self.on_compile_finished(w))
+        self.worker = worker
+        worker.start()
+
+    def run_daemon_job(self, retry_failed=False):
+        """Sends the editor text to the compile daemon instead of compiling here."""
+        request = {"source": self.editor.toPlainText(), "engine": self.preview_engine, "retry_failed": retry_failed}
+        if self.cache.temp:
+            request["document"] = self.daemon_document
+        else:
+            request["path"] = self.buffer.path
+        worker = DaemonWorker(request, self.revision, self.profile)
+        worker.mapped.connect(lambda line_map, rev=worker.revision: self.on_line_map(line_map, rev))
+        worker.success.connect(lambda paths, rev=worker.revision: self.on_compile_success(paths, rev))
+        worker.failed.connect(lambda entries, rev=worker.revision: self.on_compile_failed(entries, rev))
+        worker.error.connect(lambda message, rev=worker.revision: self.on_compile_error(message, rev))
+        self.compiles.add(worker)
+        worker.finished.connect(lambda w=worker: self.on_compile_finished(w))
+        self.worker = worker
+        worker.start()
+
+    def on_line_map(self, line_map, revision):
+        if revision == self.revision:
+            self.line_map = line_map
+
+    def close_daemon_document(self):
+        """Lets the daemon drop the dir of this window's unsaved text."""
+        from daemon import DaemonError, connect
+        try:
+            with connect(start=False) as client:
+                client.request("close", document=self.daemon_document)
+        except (DaemonError, OSError):
+            pass
+
+    def on_compile_finished(self, worker):
+        self.compiles.discard(worker)
+        if not self.compiles and self.pending_promote is not None:
+            path, self.pending_promote = self.pending_promote, None
+            self.cache.promote(path)
+
+    def on_compile_success(self, paths, revision=None):
+        if revision is not None and revision != self.revision:
+            return
+        self.worker = None
+        self.compile_btn.setEnabled(True)
+        self.fragment_keys = None
+        if paths[0].endswith(".svg"):
+            self.show_svg_pages(paths)
+        elif self.page_rasterizer is not None:
+            self.show_pdf_pages(paths[0])
+        else:
+            self.page_keys = None
+            self.pdf_view.load(QUrl.fromLocalFile(paths[0]))
+        if self.profile is not None:
+            self.statusBar().showMessage(f"{self.profile.summary()} | {get_scheduler().summary()}")
+
+    def show_svg_pages(self, paths):
+        self.page_keys = None
+        # the query string stops the view reusing the previous compile's page images
+        pages = "".join(
+            f'<img src="{QUrl.fromLocalFile(path).toString()}?r={self.revision}" '
+            f'style="display:block;margin:10px auto;background:white;max-width:100%;">'
+            for path in paths
+        )
+        self.pdf_view.setHtml(f'<html><body style="background:#525659;">{pages}</body></html>',
+                              QUrl.fromLocalFile(os.path.dirname(paths[0]) + os.sep))
+
+    def on_compile_failed(self, entries, revision=None):
+        if revision is not None and revision != self.revision:
+            return
+        self.worker = None
         self.compile_btn.setEnabled(True)
-        self.pdf_view.load(QUrl.fromLocalFile(pdf_path))
+        self.display_log(entries)
+        if self.profile is not None:
+            self.statusBar().showMessage(f"{self.profile.summary()} | {get_scheduler().summary()}")
 
-    def on_compile_error(self, message):
+    def on_compile_error(self, message, revision=None):
+        if revision is not None and revision != self.revision:
+            return
+        self.worker = None
         self.compile_btn.setEnabled(True)
         self.display_error(message)
+        if self.profile is not None:
+            self.statusBar().showMessage(f"{self.profile.summary()} | {get_scheduler().summary()}")
+
+    # ---------- Page preview ----------
+    def show_pdf_pages(self, pdf_path):
+        self.page_pdf = pdf_path
+        if self.page_keys is None:
+            self.page_keys = []
+            self.page_view_loaded = False
+            self.pending_page_js = [f"window.pageDpi = {self.page_rasterizer.dpi};"]
+            self.pdf_view.setHtml(PAGE_VIEW_HTML, QUrl.fromLocalFile(str(self.page_rasterizer.root) + os.sep))
+            self.start_page_render(pdf_path, range(INITIAL_PAGES), self.revision)
+        elif not self.page_view_loaded:
+            self.start_page_render(pdf_path, range(INITIAL_PAGES), self.revision)
+        else:
+            self.pdf_view.page().runJavaScript(
+                "visiblePages()",
+                lambda visible, rev=self.revision: self.start_page_render(pdf_path, visible or [], rev)
+            )
+
+    def start_page_render(self, pdf_path, first, revision):
+        if revision != self.revision or self.page_keys is None:
+            return
+        thread = QThread()
+        worker = PageWorker(self.page_rasterizer, pdf_path, list(first), revision,
+                            lambda rev: rev == self.revision)
+        worker.moveToThread(thread)
+        thread.started.connect(worker.run)
+        worker.page_ready.connect(self.on_page_ready)
+        worker.finished.connect(self.on_pages_finished)
+        worker.finished.connect(thread.quit)
+        worker.finished.connect(worker.deleteLater)
+        thread.finished.connect(thread.deleteLater)
+        self.threads.add(thread)
+        thread.finished.connect(lambda t=thread: self.threads.discard(t))
+        thread.start()
+
+    def on_page_ready(self, revision, index, key, path):
+        if revision != self.revision or self.page_keys is None:
+            return
+        keys = self.page_keys
+        if index < len(keys) and keys[index] == key:
+            return
+        if index >= len(keys):
+            keys.extend([None] * (index + 1 - len(keys)))
+        keys[index] = key
+        self.run_page_js(f"setPage({index}, {json.dumps(QUrl.fromLocalFile(path).toString())});")
+
+    def on_pages_finished(self, revision, count, error):
+        if revision != self.revision or self.page_keys is None:
+            return
+        if error:
+            # let the PDF plugin show it instead
+            self.page_keys = None
+            self.pdf_view.load(QUrl.fromLocalFile(self.page_pdf))
+            return
+        del self.page_keys[count:]
+        self.run_page_js(f"trimPages({count});")
+
+    def run_page_js(self, script):
+        if self.page_view_loaded:
+            self.pdf_view.page().runJavaScript(script)
+        else:
+            self.pending_page_js.append(script)
+
+    def on_view_loaded(self, ok):
+        if not ok or self.page_keys is None or self.page_view_loaded:
+            return
+        self.page_view_loaded = True
+        scripts, self.pending_page_js = self.pending_page_js, []
+        for script in scripts:
+            self.pdf_view.page().runJavaScript(script)
+
+    # ---------- Equation preview ----------
+    def start_fragment_preview(self):
+        try:
+            fragments = list(iter_command_blocks(self.editor.toPlainText(), self.incremental.parser))
+        except Exception as e:
+            self.display_error(str(e))
+            return
+        thread = QThread()
+        worker = FragmentWorker(self.fragment_renderer, fragments, self.revision)
+        # after the new submit, so jobs both revisions share are not killed
+        if self.fragment_worker is not None:
+            self.fragment_worker.cancel()
+        self.fragment_worker = worker
+        worker.moveToThread(thread)
+        thread.started.connect(worker.run)
+        worker.finished.connect(self.on_fragments_rendered)
+        worker.finished.connect(thread.quit)
+        worker.finished.connect(worker.deleteLater)
+        thread.finished.connect(thread.deleteLater)
+        self.threads.add(thread)
+        thread.finished.connect(lambda t=thread: self.threads.discard(t))
+        thread.start()
+
+    def on_fragments_rendered(self, revision, rendered):
+        if revision != self.revision:
+            return
+        self.fragment_worker = None
+        keys = [key for key, _ in rendered]
+        self.page_keys = None
+        if self.fragment_keys is None or len(keys) != len(self.fragment_keys):
+            blocks = "".join(
+                f'<div id="frag-{i}" style="margin:12px 0;">{body}</div>' for i, (_, body) in enumerate(rendered)
+            )
+            self.pdf_view.setHtml(f'<html><body style="background:#ffffff;padding:20px;">{blocks}</body></html>')
+        else:
+            # only swap the fragments whose LaTeX changed
+            for i, (key, body) in enumerate(rendered):
+                if key != self.fragment_keys[i]:
+                    self.pdf_view.page().runJavaScript(
+                        f"document.getElementById('frag-{i}').innerHTML = {json.dumps(body)};"
+                    )
+        self.fragment_keys = keys
 
     # ---------- Errors ----------
     def display_error(self, message):
+        self.fragment_keys = None
+        self.page_keys = None
         self.pdf_view.setHtml(f"""
         <html>
         <body style="background:#1e1e1e;color:#ff6b6b;padding:20px;">
             <h2>Compilation Error</h2>
-            <pre>{message}</pre>
+            <pre>{html.escape(message)}</pre>
+        </body>
+        </html>
+        """)
+
+    def display_log(self, entries):
+        """Errors first, then warnings, each linked to the source line its LaTeX came from."""
+        self.fragment_keys = None
+        self.page_keys = None
+        rows = []
+        for entry in sorted(entries, key=lambda entry: entry.kind != "error"):
+            offset = None
+            if self.line_map is not None and entry.tex_line is not None:
+                offset = self.line_map.source_offset(entry.tex_line)
+            if offset is not None:
+                line = self.editor.document().findBlock(offset).blockNumber() + 1
+                where = f'<a href="source:{offset}" style="color:#6cb6ff;">line {line}</a>'
+            else:
+                where = f"main.tex:{entry.tex_line}" if entry.tex_line is not None else ""
+            color = "#ff6b6b" if entry.kind == "error" else "#e0b050"
+            context = f'<pre style="margin:4px 0 0 16px;">{html.escape(entry.context)}</pre>' if entry.context else ""
+            rows.append(
+                f'<div style="margin:10px 0;"><span style="color:{color};">{entry.kind}</span> {where}'
+                f'<div>{html.escape(entry.message)}</div>{context}</div>'
+            )
+        self.pdf_view.setHtml(f"""
+        <html>
+        <body style="background:#1e1e1e;color:#dddddd;padding:20px;font-family:monospace;">
+            <h2 style="color:#ff6b6b;">Compilation Error</h2>
+            {"".join(rows)}
         </body>
         </html>
         """)
 
+    def jump_to_source(self, offset):
+        if self.document is not None:
+            return
+        cursor = QTextCursor(self.editor.document())
+        cursor.setPosition(min(offset, self.editor.document().characterCount() - 1))
+        self.editor.setTextCursor(cursor)
+        self.editor.ensureCursorVisible()
+        self.editor.setFocus()
+
+    # ---------- SyncTeX ----------
+    def synctex_ready(self) -> bool:
+        if self.page_keys is None or self.line_map is None or not synctex.available(self.page_pdf):
+            self.statusBar().showMessage("Jumping needs the page preview of a PDF and the synctex program", 3000)
+            return False
+        return True
+
+    def show_in_preview(self):
+        """Scrolls the page preview to the output of the block under the cursor."""
+        if not self.synctex_ready():
+            return
+        tex_line = self.line_map.tex_line(self.editor.textCursor().position())
+        if tex_line is None:
+            return
+        pdf_path, tex_name, revision = self.page_pdf, os.path.basename(self.cache.tex_path), self.revision
+        notifier = self.sync_notifier
+
+        def locate(job):
+            point = synctex.view(pdf_path, tex_name, tex_line)
+            page, _, y = point if point is not None else (0, 0.0, 0.0)
+            notifier.pdf_point_found.emit(revision, page, y)
+        get_scheduler().submit(locate, Priority.INTERACTIVE)
+
+    def on_pdf_point_found(self, revision, page, y):
+        if revision == self.revision and page > 0 and self.page_keys is not None:
+            self.run_page_js(f"scrollToPoint({page - 1}, {y});")
+
+    def show_in_source(self, page, x, y):
+        """Moves the editor cursor to the block that produced a double-clicked point of the preview."""
+        if not self.synctex_ready():
+            return
+        pdf_path, revision = self.page_pdf, self.revision
+        notifier = self.sync_notifier
+        get_scheduler().submit(
+            lambda job: notifier.tex_line_found.emit(revision, synctex.edit(pdf_path, page, x, y) or 0),
+            Priority.INTERACTIVE
+        )
+
+    def on_tex_line_found(self, revision, tex_line):
+        if revision != self.revision or tex_line <= 0 or self.line_map is None:
+            return
+        offset = self.line_map.source_offset(tex_line)
+        if offset is not None:
+            self.jump_to_source(offset)
+
+    # ---------- Large documents ----------
+    def open_large_file(self, path):
+        if self.document is not None:
+            self.document.close()
+        self.document = PieceTable.from_file(path)
+        self.window_first = 0
+        self.window_count = 0
+        self.update_window_range()
+        self.window_scroll.setValue(0)
+        self.window_scroll.show()
+        self.show_window(0, commit=False)
+
+    def update_window_range(self):
+        self.window_scroll.blockSignals(True)
+        self.window_scroll.setRange(0, max(self.document.line_count() - WINDOW_LINES, 0))
+        self.window_scroll.setPageStep(WINDOW_LINES)
+        self.window_scroll.blockSignals(False)
+
+    def show_window(self, first, commit=True):
+        """Loads lines [first, first + WINDOW_LINES) of the document into the editor."""
+        if self.document is None:
+            return
+        if commit:
+            self.commit_window()
+        text = self.document.lines(first, WINDOW_LINES)
+        self.window_first = first
+        self.window_count = min(WINDOW_LINES, self.document.line_count() - first)
+        self.editor.blockSignals(True)
+        self.editor.setPlainText(text)
+        self.editor.blockSignals(False)
+        self.editor.document().setModified(False)
+
+    def commit_window(self):
+        """Writes edits made in the visible window back into the piece table."""
+        if self.document is None or not self.editor.document().isModified():
+            return
+        text = self.editor.toPlainText()
+        self.document.replace_lines(self.window_first, self.window_count, text)
+        self.window_count = text.count("\n") + (0 if not text or text.endswith("\n") else 1)
+        self.editor.document().setModified(False)
+        self.update_window_range()
+
+    def close_document(self):
+        if self.document is not None:
+            self.document.close()
+            self.document = None
+        self.window_scroll.hide()
+
     # ---------- File Handling ----------
     def save_file(self):
-        path, _ = QFileDialog.getSaveFileName(self, "Save file", "", "Text Files (*.txt)")
-        if not path:
+        if self.document is not None:
+            if self.document_saving:
+                return
+            self.commit_window()
+            if self.document.modified:
+                self.save_document()
+            else:
+                self.cache.promote(self.document.path)
             return
-        with open(f"{path}.txt", "w", encoding="utf-8") as f:
-            f.write(self.editor.toPlainText())
-        self.cache.promote(path)
+        path = self.buffer.path
+        if path is None:
+            path, _ = QFileDialog.getSaveFileName(self, "Save file", "", "Text Files (*.txt)")
+            if not path:
+                return
+            if not path.endswith(".txt"):
+                path = f"{path}.txt"
+        self.queue_save(path)
+
+    def save_document(self):
+        """
+        Saves the piece-table document on the save thread; only the pieces that
+        changed are written back when no original text moved. The editor is
+        read-only until on_saved, since saving remaps the document.
+        """
+        self.document_saving = True
+        self.editor.setReadOnly(True)
+        self.window_scroll.setEnabled(False)
+        self.statusBar().showMessage(f"Saving {os.path.basename(self.document.path)}...")
+        self.save_queue.submit_document(self.document, self.save_notifier.notify)
+
+    def queue_save(self, path):
+        """Hands the editor text to the save thread unless the file already holds it."""
+        content = self.editor.toPlainText()
+        if path == self.buffer.path and not self.buffer.is_dirty(content):
+            self.editor.document().setModified(False)
+            return
+        self.buffer.path = path
+        self.editor.document().setModified(False)
+        self.save_queue.submit(path, content, self.save_notifier.notify)
+
+    def autosave(self):
+        if self.document is not None:
+            if not self.document_saving:
+                self.commit_window()
+                if self.document.modified:
+                    self.save_document()
+            return
+        if self.buffer.path is None:
+            return
+        # isModified() is a cheap pre-check; the hash catches edits that were undone
+        if self.editor.document().isModified():
+            self.queue_save(self.buffer.path)
+
+    def on_saved(self, path, saved_hash, error):
+        if self.document_saving and self.document is not None and path == self.document.path:
+            self.document_saving = False
+            self.editor.setReadOnly(False)
+            self.window_scroll.setEnabled(True)
+            if not error:
+                self.show_window(self.window_first, commit=False)
+            if self.live_preview:
+                self.live_timer.start()
+        if error:
+            self.editor.document().setModified(True)
+            self.statusBar().showMessage(f"Save failed: {error}")
+            return
+        if path == self.buffer.path and saved_hash:
+            self.buffer.mark_saved(saved_hash)
+        if self.compiles:
+            # promote renames the cache dir; wait until no compile is using it
+            self.pending_promote = path
+        else:
+            self.cache.promote(path)
+        self.statusBar().showMessage(f"Saved {os.path.basename(path)}", 3000)
 
     def open_file(self):
+        if self.document_saving:
+            self.statusBar().showMessage("Wait for the document to finish saving", 3000)
+            return
         path, _ = QFileDialog.getOpenFileName(self, "Open file", "", "Text Files (*.txt)")
         if not path:
             return
-        with open(path, "r", encoding="utf-8") as f:
-            self.editor.setPlainText(f.read())
+        if os.path.getsize(path) >= LARGE_FILE_BYTES:
+            self.open_large_file(path)
+            self.buffer = Buffer(path)
+        else:
+            self.close_document()
+            self.buffer, content = Buffer.load(path)
+            self.editor.setPlainText(content)
+            self.editor.document().setModified(False)
         self.cache = Cache(path)
 
     def export_latex_file(self):
@@ -462,6 +1326,17 @@ class StartWindow(QMainWindow):
 
     # ---------- Cleanup ----------
     def closeEvent(self, event):
+        if self.worker is not None:
+            self.worker.cancel()
+        if self.fragment_worker is not None:
+            self.fragment_worker.cancel()
+        self.autosave_timer.stop()
+        self.save_queue.shutdown()
+        if self.page_rasterizer is not None:
+            self.page_rasterizer.shutdown()
+        self.close_document()
+        if self.use_daemon:
+            self.close_daemon_document()
         Cache.cleanup_temp_dirs()
         super().closeEvent(event)
 
@@ -471,6 +1346,8 @@ class StartWindow(QMainWindow):
 # =======================
 
 if __name__ == "__main__":
+    # lets webview.py import QtWebEngine after the QApplication exists
+    QApplication.setAttribute(Qt.AA_ShareOpenGLContexts)
     app = QApplication(sys.argv)
     window = StartWindow()
     sys.exit(app.exec_())
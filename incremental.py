@@ -0,0 +1,270 @@
+import hashlib
+import time
+from collections import OrderedDict
+
+from compiler import Parser, Compiler, Node, LineMap
+from fastpath import parse_blocks, emit
+
+
+# =======================
+# Block splitting
+# =======================
+#
+# A block is a run of source lines that always parses to the same top-level
+# `element`s on its own as it does inside the whole document:
+#   - a header line              (# ...)
+#   - a run of list items        (* ...), blank lines between items included
+#   - a command block            (! ... !), which may span lines
+#   - a paragraph chunk          (plain lines up to a blank line)
+# Consecutive paragraph chunks belong to one `paragraph` in the grammar; the
+# assembler below merges them back together.
+
+def _tokens(buf):
+    if isinstance(buf, str):
+        return "\n", "#", "*", "!"
+    return b"\n", b"#", b"*", b"!"
+
+
+def _logical_line(buf, pos, n, nl, bang):
+    """
+    Returns (eol, end) for the line starting at pos. A `!` opened on the line
+    extends it to the line holding the closing `!`. `end` includes the
+    trailing newline run, which the grammar lexes as a single NEWLINE.
+    """
+    eol = buf.find(nl, pos)
+    if eol == -1:
+        eol = n
+    bang_at = buf.find(bang, pos, eol)
+    while bang_at != -1:
+        close = buf.find(bang, bang_at + 1)
+        if close == -1:
+            return n, n
+        if close >= eol:
+            eol = buf.find(nl, close)
+            if eol == -1:
+                eol = n
+        bang_at = buf.find(bang, close + 1, eol)
+    end = eol
+    while end < n and buf[end:end + 1] == nl:
+        end += 1
+    return eol, end
+
+
+class BlockScanner:
+    """
+    Splits a buffer into top-level blocks. The buffer may grow at the end
+    between calls to scan() (bytes read chunk by chunk): only logical lines
+    that are known to be complete are consumed, and the next scan resumes at
+    the first one that was not, so every byte is scanned about once however
+    many chunks a block spans.
+    """
+    __slots__ = ("start", "pos", "head", "has_star", "blank_break")
+
+    def __init__(self, start=0):
+        self.start = start          # start of the pending block
+        self.pos = start            # end of its complete lines
+        self.head = None            # first byte of the block, once its first line is complete
+        self.has_star = False       # state of the last complete line
+        self.blank_break = False
+
+    def shift(self, offset):
+        """Moves the offsets after offset bytes were dropped from the front of the buffer."""
+        self.start -= offset
+        self.pos -= offset
+
+    def scan(self, buf, final=True):
+        """
+        Yields (start, end) of the blocks of buf that are complete. With
+        final, buf is the whole input and its last block is yielded too.
+        """
+        nl, hash_, star, bang = _tokens(buf)
+        markers = (hash_, star, bang)
+        n = len(buf)
+        pos = self.pos
+        while pos < n:
+            if pos > self.start:
+                nxt = buf[pos:pos + 1]
+                if nxt == star and (self.has_star or self.head == star):
+                    pass  # list items keep joining the open list
+                elif self.head in markers or nxt in markers or self.blank_break:
+                    yield self.start, pos
+                    self.__init__(pos)
+                    continue
+            eol, end = _logical_line(buf, pos, n, nl, bang)
+            if end >= n and not final:
+                break  # the line (or its newline run) may go on in the next chunk
+            if pos == self.start:
+                self.head = buf[pos:pos + 1]
+            self.has_star = buf.find(star, pos, eol) != -1
+            self.blank_break = end - eol >= 2
+            pos = self.pos = end
+        if final and self.start < n:
+            yield self.start, n
+            self.__init__(n)
+
+
+def iter_block_spans(buf):
+    """
+    Yields (start, end) offsets of the top-level blocks in buf.
+    Works on str, bytes and mmap objects without copying the buffer.
+    """
+    return BlockScanner().scan(buf)
+
+
+class Block:
+    __slots__ = ("start", "end", "text", "digest")
+
+    def __init__(self, start, end, text):
+        self.start = start
+        self.end = end
+        self.text = text
+        self.digest = hashlib.blake2b(text.encode(), digest_size=16).digest()
+
+    def __repr__(self):
+        return f"Block({self.start}, {self.end}, {self.text!r})"
+
+
+def split_blocks(source):
+    return [Block(start, end, source[start:end]) for start, end in iter_block_spans(source)]
+
+
+# =======================
+# Incremental Compiler
+# =======================
+
+class Fragment:
+    """Compiled LaTeX for one block, plus how it joins its neighbours."""
+    __slots__ = ("latex", "starts_paragraph", "ends_paragraph")
+
+    def __init__(self, latex, starts_paragraph, ends_paragraph):
+        self.latex = latex
+        self.starts_paragraph = starts_paragraph
+        self.ends_paragraph = ends_paragraph
+
+
+PARAGRAPH_END = "\n\n"
+
+
+def parse_block(text, parser):
+    """Returns the fast-path block list for text, or its Lark tree when the fast path cannot take it."""
+    blocks = parse_blocks(text)
+    return blocks if blocks is not None else parser.parse(text)
+
+
+def compile_block(text, parser=None, compiler=None):
+    return make_fragment(parse_block(text, parser or Parser()), compiler or Compiler())
+
+
+def make_fragment(parsed, compiler):
+    if isinstance(parsed, list):
+        return fragment_from_blocks(parsed, compiler)
+    return fragment_from_tree(parsed, compiler)
+
+
+def fragment_from_blocks(blocks, compiler):
+    parts = []
+    emit(blocks, parts.append, compiler.RULES)
+    return Fragment(
+        "".join(parts),
+        bool(blocks) and blocks[0][0] == "paragraph",
+        bool(blocks) and blocks[-1][0] == "paragraph",
+    )
+
+
+def fragment_from_tree(tree, compiler):
+    elements = tree.children if isinstance(tree, Node) and tree.data == "document" else [tree]
+    return Fragment(
+        compiler.compile_fragment(tree),
+        bool(elements) and elements[0].data == "paragraph",
+        bool(elements) and elements[-1].data == "paragraph",
+    )
+
+
+def iter_fragment_text(fragments):
+    """Yields fragment bodies in order, merging paragraphs split across blocks."""
+    previous = None
+    for fragment in fragments:
+        if previous is not None:
+            if previous.ends_paragraph and fragment.starts_paragraph:
+                yield previous.latex[:-len(PARAGRAPH_END)]
+            else:
+                yield previous.latex
+        previous = fragment
+    if previous is not None:
+        yield previous.latex
+
+
+def join_fragments(fragments):
+    return "".join(iter_fragment_text(fragments))
+
+
+class IncrementalCompiler:
+    """
+    Compiles source text block by block, keeping each block's LaTeX keyed by
+    its content hash so only edited blocks are parsed and emitted again.
+    line_map describes the document of the last compile.
+    """
+
+    def __init__(self, max_entries: int = 8192):
+        self.parser = Parser()
+        self.compiler = Compiler()
+        self.max_entries = max_entries
+        self._fragments = OrderedDict()
+        self.line_map = LineMap()
+        self._reset_stats()
+
+    def _reset_stats(self):
+        self.reparsed = 0
+        self.reused = 0
+        self.parse_seconds = 0.0
+        self.compile_seconds = 0.0
+
+    def record_stats(self, profile, source_size: int):
+        """Adds the parse and compile stages of the last run to a profiler.Profile."""
+        cache = "hit" if self.reparsed == 0 else "miss"
+        profile.record("parse", self.parse_seconds, bytes_in=source_size, cache=cache,
+                       reparsed=self.reparsed, reused=self.reused)
+        profile.record("compile", self.compile_seconds)
+
+    def fragment(self, block: Block) -> Fragment:
+        fragment = self._fragments.get(block.digest)
+        if fragment is not None:
+            self._fragments.move_to_end(block.digest)
+            self.reused += 1
+            return fragment
+        start = time.perf_counter()
+        tree = parse_block(block.text, self.parser)
+        parsed = time.perf_counter()
+        fragment = make_fragment(tree, self.compiler)
+        self.parse_seconds += parsed - start
+        self.compile_seconds += time.perf_counter() - parsed
+        self._fragments[block.digest] = fragment
+        if len(self._fragments) > self.max_entries:
+            self._fragments.popitem(last=False)
+        self.reparsed += 1
+        return fragment
+
+    def _iter_text(self, source: str, first_tex_line: int):
+        """Yields the body fragment by fragment, recording line_map as it goes."""
+        self._reset_stats()
+        self.line_map = line_map = LineMap()
+        blocks = split_blocks(source)
+        tex_line = first_tex_line
+        for block, text in zip(blocks, iter_fragment_text(self.fragment(b) for b in blocks)):
+            line_map.add(block.start, tex_line)
+            tex_line += text.count("\n")
+            yield text
+        line_map.close(tex_line, len(source))
+
+    def compile_body(self, source: str) -> str:
+        return "".join(self._iter_text(source, self.compiler.body_line()))
+
+    def compile(self, source: str) -> str:
+        return self.compiler.wrap_document(self.compile_body(source))
+
+    def compile_to(self, source: str, fp):
+        """Streams the full document into fp, one fragment at a time."""
+        fp.write(self.compiler.PREAMBLE + self.compiler.BEGIN_DOCUMENT)
+        for text in self._iter_text(source, self.compiler.body_line()):
+            fp.write(text)
+        fp.write(self.compiler.END_DOCUMENT)
@@ -0,0 +1,242 @@
+"""
+Headless entry point.
+
+    python latexapp.py build <files or dirs> [-j N] [--out DIR] [--no-pdf]
+                             [--engine auto|pdflatex|latexmk] [--daemon]
+                             [--profile PATH] [--trace PATH]
+
+Parses, compiles and runs a PDF engine on every source file in parallel, writing
+artifacts in the same <out>/<id>/main.* layout as cache.Cache.
+"""
+import argparse
+import os
+import shutil
+import sys
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from pathlib import Path
+
+from cache import Cache, remove_intermediates
+from compiler import Parser, Compiler, get_parser
+from fastpath import parse_blocks, emit_document
+from tex_worker import ensure_format
+from texlog import LogEntry, read_log, format_entries
+from engines import ENGINES, PURPOSES, choose_engine
+from streaming import STREAM_THRESHOLD, compile_file
+from profiler import Profile, dump_json, dump_chrome_trace, format_totals
+
+SOURCE_SUFFIXES = {".txt"}
+
+
+def collect_sources(paths):
+    sources = []
+    for path in map(Path, paths):
+        if path.is_dir():
+            sources.extend(sorted(p for p in path.rglob("*") if p.suffix in SOURCE_SUFFIXES and p.is_file()))
+        elif path.is_file():
+            sources.append(path)
+        else:
+            raise FileNotFoundError(f"No such file or directory: {path}")
+    return sources
+
+
+def source_line_mapper(line_map, text: str):
+    """Returns a function from .tex lines to 1-based lines of text, for error reports."""
+    def source_line(tex_line):
+        offset = line_map.source_offset(tex_line)
+        return None if offset is None else text.count("\n", 0, offset) + 1
+    return source_line
+
+
+def build_one(source_path: str, out_dir: str, make_pdf: bool, engine_name: str = "pdflatex"):
+    """
+    Builds a single document. Runs in a worker process; returns
+    (source, pdf or tex path, profile as a dict).
+    """
+    try:
+        return _build_one(source_path, out_dir, make_pdf, engine_name)
+    except Exception as e:
+        # parser exceptions carry unpicklable state; only the message crosses processes
+        raise RuntimeError(f"{type(e).__name__}: {e}") from None
+
+
+def _build_one(source_path: str, out_dir: str, make_pdf: bool, engine_name: str):
+    profile = Profile(source_path)
+    base_dir = Path(out_dir) / Cache.id_for(source_path)
+    base_dir.mkdir(parents=True, exist_ok=True)
+    tex_path = base_dir / "main.tex"
+
+    parser = Parser()
+    compiler = Compiler()
+    source_line = None      # .tex line -> source line, for error reports
+    if os.path.getsize(source_path) >= STREAM_THRESHOLD:
+        stats = compile_file(source_path, tex_path, parser, compiler)
+        profile.record("parse", stats.parse_seconds, bytes_in=stats.bytes_in, blocks=stats.blocks,
+                       largest_block=stats.largest_block)
+        profile.record("compile", stats.compile_seconds, bytes_out=stats.bytes_out)
+    else:
+        with profile.stage("read") as stage:
+            with open(source_path, "r", encoding="utf-8") as f:
+                text = f.read()
+            stage.bytes_out = len(text)
+        with profile.stage("parse", bytes_in=len(text)) as stage:
+            starts = []
+            blocks = parse_blocks(text, starts)
+            stage.args["fast_path"] = blocks is not None
+        tree = None
+        if blocks is None:
+            # Lark is only loaded (once per worker process) for documents the fast path rejects
+            with profile.stage("grammar"):
+                get_parser()
+            with profile.stage("parse", bytes_in=len(text)) as stage:
+                stage.args["fast_path"] = False
+                tree = parser.parse(text)
+        with profile.stage("compile") as stage:
+            with open(tex_path, "w", encoding="utf-8") as f:
+                if blocks is None:
+                    compiler.compile_to(tree, f)
+                else:
+                    emit_document(blocks, starts, f.write, compiler, len(text))
+            stage.bytes_out = tex_path.stat().st_size
+        source_line = source_line_mapper(compiler.line_map, text)
+    if not make_pdf:
+        return source_path, str(tex_path), profile.to_dict()
+
+    engine = choose_engine("export", engine_name, tex_path.stat().st_size)
+    result = engine.run(base_dir, tex_path.name, Compiler.PREAMBLE)
+    pdf_size = os.path.getsize(result.pdf_path) if os.path.exists(result.pdf_path) else 0
+    for program, seconds in result.steps.items():
+        profile.record(program, seconds, bytes_in=tex_path.stat().st_size, bytes_out=pdf_size,
+                       engine=result.engine, warm_format=result.warm, passes=result.passes)
+    if result.returncode != 0:
+        entries = read_log(result.log_path)
+        raise RuntimeError(format_entries(entries, source_line) if entries else result.output)
+    if not result.ok:
+        raise RuntimeError("PDF not created")
+    remove_intermediates(base_dir)
+    return source_path, result.pdf_path, profile.to_dict()
+
+
+def build(args) -> int:
+    try:
+        sources = collect_sources(args.paths)
+    except FileNotFoundError as e:
+        print(e, file=sys.stderr)
+        return 2
+
+    make_pdf = not args.no_pdf
+    if args.daemon and make_pdf:
+        return build_with_daemon(sources, args)
+    engine = None
+    if make_pdf:
+        try:
+            engine = choose_engine("export", args.engine)
+        except ValueError as e:
+            print(e, file=sys.stderr)
+            return 2
+        if not engine.available():
+            print(f"{engine.name} not found; use --no-pdf to only generate LaTeX", file=sys.stderr)
+            return 2
+        if "format" in engine.capabilities or args.engine == "auto":
+            # build the shared format once, before the workers race for it
+            ensure_format(Compiler.PREAMBLE)
+
+    failures = 0
+    profiles = []
+    with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+        futures = {pool.submit(build_one, str(s), args.out, make_pdf, args.engine): s for s in sources}
+        for future in as_completed(futures):
+            source = futures[future]
+            try:
+                _, artifact, profile = future.result()
+                profiles.append(Profile.from_dict(profile))
+                print(f"ok    {source} -> {artifact}")
+            except Exception as e:
+                failures += 1
+                print(f"FAIL  {source}\n{str(e).rstrip()}\n", file=sys.stderr)
+
+    return report(len(sources), failures, profiles, args)
+
+
+def build_with_daemon(sources, args) -> int:
+    """
+    Sends every source to the compile daemon, starting it if needed, so runs
+    share its warm parser, caches and TeX workers with each other and with
+    open editor windows.
+    """
+    from daemon import DaemonError, connect, decode_line_map
+
+    def build_remote(source):
+        with connect() as client:
+            reply = client.compile(path=str(source.resolve()), engine=args.engine, purpose="export",
+                                   priority="batch")
+        if not reply["ok"]:
+            if reply.get("errors"):
+                entries = [LogEntry.from_dict(d) for d in reply["errors"]]
+                source_line = None
+                if source.stat().st_size < STREAM_THRESHOLD:
+                    text = source.read_text(encoding="utf-8")
+                    source_line = source_line_mapper(decode_line_map(reply["line_map"]), text)
+                raise RuntimeError(format_entries(entries, source_line))
+            raise RuntimeError(reply.get("error") or "cancelled by a newer build of the same file")
+        artifact = reply["outputs"][0]
+        if Path(args.out).resolve() != Cache.ROOT:
+            base_dir = Path(args.out) / Cache.id_for(source)
+            base_dir.mkdir(parents=True, exist_ok=True)
+            artifact = shutil.copy(artifact, base_dir / f"main{Path(artifact).suffix}")
+        return artifact, Profile.from_dict(reply["profile"])
+
+    failures = 0
+    profiles = []
+    # the daemon runs the TeX jobs; threads here only wait on it
+    with ThreadPoolExecutor(max_workers=args.jobs) as pool:
+        futures = {pool.submit(build_remote, s): s for s in sources}
+        for future in as_completed(futures):
+            source = futures[future]
+            try:
+                artifact, profile = future.result()
+                profiles.append(profile)
+                print(f"ok    {source} -> {artifact}")
+            except DaemonError as e:
+                print(e, file=sys.stderr)
+                return 2
+            except Exception as e:
+                failures += 1
+                print(f"FAIL  {source}\n{str(e).rstrip()}\n", file=sys.stderr)
+    return report(len(sources), failures, profiles, args)
+
+
+def report(total, failures, profiles, args) -> int:
+    print(f"{total - failures}/{total} built", file=sys.stderr)
+    if args.profile or args.trace:
+        print(format_totals(profiles), file=sys.stderr)
+    if args.profile:
+        dump_json(profiles, args.profile)
+    if args.trace:
+        dump_chrome_trace(profiles, args.trace)
+    return 1 if failures else 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="latexapp")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build_parser = subparsers.add_parser("build", help="compile source files to PDF")
+    build_parser.add_argument("paths", nargs="+", help="source files or directories")
+    build_parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(), help="parallel workers")
+    build_parser.add_argument("--out", default=str(Cache.ROOT), help="artifact root (default: latex_files/)")
+    build_parser.add_argument("--no-pdf", action="store_true", help="only generate main.tex")
+    build_parser.add_argument("--engine", default="auto",
+                              choices=["auto"] + [n for n, e in ENGINES.items() if e.capabilities & PURPOSES["export"]],
+                              help="PDF engine (default: the fastest measured one)")
+    build_parser.add_argument("--daemon", action="store_true",
+                              help="compile through the shared compile daemon (see daemon.py)")
+    build_parser.add_argument("--profile", metavar="PATH", help="write per-stage timings as JSON")
+    build_parser.add_argument("--trace", metavar="PATH", help="write a Chrome trace of every compile")
+    build_parser.set_defaults(func=build)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
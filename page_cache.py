@@ -0,0 +1,209 @@
+"""
+Rasterized PDF pages for the preview pane.
+
+Pages are rendered to PNG in a thread pool and cached under
+Cache.ROOT/pages by a hash of the page's content, so after a compile only
+pages whose content changed are rendered again and swapped into the
+viewer. Visible pages are rendered first.
+
+Rendering uses PyMuPDF (fitz) when it is installed; page keys then come
+from the page's content stream and resources, before anything is rendered.
+Otherwise poppler's pdftoppm renders the pages and the PNG bytes are the
+key. With neither, available() is False and the GUI loads the PDF itself.
+"""
+import hashlib
+import importlib.util
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from cache import Cache
+
+# PyMuPDF is imported on first render; found here without loading it
+HAS_FITZ = importlib.util.find_spec("fitz") is not None
+
+PAGE_DIR = Cache.ROOT / "pages"
+PDFTOPPM = "pdftoppm"
+PDFINFO = "pdfinfo"
+DEFAULT_DPI = 110
+
+
+def available() -> bool:
+    return HAS_FITZ or shutil.which(PDFTOPPM) is not None
+
+
+def _pdf_page_count(pdf_path) -> int | None:
+    """Page count from poppler's pdfinfo; None if it is missing or fails."""
+    if shutil.which(PDFINFO) is None:
+        return None
+    try:
+        result = subprocess.run([PDFINFO, pdf_path], capture_output=True, text=True, timeout=30)
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+    for line in result.stdout.splitlines():
+        if line.startswith("Pages:"):
+            return int(line.split()[1])
+    return None
+
+
+class PageImage:
+    __slots__ = ("index", "key", "path")
+
+    def __init__(self, index, key, path):
+        self.index = index
+        self.key = key
+        self.path = path
+
+
+def _fitz_page_key(doc, page, dpi) -> str:
+    h = hashlib.blake2b(digest_size=16)
+    h.update(f"{dpi}:{tuple(page.rect)}".encode())
+    h.update(page.read_contents())
+    # subset tags in the base font names change whenever the embedded glyphs do
+    for font in page.get_fonts(full=True):
+        h.update(repr(font[3:5]).encode())
+    xrefs = {image[0] for image in page.get_images(full=True)} | {xobject[0] for xobject in page.get_xobjects()}
+    for xref in sorted(xrefs):
+        h.update(doc.xref_stream_raw(xref) or b"")
+    return h.hexdigest()
+
+
+class PageRasterizer:
+    DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+    def __init__(self, root: Path | None = None, dpi: int = DEFAULT_DPI, max_workers: int | None = None,
+                 max_bytes: int = DEFAULT_MAX_BYTES):
+        self.root = root or PAGE_DIR
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.dpi = dpi
+        self.max_bytes = max_bytes
+        self.executor = ThreadPoolExecutor(max_workers=max_workers or os.cpu_count() or 1,
+                                           thread_name_prefix="page")
+        self._lock = threading.Lock()
+
+    def path_for(self, key: str) -> Path:
+        return self.root / f"{key}.png"
+
+    def _cached(self, key):
+        path = self.path_for(key)
+        try:
+            os.utime(path)       # mtime doubles as last use for trim()
+        except FileNotFoundError:
+            return None
+        return path
+
+    # ---------- Rendering ----------
+    def render(self, pdf_path, first=()):
+        """
+        Yields a PageImage for every page of pdf_path, pages in first (e.g.
+        the visible ones) before the rest.
+        """
+        try:
+            if HAS_FITZ:
+                yield from self._render_fitz(str(pdf_path), first)
+            else:
+                yield from self._render_pdftoppm(str(pdf_path), first)
+        finally:
+            # also when the caller drops the generator for a newer revision
+            self.trim()
+
+    def _render_fitz(self, pdf_path, first):
+        import fitz
+        # one snapshot for keys and pages, even if the next compile rewrites the file meanwhile
+        data = Path(pdf_path).read_bytes()
+        with fitz.open(stream=data, filetype="pdf") as doc:
+            keys = [_fitz_page_key(doc, page, self.dpi) for page in doc]
+        order = list(dict.fromkeys(i for i in first if 0 <= i < len(keys)))
+        seen = set(order)
+        order += [i for i in range(len(keys)) if i not in seen]
+        futures = []
+        for index in order:
+            path = self._cached(keys[index])
+            if path is None:
+                futures.append((index, self.executor.submit(self._render_page, data, index, keys[index])))
+            else:
+                futures.append((index, None))
+        for index, future in futures:
+            path = self.path_for(keys[index]) if future is None else future.result()
+            yield PageImage(index, keys[index], path)
+
+    def _render_page(self, data, index, key):
+        import fitz
+        # documents are not shared between threads
+        with fitz.open(stream=data, filetype="pdf") as doc:
+            pixmap = doc[index].get_pixmap(dpi=self.dpi)
+        path = self.path_for(key)
+        tmp_path = path.with_suffix(f".{threading.get_ident()}.tmp")
+        pixmap.save(str(tmp_path), output="png")
+        os.replace(tmp_path, path)
+        return path
+
+    def _render_pdftoppm(self, pdf_path, first):
+        page_count = _pdf_page_count(pdf_path)
+        # the visible pages may be past the end of a document that just shrank
+        first = sorted(i for i in first if i >= 0 and (page_count is None or i < page_count))
+        ranges = []
+        if first:
+            ranges.append((first[0] + 1, first[-1] + 1))
+            if first[0] > 0:
+                ranges.append((1, first[0]))
+            ranges.append((first[-1] + 2, None))
+        else:
+            ranges.append((1, None))
+        rendered = False
+        error = None
+        with tempfile.TemporaryDirectory(prefix="pages-") as workdir:
+            for start, end in ranges:
+                if page_count is not None and start > page_count:
+                    continue
+                command = [PDFTOPPM, "-png", "-r", str(self.dpi), "-f", str(start)]
+                if end is not None:
+                    command += ["-l", str(end)]
+                result = subprocess.run(command + [pdf_path, os.path.join(workdir, "page")],
+                                        capture_output=True, timeout=120)
+                if result.returncode != 0:
+                    # without pdfinfo a range can start past the last page; the others still render
+                    error = result.stderr.decode(errors="replace").strip() or f"{PDFTOPPM} failed"
+                    continue
+                rendered = True
+                pages = sorted(Path(workdir).glob("page-*.png"), key=lambda p: int(p.stem.rsplit("-", 1)[1]))
+                for png in pages:
+                    data = png.read_bytes()
+                    key = hashlib.blake2b(data, digest_size=16).hexdigest()
+                    path = self._cached(key)
+                    if path is None:
+                        path = self.path_for(key)
+                        os.replace(png, path)
+                    else:
+                        png.unlink()
+                    yield PageImage(int(png.stem.rsplit("-", 1)[1]) - 1, key, path)
+        if not rendered and error is not None:
+            raise RuntimeError(error)
+
+    # ---------- Eviction ----------
+    def trim(self):
+        """Deletes the least recently used page images beyond max_bytes."""
+        with self._lock:
+            entries = []
+            for path in self.root.glob("*.png"):
+                try:
+                    stat = path.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    path.unlink()
+                except FileNotFoundError:
+                    pass
+                total -= size
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
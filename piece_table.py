@@ -0,0 +1,301 @@
+"""
+Piece table document model for huge files.
+
+The original file is memory-mapped and never copied; edits go to an
+append-only buffer and the document is the sequence of pieces pointing
+into either one. A sparse newline index over each buffer makes line
+lookups cheap, so the GUI can show a window of lines and the compile path
+can read the document piece by piece.
+"""
+import mmap
+import os
+import tempfile
+from array import array
+from bisect import bisect_right
+
+from saving import file_mode
+
+# one index mark per LINE_STRIDE newlines
+LINE_STRIDE = 256
+READ_CHUNK = 1024 * 1024
+
+
+# =======================
+# Buffers
+# =======================
+
+class _Buffer:
+    """A byte buffer (mmap, bytes or an append-only bytearray) with a sparse newline index."""
+
+    def __init__(self, data):
+        self.data = data
+        self._marks = array("q")        # offset of newline number i * LINE_STRIDE
+        self._indexed_to = 0             # bytes scanned so far
+        self._indexed_lines = 0          # newlines seen so far
+
+    def __len__(self):
+        return len(self.data)
+
+    def _index(self, upto):
+        data = self.data
+        pos = self._indexed_to
+        lines = self._indexed_lines
+        while pos < upto:
+            nl = data.find(b"\n", pos, upto)
+            if nl == -1:
+                pos = upto
+                break
+            if lines % LINE_STRIDE == 0:
+                self._marks.append(nl)
+            lines += 1
+            pos = nl + 1
+        self._indexed_to = pos
+        self._indexed_lines = lines
+
+    def _count_raw(self, start, end):
+        count = 0
+        while start < end:
+            stop = min(start + READ_CHUNK, end)
+            count += self.data[start:stop].count(b"\n")
+            start = stop
+        return count
+
+    def count_newlines(self, start, end):
+        if isinstance(self.data, mmap.mmap) and end - start > 4 * READ_CHUNK:
+            self._index(end)
+            return self._lines_before(end) - self._lines_before(start)
+        return self._count_raw(start, end)
+
+    def nth_newline(self, start, end, n):
+        """Offset of the n-th (0-based) newline in data[start:end], or -1."""
+        if isinstance(self.data, mmap.mmap) and n >= LINE_STRIDE:
+            self._index(end)
+            target = self._lines_before(start) + n
+            mark = target // LINE_STRIDE
+            if mark < len(self._marks):
+                return self._find_nth(self._marks[mark], end, target - mark * LINE_STRIDE)
+        return self._find_nth(start, end, n)
+
+    def _lines_before(self, offset):
+        """Newlines in data[:offset]; the index must cover offset."""
+        i = bisect_right(self._marks, offset - 1) - 1
+        if i < 0:
+            return self._count_raw(0, offset)
+        return i * LINE_STRIDE + 1 + self._count_raw(self._marks[i] + 1, offset)
+
+    def _find_nth(self, pos, end, n):
+        data = self.data
+        while True:
+            nl = data.find(b"\n", pos, end)
+            if nl == -1 or n == 0:
+                return nl
+            n -= 1
+            pos = nl + 1
+
+
+class Piece:
+    __slots__ = ("buffer", "start", "end", "newlines")
+
+    def __init__(self, buffer, start, end, newlines=None):
+        self.buffer = buffer
+        self.start = start
+        self.end = end
+        self.newlines = buffer.count_newlines(start, end) if newlines is None else newlines
+
+    def __len__(self):
+        return self.end - self.start
+
+
+# =======================
+# Piece Table
+# =======================
+
+class PieceTable:
+    def __init__(self, data: bytes = b"", path: str | None = None):
+        self.path = path
+        self._file = None
+        self._map = None
+        self.original = _Buffer(data)
+        self.added = _Buffer(bytearray())
+        self.pieces = [Piece(self.original, 0, len(data))] if data else []
+        self.modified = False
+
+    @classmethod
+    def from_file(cls, path):
+        table = cls(path=path)
+        table._load(path)
+        return table
+
+    def _load(self, path):
+        self.close()
+        self._file = open(path, "rb")
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # empty files cannot be mapped
+            self._map = None
+        self.original = _Buffer(self._map if self._map is not None else b"")
+        self.added = _Buffer(bytearray())
+        self.pieces = [Piece(self.original, 0, len(self.original))] if len(self.original) else []
+        self.modified = False
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    # ---------- Size ----------
+    def __len__(self):
+        return sum(len(p) for p in self.pieces)
+
+    def line_count(self):
+        """Number of lines, counting a final line without a newline."""
+        newlines = sum(p.newlines for p in self.pieces)
+        size = len(self)
+        if size == 0:
+            return 0
+        return newlines + (0 if self._byte_at(size - 1) == b"\n" else 1)
+
+    # ---------- Reading ----------
+    def _locate(self, offset):
+        """Returns (piece index, piece start offset) of the piece holding offset."""
+        pos = 0
+        for i, piece in enumerate(self.pieces):
+            if offset < pos + len(piece):
+                return i, pos
+            pos += len(piece)
+        return len(self.pieces), pos
+
+    def _byte_at(self, offset):
+        i, pos = self._locate(offset)
+        piece = self.pieces[i]
+        at = piece.start + offset - pos
+        return bytes(piece.buffer.data[at:at + 1])
+
+    def iter_chunks(self, start=0, end=None, chunk_size=READ_CHUNK):
+        """Yields the bytes of [start, end) piece by piece, never more than chunk_size at once."""
+        end = len(self) if end is None else end
+        pos = 0
+        for piece in self.pieces:
+            piece_end = pos + len(piece)
+            lo, hi = max(start, pos), min(end, piece_end)
+            while lo < hi:
+                stop = min(lo + chunk_size, hi)
+                yield bytes(piece.buffer.data[piece.start + lo - pos:piece.start + stop - pos])
+                lo = stop
+            pos = piece_end
+            if pos >= end:
+                break
+
+    def read(self, start=0, end=None) -> bytes:
+        return b"".join(self.iter_chunks(start, end))
+
+    def line_offset(self, line):
+        """Byte offset where line (0-based) starts; len(self) past the last line."""
+        if line <= 0:
+            return 0
+        remaining = line - 1     # find the (line-1)-th newline overall
+        pos = 0
+        for piece in self.pieces:
+            if remaining < piece.newlines:
+                nl = piece.buffer.nth_newline(piece.start, piece.end, remaining)
+                return pos + nl - piece.start + 1
+            remaining -= piece.newlines
+            pos += len(piece)
+        return pos
+
+    def lines(self, first, count) -> str:
+        start = self.line_offset(first)
+        end = self.line_offset(first + count)
+        return self.read(start, end).decode("utf-8")
+
+    # ---------- Editing ----------
+    def replace(self, start, end, data: bytes):
+        if start == end and not data:
+            return
+        inserted = None
+        if data:
+            added = self.added
+            offset = len(added.data)
+            added.data.extend(data)
+            inserted = Piece(added, offset, offset + len(data))
+
+        new_pieces = []
+        placed = False
+        pos = 0
+        for piece in self.pieces:
+            piece_end = pos + len(piece)
+            if piece_end <= start or (placed and pos >= end):
+                new_pieces.append(piece)
+            else:
+                if pos < start:
+                    new_pieces.append(Piece(piece.buffer, piece.start, piece.start + start - pos))
+                if not placed:
+                    if inserted is not None:
+                        new_pieces.append(inserted)
+                    placed = True
+                if pos >= end:
+                    new_pieces.append(piece)
+                elif piece_end > end:
+                    new_pieces.append(Piece(piece.buffer, piece.start + end - pos, piece.end))
+            pos = piece_end
+        if not placed and inserted is not None:
+            new_pieces.append(inserted)
+        self.pieces = new_pieces
+        self.modified = True
+
+    def insert(self, offset, data: bytes):
+        self.replace(offset, offset, data)
+
+    def delete(self, start, end):
+        self.replace(start, end, b"")
+
+    def replace_lines(self, first, count, text: str):
+        self.replace(self.line_offset(first), self.line_offset(first + count), text.encode("utf-8"))
+
+    # ---------- Saving ----------
+    def _changed_runs(self):
+        """
+        Returns the (offset, piece) pairs that differ from the file on disk,
+        or None if an original piece moved and the file must be rewritten.
+        """
+        runs = []
+        pos = 0
+        for piece in self.pieces:
+            if piece.buffer is self.original:
+                if piece.start != pos:
+                    return None
+            else:
+                runs.append((pos, piece))
+            pos += len(piece)
+        return runs
+
+    def save(self, path: str | None = None):
+        """
+        Writes the document. Saving back to the mapped file only writes the
+        pieces that changed when no original text moved; otherwise the file
+        is rewritten through a temp file and renamed into place.
+        """
+        path = path or self.path
+        same_file = self.path is not None and os.path.exists(path) and os.path.samefile(path, self.path)
+        runs = self._changed_runs() if same_file else None
+        if runs is not None:
+            size = len(self)
+            with open(path, "r+b") as f:
+                for offset, piece in runs:
+                    f.seek(offset)
+                    f.write(piece.buffer.data[piece.start:piece.end])
+                f.truncate(size)
+        else:
+            directory = os.path.dirname(os.path.abspath(path))
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".save-")
+            with os.fdopen(fd, "wb") as f:
+                for chunk in self.iter_chunks():
+                    f.write(chunk)
+            os.chmod(tmp_path, file_mode(path))
+            os.replace(tmp_path, path)
+        self.path = path
+        self._load(path)
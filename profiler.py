@@ -0,0 +1,135 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+
+# =======================
+# Stages
+# =======================
+
+class Stage:
+    """One timed step of a compile: wall time, bytes in/out and cache outcome."""
+    __slots__ = ("name", "start", "elapsed", "bytes_in", "bytes_out", "cache", "args")
+
+    def __init__(self, name, start, elapsed=0.0, bytes_in=0, bytes_out=0, cache=None, args=None):
+        self.name = name
+        self.start = start          # wall clock, seconds since the epoch
+        self.elapsed = elapsed      # seconds
+        self.bytes_in = bytes_in
+        self.bytes_out = bytes_out
+        self.cache = cache          # None, "hit" or "miss"
+        self.args = args or {}
+
+    def to_dict(self):
+        return {
+            "name": self.name, "start": self.start, "elapsed": self.elapsed,
+            "bytes_in": self.bytes_in, "bytes_out": self.bytes_out,
+            "cache": self.cache, "args": self.args,
+        }
+
+
+class Profile:
+    """
+    Records the stages of a single compile (grammar, parse, compile,
+    write_tex, pdf_cache, pdflatex, ...). Stages may be recorded from
+    worker threads.
+    """
+
+    def __init__(self, label: str = ""):
+        self.label = label
+        self.pid = os.getpid()
+        self.stages = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name: str, bytes_in: int = 0):
+        stage = Stage(name, time.time(), bytes_in=bytes_in)
+        start = time.perf_counter()
+        try:
+            yield stage
+        finally:
+            stage.elapsed = time.perf_counter() - start
+            with self._lock:
+                self.stages.append(stage)
+
+    def record(self, name: str, elapsed: float, bytes_in: int = 0, bytes_out: int = 0, cache=None, **args):
+        """Adds a stage that was timed elsewhere, e.g. by the TeX runner."""
+        stage = Stage(name, time.time() - elapsed, elapsed, bytes_in, bytes_out, cache, args)
+        with self._lock:
+            self.stages.append(stage)
+        return stage
+
+    @property
+    def total(self) -> float:
+        return sum(stage.elapsed for stage in self.stages)
+
+    def summary(self) -> str:
+        parts = []
+        for stage in self.stages:
+            part = f"{stage.name} {stage.elapsed * 1000:.1f} ms"
+            if stage.cache is not None:
+                part += f" ({stage.cache})"
+            parts.append(part)
+        parts.append(f"total {self.total * 1000:.1f} ms")
+        return " · ".join(parts)
+
+    def to_dict(self):
+        return {"label": self.label, "pid": self.pid, "stages": [s.to_dict() for s in self.stages]}
+
+    @classmethod
+    def from_dict(cls, data):
+        profile = cls(data.get("label", ""))
+        profile.pid = data.get("pid", profile.pid)
+        profile.stages = [Stage(**stage) for stage in data["stages"]]
+        return profile
+
+    def chrome_trace_events(self, tid=0):
+        events = []
+        for stage in self.stages:
+            args = {"bytes_in": stage.bytes_in, "bytes_out": stage.bytes_out, "label": self.label}
+            if stage.cache is not None:
+                args["cache"] = stage.cache
+            args.update(stage.args)
+            events.append({
+                "name": stage.name, "cat": "compile", "ph": "X",
+                "ts": stage.start * 1e6, "dur": stage.elapsed * 1e6,
+                "pid": self.pid, "tid": tid, "args": args,
+            })
+        return events
+
+
+# =======================
+# Reports
+# =======================
+
+def stage_totals(profiles):
+    """Returns {stage name: (count, total seconds)} across profiles, in first-seen order."""
+    totals = {}
+    for profile in profiles:
+        for stage in profile.stages:
+            count, elapsed = totals.get(stage.name, (0, 0.0))
+            totals[stage.name] = (count + 1, elapsed + stage.elapsed)
+    return totals
+
+
+def format_totals(profiles) -> str:
+    lines = [f"{'stage':<12}{'count':>7}{'total (s)':>12}{'mean (ms)':>12}"]
+    for name, (count, elapsed) in stage_totals(profiles).items():
+        lines.append(f"{name:<12}{count:>7}{elapsed:>12.3f}{elapsed / count * 1000:>12.1f}")
+    return "\n".join(lines)
+
+
+def dump_json(profiles, path):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump([p.to_dict() for p in profiles], f, indent=2)
+
+
+def dump_chrome_trace(profiles, path):
+    """Writes a trace loadable in chrome://tracing or Perfetto."""
+    events = []
+    for tid, profile in enumerate(profiles):
+        events.extend(profile.chrome_trace_events(tid))
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
@@ -0,0 +1,142 @@
+"""
+Saving source files without blocking the GUI.
+
+Buffer tracks whether the editor text differs from the file on disk by
+content hash, so saves and autosaves of unchanged text are skipped. Writes
+go through a temp file in the target directory that is renamed over the
+target, on a single background thread; piece-table documents are saved on
+the same thread.
+"""
+import os
+import hashlib
+import stat
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+def content_hash(content: str) -> str:
+    return hashlib.md5(content.encode("utf-8")).hexdigest()
+
+
+def _read_umask() -> int:
+    umask = os.umask(0)
+    os.umask(umask)
+    return umask
+
+
+# read once: os.umask can only be read by setting it, which races other threads
+UMASK = _read_umask()
+
+
+def file_mode(path) -> int:
+    """
+    Permission bits for a file written over path: those of the existing
+    file, or the umask default for a new one (mkstemp creates files 0600).
+    """
+    try:
+        return stat.S_IMODE(os.stat(path).st_mode)
+    except FileNotFoundError:
+        return 0o666 & ~UMASK
+
+
+def atomic_write(path, content: str):
+    """Writes content to a temp file next to path, then renames it over path."""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".save-", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp_path, file_mode(path))
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
+
+
+# =======================
+# Buffer
+# =======================
+
+class Buffer:
+    """Content hash of a file as last loaded or saved."""
+
+    def __init__(self, path: str | None = None, content: str | None = None):
+        self.path = path
+        self.hash = content_hash(content) if content is not None else None
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "r", encoding="utf-8") as f:
+            content = f.read()
+        return cls(path, content), content
+
+    def is_dirty(self, content: str) -> bool:
+        return self.hash != content_hash(content)
+
+    def mark_saved(self, saved_hash: str):
+        self.hash = saved_hash
+
+
+# =======================
+# Save Queue
+# =======================
+
+class SaveQueue:
+    """
+    Writes files on a background thread, one at a time. A save queued while
+    an older one for the same path is still waiting replaces it, so bursts of
+    saves (e.g. autosave) only write the newest content.
+    """
+
+    def __init__(self):
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="save")
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def submit(self, path, content: str, on_done=None):
+        """
+        Queues a write of content to path. on_done(path, content hash, error)
+        runs on the save thread once the write finished or failed.
+        """
+        def write():
+            atomic_write(path, content)
+            return content_hash(content)
+        self._queue(path, write, on_done)
+
+    def submit_document(self, document, on_done=None):
+        """
+        Queues document.save() for a piece_table.PieceTable. The document
+        must not be read or edited until on_done ran; it gets an empty hash.
+        """
+        def write():
+            document.save()
+            return ""
+        self._queue(document.path, write, on_done)
+
+    def _queue(self, path, write, on_done):
+        with self._lock:
+            queued = path in self._pending
+            self._pending[path] = (write, on_done)
+        if not queued:
+            self.executor.submit(self._write, path)
+
+    def _write(self, path):
+        with self._lock:
+            write, on_done = self._pending.pop(path)
+        saved_hash, error = "", None
+        try:
+            saved_hash = write()
+        except Exception as e:
+            # on_done must run whatever failed: the GUI keeps the editor read-only until it does
+            error = str(e) or type(e).__name__
+        if on_done is not None:
+            on_done(path, saved_hash, error)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
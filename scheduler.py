@@ -0,0 +1,255 @@
+"""
+Central scheduler for TeX jobs.
+
+Every pdflatex / latex run in the process (live preview, equation
+fragments, format builds, exports) goes through one CompileScheduler, which
+runs at most one job per core. Jobs are taken by priority, and one slot is
+kept free of background work so an interactive preview never waits behind
+a batch of exports. Jobs submitted with the same key while an earlier one
+is still queued or running share it instead of running twice.
+"""
+import heapq
+import itertools
+import os
+import threading
+import time
+from concurrent.futures import Future, wait
+from enum import IntEnum
+
+CANCEL_TIMEOUT = 5      # seconds cancel waits for a killed job to return
+
+
+class Priority(IntEnum):
+    INTERACTIVE = 0
+    FRAGMENT = 1
+    BATCH = 2
+
+
+class Job:
+    __slots__ = ("key", "priority", "fn", "future", "waiters", "process", "cancelled",
+                 "submitted", "started", "finished")
+
+    def __init__(self, key, priority, fn):
+        self.key = key
+        self.priority = priority
+        self.fn = fn
+        self.future = Future()
+        self.waiters = 1
+        self.process = None
+        self.cancelled = False
+        self.submitted = time.perf_counter()
+        self.started = None
+        self.finished = None
+
+    def attach(self, process):
+        """Registers the job's subprocess so cancelling the job can kill it."""
+        self.process = process
+        if self.cancelled:
+            process.kill()
+
+    @property
+    def wait_seconds(self) -> float:
+        return (self.started or time.perf_counter()) - self.submitted
+
+
+class SchedulerStats:
+    __slots__ = ("submitted", "merged", "completed", "failed", "cancelled", "max_depth", "wait", "run")
+
+    def __init__(self):
+        self.submitted = 0
+        self.merged = 0
+        self.completed = 0
+        self.failed = 0
+        self.cancelled = 0
+        self.max_depth = 0
+        self.wait = {p: [0, 0.0] for p in Priority}    # priority -> [jobs, seconds queued]
+        self.run = {p: [0, 0.0] for p in Priority}     # priority -> [jobs, seconds running]
+
+
+class CompileScheduler:
+    def __init__(self, max_workers: int | None = None, reserved_interactive: int = 1):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        # slots background jobs may not take; none if there is only one
+        self.reserved_interactive = min(reserved_interactive, self.max_workers - 1)
+        self.stats = SchedulerStats()
+        self._heap = []
+        self._seq = itertools.count()
+        self._jobs = {}                 # key -> queued or running job
+        self._queued = 0
+        self._running = 0
+        self._running_background = 0
+        self._closed = False
+        self._cond = threading.Condition()
+        self._threads = [
+            threading.Thread(target=self._work, name=f"tex-job-{i}", daemon=True)
+            for i in range(self.max_workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    # ---------- Submitting ----------
+    def submit(self, fn, priority: Priority = Priority.BATCH, key=None) -> Job:
+        """
+        Queues fn(job). With a key, a job already queued or running under the
+        same key is returned instead, raised to the higher of both priorities.
+        """
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("scheduler is shut down")
+            self.stats.submitted += 1
+            job = self._jobs.get(key) if key is not None else None
+            if job is not None:
+                job.waiters += 1
+                self.stats.merged += 1
+                if job.started is None and priority < job.priority:
+                    # the old heap entry goes stale and is skipped when popped
+                    job.priority = priority
+                    heapq.heappush(self._heap, (priority, next(self._seq), job))
+                    self._cond.notify()
+                return job
+            job = Job(key, priority, fn)
+            if key is not None:
+                self._jobs[key] = job
+            heapq.heappush(self._heap, (priority, next(self._seq), job))
+            self._queued += 1
+            self.stats.max_depth = max(self.stats.max_depth, self._queued)
+            self._cond.notify()
+            return job
+
+    def cancel(self, job: Job):
+        """
+        Drops one waiter of job. When none are left the job is removed from
+        the queue, or its subprocess is killed if it already started; cancel
+        then waits up to CANCEL_TIMEOUT for the job to return, so the caller
+        can rewrite the job's workdir without racing the killed run.
+        """
+        with self._cond:
+            job.waiters -= 1
+            if job.waiters > 0 or job.cancelled or job.finished is not None:
+                return
+            job.cancelled = True
+            self.stats.cancelled += 1
+            if self._jobs.get(job.key) is job:
+                del self._jobs[job.key]
+            if job.started is None:
+                self._queued -= 1
+                job.future.cancel()
+                return
+            process = job.process
+        if process is not None and process.poll() is None:
+            process.kill()
+        wait([job.future], timeout=CANCEL_TIMEOUT)
+
+    # ---------- Workers ----------
+    def _next_job(self):
+        while self._heap:
+            priority, _, job = self._heap[0]
+            if job.cancelled or job.started is not None or priority != job.priority:
+                heapq.heappop(self._heap)
+                continue
+            if (priority != Priority.INTERACTIVE
+                    and self._running_background >= self.max_workers - self.reserved_interactive):
+                # everything left is background work too
+                return None
+            heapq.heappop(self._heap)
+            return job
+        return None
+
+    def _work(self):
+        while True:
+            with self._cond:
+                job = self._next_job()
+                while job is None:
+                    if self._closed:
+                        return
+                    self._cond.wait()
+                    job = self._next_job()
+                job.started = time.perf_counter()
+                self._queued -= 1
+                self._running += 1
+                if job.priority != Priority.INTERACTIVE:
+                    self._running_background += 1
+                waited = self.stats.wait[job.priority]
+                waited[0] += 1
+                waited[1] += job.wait_seconds
+            job.future.set_running_or_notify_cancel()
+            try:
+                result = job.fn(job)
+            except BaseException as e:
+                error, result = e, None
+            else:
+                error = None
+            with self._cond:
+                job.finished = time.perf_counter()
+                self._running -= 1
+                if job.priority != Priority.INTERACTIVE:
+                    self._running_background -= 1
+                if self._jobs.get(job.key) is job:
+                    del self._jobs[job.key]
+                ran = self.stats.run[job.priority]
+                ran[0] += 1
+                ran[1] += job.finished - job.started
+                if error is None:
+                    self.stats.completed += 1
+                else:
+                    self.stats.failed += 1
+                self._cond.notify_all()
+            if error is None:
+                job.future.set_result(result)
+            else:
+                job.future.set_exception(error)
+
+    # ---------- Reporting ----------
+    def queue_depth(self) -> int:
+        with self._cond:
+            return self._queued
+
+    def running(self) -> int:
+        with self._cond:
+            return self._running
+
+    def snapshot(self) -> dict:
+        with self._cond:
+            stats = self.stats
+            return {
+                "queued": self._queued,
+                "running": self._running,
+                "max_workers": self.max_workers,
+                "submitted": stats.submitted,
+                "merged": stats.merged,
+                "completed": stats.completed,
+                "failed": stats.failed,
+                "cancelled": stats.cancelled,
+                "max_depth": stats.max_depth,
+                "avg_wait_s": {p.name.lower(): (s / n if n else 0.0) for p, (n, s) in stats.wait.items()},
+                "avg_run_s": {p.name.lower(): (s / n if n else 0.0) for p, (n, s) in stats.run.items()},
+            }
+
+    def summary(self) -> str:
+        snap = self.snapshot()
+        waits = " ".join(f"{name} {seconds * 1000:.0f}ms" for name, seconds in snap["avg_wait_s"].items())
+        return f"jobs: {snap['running']}/{snap['max_workers']} running, {snap['queued']} queued, wait {waits}"
+
+    def shutdown(self):
+        with self._cond:
+            self._closed = True
+            for _, _, job in self._heap:
+                if job.started is None and not job.cancelled:
+                    job.cancelled = True
+                    job.future.cancel()
+            self._heap.clear()
+            self._queued = 0
+            self._cond.notify_all()
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler() -> CompileScheduler:
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = CompileScheduler()
+    return _scheduler
@@ -0,0 +1,118 @@
+"""
+Streaming compile for very large source files.
+
+The source is memory-mapped and split at top-level element boundaries with
+incremental.iter_block_spans, which works on the mapping without copying
+it. Each block is decoded, parsed and compiled on its own and its LaTeX is
+written out straight away, so peak memory follows the largest block rather
+than the file size. compiler.line_map is recorded on the way, with offsets
+in characters of the decoded source.
+"""
+import mmap
+import time
+from array import array
+
+from compiler import Parser, Compiler, LineMap
+from incremental import BlockScanner, iter_block_spans, iter_fragment_text, parse_block, make_fragment
+
+# sources at least this large are memory-mapped and compiled block by block
+STREAM_THRESHOLD = 8 * 1024 * 1024
+
+
+class StreamStats:
+    __slots__ = ("blocks", "bytes_in", "bytes_out", "largest_block", "parse_seconds", "compile_seconds")
+
+    def __init__(self):
+        self.blocks = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.largest_block = 0
+        self.parse_seconds = 0.0
+        self.compile_seconds = 0.0
+
+
+def iter_block_bytes(chunks):
+    """
+    Yields top-level blocks from an iterable of byte chunks (e.g. the pieces
+    of a piece_table.PieceTable) without joining the whole document. The
+    block still open at the end of the data so far is held back, since the
+    next chunk may extend it; the scanner resumes inside it rather than
+    rescanning it for every chunk.
+    """
+    scanner = BlockScanner()
+    carry = bytearray()
+    for chunk in chunks:
+        carry += chunk
+        for start, end in scanner.scan(carry, final=False):
+            yield bytes(carry[start:end])
+        # drop the blocks already yielded once they make up half the buffer, so copying stays linear
+        if scanner.start > len(carry) // 2:
+            del carry[:scanner.start]
+            scanner.shift(scanner.start)
+    for start, end in scanner.scan(carry):
+        yield bytes(carry[start:end])
+
+
+def _iter_fragments(blocks, parser, compiler, stats, starts):
+    offset = 0
+    for block in blocks:
+        # markers are ASCII, so block edges never split a UTF-8 sequence
+        text = block.decode("utf-8")
+        starts.append(offset)
+        offset += len(text)
+        began = time.perf_counter()
+        tree = parse_block(text, parser)
+        parsed = time.perf_counter()
+        fragment = make_fragment(tree, compiler)
+        stats.parse_seconds += parsed - began
+        stats.compile_seconds += time.perf_counter() - parsed
+        stats.blocks += 1
+        stats.bytes_in += len(block)
+        stats.largest_block = max(stats.largest_block, len(block))
+        yield fragment
+
+
+def compile_stream(buf, fp, parser: Parser | None = None, compiler: Compiler | None = None) -> StreamStats:
+    """Compiles a bytes-like buffer (bytes, mmap) into the text file fp, block by block."""
+    blocks = (buf[start:end] for start, end in iter_block_spans(buf))
+    return compile_blocks(blocks, fp, parser, compiler)
+
+
+def compile_chunks(chunks, fp, parser: Parser | None = None, compiler: Compiler | None = None) -> StreamStats:
+    """Compiles a document given as byte chunks into the text file fp, block by block."""
+    return compile_blocks(iter_block_bytes(chunks), fp, parser, compiler)
+
+
+def compile_blocks(blocks, fp, parser: Parser | None = None, compiler: Compiler | None = None) -> StreamStats:
+    parser = parser or Parser()
+    compiler = compiler or Compiler()
+    stats = StreamStats()
+
+    def write(text):
+        fp.write(text)
+        stats.bytes_out += len(text)
+
+    write(compiler.PREAMBLE + compiler.BEGIN_DOCUMENT)
+    line_map = LineMap()
+    tex_line = compiler.body_line()
+    starts = array("q")
+    for i, text in enumerate(iter_fragment_text(_iter_fragments(blocks, parser, compiler, stats, starts))):
+        line_map.add(starts[i], tex_line)
+        tex_line += text.count("\n")
+        write(text)
+    line_map.close(tex_line)
+    compiler.line_map = line_map
+    write(compiler.END_DOCUMENT)
+    return stats
+
+
+def compile_file(source_path, tex_path, parser: Parser | None = None, compiler: Compiler | None = None) -> StreamStats:
+    """Memory-maps source_path and streams its LaTeX into tex_path."""
+    with open(source_path, "rb") as src, open(tex_path, "w", encoding="utf-8") as out:
+        try:
+            buf = mmap.mmap(src.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # empty files cannot be mapped
+            return compile_stream(b"", out, parser, compiler)
+        with buf:
+            return compile_stream(buf, out, parser, compiler)
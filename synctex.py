@@ -0,0 +1,78 @@
+"""
+Editor <-> PDF positions through SyncTeX.
+
+pdflatex runs with -synctex=1 and leaves <stem>.synctex.gz next to the PDF
+(PdfCache keeps a copy beside each cached PDF). The `synctex` program that
+ships with TeX Live answers both directions; together with
+compiler.LineMap that gives
+
+    source offset -> .tex line -> page, x, y     (view)
+    page, x, y -> .tex line -> source offset     (edit)
+
+Coordinates are PDF points from the top left corner of the page; pages
+are numbered from 1.
+"""
+import os
+import shutil
+import subprocess
+
+SYNCTEX = "synctex"
+SYNCTEX_SUFFIX = ".synctex.gz"
+TIMEOUT = 5
+
+
+def synctex_path(pdf_path) -> str:
+    return os.path.splitext(str(pdf_path))[0] + SYNCTEX_SUFFIX
+
+
+def available(pdf_path=None) -> bool:
+    if shutil.which(SYNCTEX) is None:
+        return False
+    return pdf_path is None or os.path.exists(synctex_path(pdf_path))
+
+
+def _records(output: str):
+    """Parses synctex's `Key:value` output into one dict per result record."""
+    records = []
+    record = None
+    for line in output.splitlines():
+        key, sep, value = line.partition(":")
+        if not sep:
+            continue
+        if key in ("Output", "Input") or record is None:
+            record = {}
+            records.append(record)
+        record[key] = value
+    return records
+
+
+def _run(args):
+    try:
+        result = subprocess.run([SYNCTEX, *args], capture_output=True, text=True, timeout=TIMEOUT)
+    except (OSError, subprocess.TimeoutExpired):
+        return []
+    if result.returncode != 0:
+        return []
+    return _records(result.stdout)
+
+
+def view(pdf_path, tex_path, tex_line: int, column: int = 0):
+    """Returns (page, x, y) of the first box made from tex_line, or None."""
+    for record in _run(["view", "-i", f"{tex_line}:{column}:{tex_path}", "-o", str(pdf_path)]):
+        try:
+            return int(record["Page"]), float(record["x"]), float(record["y"])
+        except (KeyError, ValueError):
+            continue
+    return None
+
+
+def edit(pdf_path, page: int, x: float, y: float):
+    """Returns the .tex line that produced the point (x, y) of page, or None."""
+    for record in _run(["edit", "-o", f"{page}:{x:.2f}:{y:.2f}:{pdf_path}"]):
+        try:
+            line = int(record["Line"])
+        except (KeyError, ValueError):
+            continue
+        if line > 0:
+            return line
+    return None
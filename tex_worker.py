@@ -0,0 +1,227 @@
+import os
+import re
+import hashlib
+import subprocess
+import threading
+import time
+from pathlib import Path
+
+from cache import Cache
+from scheduler import Job, Priority, get_scheduler
+
+PDFLATEX = "pdflatex"
+FORMAT_DIR = Cache.ROOT / "formats"
+
+
+# =======================
+# Precompiled preamble
+# =======================
+#
+# The preamble (tikz, pgfplots, chemfig, ...) is dumped once into a format
+# file with mylatexformat. Loading the format skips everything up to
+# \begin{document}, so a compile only pays for the document body.
+
+_format_lock = threading.Lock()
+_failed_formats = set()
+
+
+def format_name(preamble: str) -> str:
+    return "preamble-" + hashlib.sha256(preamble.encode()).hexdigest()[:16]
+
+
+def ensure_format(preamble: str, timeout: int = 120) -> str | None:
+    """
+    Returns the name of the format for this preamble, building it on first
+    use. Returns None if the format cannot be built, so callers fall back to
+    a plain compile.
+    """
+    name = format_name(preamble)
+    with _format_lock:
+        if (FORMAT_DIR / f"{name}.fmt").exists():
+            return name
+        if name in _failed_formats:
+            return None
+        FORMAT_DIR.mkdir(parents=True, exist_ok=True)
+        with open(FORMAT_DIR / f"{name}.tex", "w", encoding="utf-8") as f:
+            f.write(preamble + "\\begin{document}\n\\end{document}\n")
+        try:
+            result = subprocess.run(
+                [PDFLATEX, "-ini", "-interaction=nonstopmode", f"-jobname={name}",
+                 "&pdflatex", "mylatexformat.ltx", f"{name}.tex"],
+                cwd=FORMAT_DIR, capture_output=True, text=True, timeout=timeout
+            )
+        except (OSError, subprocess.TimeoutExpired):
+            result = None
+        if result is None or result.returncode != 0 or not (FORMAT_DIR / f"{name}.fmt").exists():
+            _failed_formats.add(name)
+            return None
+        return name
+
+
+# =======================
+# Compile
+# =======================
+
+class CompileResult:
+    def __init__(self, returncode, output, pdf_path, elapsed, warm, engine="pdflatex", outputs=None, steps=None,
+                 passes=1, log_path=None):
+        self.returncode = returncode
+        self.output = output
+        self.pdf_path = pdf_path                  # None for engines without PDF output
+        self.elapsed = elapsed
+        self.warm = warm
+        self.engine = engine
+        self.outputs = outputs if outputs is not None else [pdf_path]
+        self.steps = steps or {engine: elapsed}   # program -> seconds
+        self.passes = passes
+        self.log_path = log_path                  # the TeX log, for texlog.read_log
+
+    @property
+    def ok(self) -> bool:
+        return self.returncode == 0 and bool(self.outputs) and all(os.path.exists(p) for p in self.outputs)
+
+
+def pdflatex_command(tex_filename: str, fmt: str | None = None):
+    # -synctex=1 writes <stem>.synctex.gz for editor <-> PDF jumps (see synctex.py)
+    command = [PDFLATEX, "-interaction=nonstopmode", "-halt-on-error", "-synctex=1"]
+    if fmt is not None:
+        command.append(f"-fmt={fmt}")
+    command.append(tex_filename)
+    return command
+
+
+def pdflatex_env(fmt: str | None = None):
+    if fmt is None:
+        return None
+    env = dict(os.environ)
+    # trailing separator keeps the default search path after ours
+    env["TEXFORMATS"] = f"{FORMAT_DIR}{os.pathsep}{env.get('TEXFORMATS', '')}"
+    return env
+
+
+# =======================
+# Reruns
+# =======================
+#
+# A pass has to be repeated only if it changed the auxiliary files the
+# next pass reads. Their hashes are taken before and after each pass; the
+# files stay in the workdir between compiles, so an unchanged document
+# starts from a settled .aux and needs a single pass.
+
+RERUN_SUFFIXES = (".aux", ".toc", ".out")
+MAX_PASSES = 3
+_WRITEFILE = re.compile(rb"\\@writefile\{(\w+)\}")
+
+
+def _aux_line_matters(line: bytes, workdir: Path, stem: str) -> bool:
+    if line.strip() == b"\\relax" or line.startswith(b"\\gdef \\@abspage@last"):
+        return False
+    # entries for a list (toc, lof, ...) only matter if the document reads that list
+    match = _WRITEFILE.match(line)
+    if match is not None:
+        return (workdir / f"{stem}.{match.group(1).decode()}").exists()
+    return True
+
+
+def rerun_state(workdir, stem: str) -> tuple:
+    """Hashes of the auxiliary files a pass reads; missing files hash as empty."""
+    workdir = Path(workdir)
+    digests = []
+    for suffix in RERUN_SUFFIXES:
+        try:
+            data = (workdir / (stem + suffix)).read_bytes()
+        except FileNotFoundError:
+            data = b""
+        if suffix == ".aux":
+            data = b"\n".join(line for line in data.splitlines() if _aux_line_matters(line, workdir, stem))
+        digests.append(hashlib.blake2b(data, digest_size=16).digest())
+    return tuple(digests)
+
+
+def run_passes(run_pass, workdir, stem: str, max_passes: int = MAX_PASSES):
+    """
+    Calls run_pass() -> (returncode, output, seconds) until the auxiliary
+    files stop changing, a pass fails or max_passes is reached. Returns
+    (returncode, output of the last pass, total seconds, passes).
+    """
+    state = rerun_state(workdir, stem)
+    elapsed = 0.0
+    passes = 0
+    while True:
+        returncode, output, seconds = run_pass()
+        elapsed += seconds
+        passes += 1
+        if returncode != 0 or passes >= max_passes:
+            break
+        new_state = rerun_state(workdir, stem)
+        if new_state == state:
+            break
+        state = new_state
+    return returncode, output, elapsed, passes
+
+
+def compile_tex(workdir, tex_filename: str, preamble: str | None = None, timeout: int = 30,
+                on_process=None, max_passes: int = MAX_PASSES) -> CompileResult:
+    """
+    Runs pdflatex on workdir/tex_filename, repeating the pass while it
+    changes the auxiliary files (see run_passes). With a preamble, the
+    matching precompiled format is used when it can be built. on_process
+    receives each Popen handle as soon as it starts, so callers can kill a
+    stale compile. The timeout applies per pass.
+    """
+    fmt = ensure_format(preamble) if preamble is not None else None
+    stem = os.path.splitext(tex_filename)[0]
+    pdf_path = os.path.join(workdir, stem + ".pdf")
+    command = pdflatex_command(tex_filename, fmt)
+    env = pdflatex_env(fmt)
+    returncode, output, elapsed, passes = run_passes(
+        lambda: run_command(command, workdir, timeout, env, on_process), workdir, stem, max_passes
+    )
+    return CompileResult(returncode, output, pdf_path, elapsed, fmt is not None, passes=passes,
+                         log_path=os.path.join(workdir, stem + ".log"))
+
+
+def run_command(command, workdir, timeout: int, env=None, on_process=None):
+    """Runs one TeX program; returns (returncode, stdout + stderr, seconds). Kills it on timeout and re-raises."""
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        command, cwd=workdir, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, env=env
+    )
+    if on_process is not None:
+        on_process(process)
+    try:
+        stdout, stderr = process.communicate(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.communicate()
+        raise
+    return process.returncode, stdout + "\n" + stderr, time.perf_counter() - start
+
+
+# =======================
+# Scheduling
+# =======================
+
+def submit_compile(workdir, tex_filename: str, preamble: str | None = None,
+                   priority: Priority = Priority.INTERACTIVE, key=None, timeout: int | None = None,
+                   engine=None) -> Job:
+    """
+    Queues a compile on the shared scheduler, with an engines.Engine or
+    plain pdflatex. Pass the LaTeX hash (and engine) as key so identical
+    compiles of the same workdir that overlap run once; the workdir is part
+    of the job key, so a job never reports files another owner's dir holds.
+    job.future holds the CompileResult.
+    """
+    def run(job):
+        if engine is not None:
+            return engine.run(Path(workdir), tex_filename, preamble, timeout, on_process=job.attach)
+        return compile_tex(Path(workdir), tex_filename, preamble, timeout or 30, on_process=job.attach)
+    if key is not None:
+        key = (os.path.abspath(workdir), key)
+    return get_scheduler().submit(run, priority, key)
+
+
+def warm_up(preamble: str) -> Job:
+    """Builds the preamble format in the background, behind any interactive work."""
+    return get_scheduler().submit(lambda job: ensure_format(preamble), Priority.BATCH,
+                                  key=("format", format_name(preamble)))
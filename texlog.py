@@ -0,0 +1,241 @@
+"""
+Errors and warnings from TeX logs.
+
+read_log streams a .log file line by line (TeX wraps it at LOG_WIDTH
+columns; wrapped lines are joined back) and returns LogEntry objects with
+the .tex line each one points at:
+
+    ! Undefined control sequence.          error, line from the `l.N` context
+    ./main.tex:12: Undefined control ...    error (-file-line-error style)
+    LaTeX Warning: ... on input line 7.     warning
+    Package foo Warning: ...                warning, `(foo)` continuation lines
+    Overfull \\hbox ... at lines 3--5        warning
+
+LogCache keeps the entries of failed compiles on disk per LaTeX hash, so
+the same failure is reported again without running TeX.
+"""
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+from cache import Cache
+
+LOG_WIDTH = 79          # TeX's max_print_line
+MAX_ENTRIES = 100       # per log; a broken document can produce thousands
+CONTEXT_LINES = 8       # lines searched for the `l.N` context after an error
+
+ERROR = re.compile(r"! (.*)")
+FILE_LINE_ERROR = re.compile(r"(?:\S*/)?[^/\s:]+\.\w+:(\d+): (.*)")
+CONTEXT = re.compile(r"l\.(\d+) ?(.*)")
+WARNING = re.compile(r"(?:LaTeX|Package (\S+)|Class (\S+)) Warning: (.*)")
+INPUT_LINE = re.compile(r"on input line (\d+)")
+BOX = re.compile(r"(?:Overfull|Underfull) \\[hv]box .*?(?:lines? (\d+)|detected at line (\d+))")
+# follow-ups of an error already reported
+NOISE = ("Emergency stop.", "==> Fatal error occurred, no output PDF file produced!")
+
+
+class LogEntry:
+    __slots__ = ("kind", "message", "tex_line", "context")
+
+    def __init__(self, kind, message, tex_line=None, context=""):
+        self.kind = kind            # "error" | "warning"
+        self.message = message
+        self.tex_line = tex_line    # 1-based line of the .tex file, None if unknown
+        self.context = context
+
+    def __repr__(self):
+        return f"LogEntry({self.kind!r}, {self.message!r}, {self.tex_line!r})"
+
+    def to_dict(self):
+        return {"kind": self.kind, "message": self.message, "tex_line": self.tex_line, "context": self.context}
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(d["kind"], d["message"], d.get("tex_line"), d.get("context", ""))
+
+
+# =======================
+# Parsing
+# =======================
+
+def iter_log_lines(fp):
+    """Yields the lines of a log without newlines, joining lines TeX wrapped at LOG_WIDTH."""
+    pending = ""
+    for line in fp:
+        line = line.rstrip("\r\n")
+        if len(line) == LOG_WIDTH:
+            pending += line
+            continue
+        yield pending + line
+        pending = ""
+    if pending:
+        yield pending
+
+
+def parse_log(lines, limit: int = MAX_ENTRIES):
+    """Yields up to limit LogEntry objects, errors and warnings in log order."""
+    lines = iter(lines)
+    count = 0
+    seen_error = False
+    line = next(lines, None)
+    while line is not None and count < limit:
+        entry = None
+        following = None
+        match = ERROR.match(line) or FILE_LINE_ERROR.match(line)
+        if match is not None:
+            message = match.group(match.lastindex)
+            tex_line = int(match.group(1)) if match.re is FILE_LINE_ERROR else None
+            context = ""
+            # the `l.N <text>` line follows within a few lines
+            remaining = CONTEXT_LINES
+            while remaining > 0:
+                remaining -= 1
+                following = next(lines, None)
+                if following is None:
+                    break
+                error_match = ERROR.match(following)
+                if error_match is not None:
+                    if error_match.group(1) not in NOISE:
+                        break
+                    # a fatal error's context comes after "! Emergency stop."
+                    remaining = CONTEXT_LINES
+                    following = None
+                    continue
+                context_match = CONTEXT.match(following)
+                if context_match is not None:
+                    tex_line = tex_line or int(context_match.group(1))
+                    context = context_match.group(2)
+                    following = None
+                    break
+            if not (seen_error and message in NOISE):
+                entry = LogEntry("error", message, tex_line, context)
+                seen_error = True
+        else:
+            match = WARNING.match(line)
+            if match is not None:
+                package = match.group(1) or match.group(2)
+                parts = [match.group(3)]
+                following = next(lines, None)
+                if package:
+                    continuation = f"({package})"
+                    while following is not None and following.startswith(continuation):
+                        parts.append(following[len(continuation):].strip())
+                        following = next(lines, None)
+                else:
+                    while following and len(parts) < 5 and not ERROR.match(following):
+                        parts.append(following.strip())
+                        following = next(lines, None)
+                message = " ".join(parts)
+                input_line = INPUT_LINE.search(message)
+                entry = LogEntry("warning", message, int(input_line.group(1)) if input_line else None)
+            else:
+                match = BOX.match(line)
+                if match is not None:
+                    entry = LogEntry("warning", line, int(match.group(1) or match.group(2)))
+        if entry is not None:
+            count += 1
+            yield entry
+        line = following if following is not None else next(lines, None)
+
+
+def read_log(path, limit: int = MAX_ENTRIES) -> list[LogEntry]:
+    try:
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            return list(parse_log(iter_log_lines(f), limit))
+    except FileNotFoundError:
+        return []
+
+
+def format_entries(entries, source_line=None) -> str:
+    """Plain-text report, one entry per line; source_line maps .tex lines to source lines."""
+    lines = []
+    for entry in entries:
+        where = ""
+        if entry.tex_line is not None:
+            line = source_line(entry.tex_line) if source_line is not None else None
+            where = f"line {line}: " if line is not None else f"main.tex:{entry.tex_line}: "
+        lines.append(f"{entry.kind}: {where}{entry.message}")
+        if entry.context:
+            lines.append(f"    {entry.context}")
+    return "\n".join(lines)
+
+
+# =======================
+# Cache
+# =======================
+
+LOG_CACHE_DIR = Cache.ROOT / "logs"
+
+
+class LogCache:
+    """Entries of failed compiles by key (LaTeX hash + engine), in memory and on disk."""
+    MAX_FILES = 512
+    MAX_MEMORY = 64
+
+    def __init__(self, root: Path | None = None):
+        self.root = root or LOG_CACHE_DIR
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()
+
+    def entry_path(self, key: str) -> Path:
+        return self.root / f"{key}.json"
+
+    def lookup(self, key: str) -> list[LogEntry] | None:
+        with self._lock:
+            entries = self._memory.get(key)
+            if entries is not None:
+                self._memory.move_to_end(key)
+                return entries
+        try:
+            with open(self.entry_path(key), "r", encoding="utf-8") as f:
+                entries = [LogEntry.from_dict(d) for d in json.load(f)]
+        except (OSError, ValueError, KeyError):
+            return None
+        self._remember(key, entries)
+        return entries
+
+    def store(self, key: str, entries):
+        self._remember(key, entries)
+        path = self.entry_path(key)
+        tmp_path = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump([entry.to_dict() for entry in entries], f)
+            os.replace(tmp_path, path)
+        except OSError:
+            return
+        self._trim()
+
+    def discard(self, key: str):
+        with self._lock:
+            self._memory.pop(key, None)
+        try:
+            self.entry_path(key).unlink()
+        except FileNotFoundError:
+            pass
+
+    def _remember(self, key, entries):
+        with self._lock:
+            self._memory[key] = entries
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.MAX_MEMORY:
+                self._memory.popitem(last=False)
+
+    def _trim(self):
+        paths = list(self.root.glob("*.json"))
+        if len(paths) <= self.MAX_FILES:
+            return
+        def mtime(path):
+            try:
+                return path.stat().st_mtime
+            except FileNotFoundError:
+                return 0
+        for path in sorted(paths, key=mtime)[:len(paths) - self.MAX_FILES]:
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,40 @@
+"""
+The preview pane's web view.
+
+QtWebEngine is the most expensive import of the GUI, so gui.py imports
+this module only when it creates the preview, after the first paint. That
+works because the entry point sets Qt.AA_ShareOpenGLContexts before the
+QApplication exists.
+"""
+from PyQt5.QtCore import pyqtSignal
+from PyQt5.QtWebEngineWidgets import QWebEngineView, QWebEnginePage, QWebEngineSettings
+
+
+class PreviewPage(QWebEnginePage):
+    """
+    Turns clicks on source:<offset> links into source_link and
+    synctex:<page>:<x>:<y> navigations from the page view into pdf_point.
+    """
+    source_link = pyqtSignal(int)
+    pdf_point = pyqtSignal(int, float, float)
+
+    def acceptNavigationRequest(self, url, nav_type, is_main_frame):
+        if url.scheme() == "source":
+            if url.path().isdigit():
+                self.source_link.emit(int(url.path()))
+            return False
+        if url.scheme() == "synctex":
+            try:
+                page, x, y = url.path().split(":")
+                self.pdf_point.emit(int(page), float(x), float(y))
+            except ValueError:
+                pass
+            return False
+        return super().acceptNavigationRequest(url, nav_type, is_main_frame)
+
+
+def create_view(parent=None) -> QWebEngineView:
+    view = QWebEngineView(parent)
+    view.setPage(PreviewPage(view))
+    view.settings().setAttribute(QWebEngineSettings.PluginsEnabled, True)
+    return view